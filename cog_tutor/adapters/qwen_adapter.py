@@ -1,16 +1,22 @@
+import threading
 from typing import Optional, List
-from cognitive_llm import CognitiveLLM
 
 class QwenAdapter:
     def __init__(self, model_name: str = "Qwen/Qwen3-7B-Instruct"):
         # Store model name for lazy initialization
         self.model_name = model_name
         self.client = None
+        self._client_lock = threading.Lock()
 
     def _initialize_client(self):
-        # Lazy initialization of the CognitiveLLM client
-        if self.client is None:
-            self.client = CognitiveLLM(model_name=self.model_name)
+        # Lazy initialization of the CognitiveLLM client; generations run on
+        # several threads, so the model must only be loaded once
+        if self.client is not None:
+            return
+        with self._client_lock:
+            if self.client is None:
+                from cognitive_llm import CognitiveLLM
+                self.client = CognitiveLLM(model_name=self.model_name)
 
     def generate(
         self,
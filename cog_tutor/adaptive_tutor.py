@@ -1,22 +1,34 @@
 import json
+import time
 import numpy as np
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 from typing import Dict, List, Any, Optional
 from datetime import datetime
-from .knowledge_tracing import KnowledgeTracer, ItemResponse, SkillMastery
-from .rag.knowledge_base import KnowledgeBase
-from .rag.retriever import KnowledgeRetriever
-from .rag.rag_prompts import RAGEnhancedPrompts
+from .knowledge_tracing import KnowledgeTracer, ItemResponse, SkillMastery, difficulty_to_logit
+from .runtime import TutorRuntime, GenerationOverloaded, get_default_runtime
+from .question_bank import author_adaptive_question
+from .grading import answers_equivalent
 from .inference import run_prompt
 
 class AdaptiveTutor:
-    """RAG-enhanced adaptive tutoring system with knowledge tracing."""
+    """RAG-enhanced adaptive tutoring system with knowledge tracing.
     
-    def __init__(self, user_id: str = "default"):
+    A lightweight per-user handle: the knowledge base, retriever and tracing
+    store belong to a shared TutorRuntime (the process default unless one is
+    given), so creating a tutor per request is cheap.
+    """
+    
+    # Skills graded by value, where any equivalent expression is right; the
+    # rest, such as algebra_simplification, need the expected form
+    EXPRESSION_EQUIVALENT_SKILLS = frozenset({"linear_equations", "fraction_operations", "ratios"})
+    
+    def __init__(self, user_id: str = "default", runtime: Optional[TutorRuntime] = None):
         self.user_id = user_id
-        self.knowledge_tracer = KnowledgeTracer()
-        self.knowledge_base = KnowledgeBase()
-        self.retriever = KnowledgeRetriever(self.knowledge_base)
-        self.rag_prompts = RAGEnhancedPrompts()
+        self.runtime = runtime or get_default_runtime()
+        self.knowledge_tracer = self.runtime.tracer(user_id)
+        self.knowledge_base = self.runtime.knowledge_base
+        self.retriever = self.runtime.retriever
+        self.rag_prompts = self.runtime.rag_prompts
         
         # Session tracking
         self.session_start = datetime.now()
@@ -24,14 +36,31 @@ class AdaptiveTutor:
     
     def process_student_response(self, item_id: str, skill: str, question: str,
                                 user_answer: str, correct_answer: str,
-                                response_time: float, hints_used: int = 0) -> Dict[str, Any]:
-        """Process a student response and update knowledge tracing."""
+                                response_time: float, hints_used: int = 0,
+                                concurrent: bool = False,
+                                generation_timeout: Optional[float] = None,
+                                deferred: bool = False) -> Dict[str, Any]:
+        """Process a student response and update knowledge tracing.
+        
+        With concurrent=True the explanation and every recommended question
+        are generated in parallel on the runtime's bounded executor, so the
+        call takes about as long as the slowest model call rather than their
+        sum. A generation still running after generation_timeout seconds is
+        replaced by its fallback and left to finish in the background; while
+        too many such calls are running, new ones fall back immediately.
+        
+        With deferred=True the call returns as soon as the response is graded
+        and traced: "explanation_ticket" and "recommendations_ticket" are
+        GenerationTickets that callers poll, wait on or await. If generation
+        fails they resolve to the fallback explanation and to the ranked
+        items without questions.
+        """
         
         # Determine correctness
-        is_correct = self._evaluate_answer(user_answer, correct_answer)
+        is_correct = self._evaluate_answer(user_answer, correct_answer, skill)
         
         # Create item response
-        difficulty = self._estimate_item_difficulty(skill, question)
+        difficulty = self._estimate_item_difficulty(skill, question, item_id)
         response = ItemResponse(
             item_id=item_id,
             skill=skill,
@@ -46,20 +75,62 @@ class AdaptiveTutor:
         new_theta = self.knowledge_tracer.update_mastery(response)
         mastery_prob = self.knowledge_tracer.get_mastery_probability(skill)
         
-        # Generate RAG-enhanced explanation
-        explanation = self.generate_rag_explanation(question, user_answer, correct_answer)
-        
         # Track session
         self.session_responses.append(response)
         
+        if deferred:
+            # Items are ranked here, against the masteries as of this response;
+            # the worker only attaches questions, sequentially, so it neither
+            # reads state this thread keeps mutating nor waits on its own executor
+            recommendations = self._rank_items(skill)
+            unattached = [dict(rec) for rec in recommendations]
+            return {
+                "correct": is_correct,
+                "mastery_theta": new_theta,
+                "mastery_probability": mastery_prob,
+                "explanation_ticket": self.runtime.submit_generation(
+                    self.generate_rag_explanation, question, user_answer, correct_answer,
+                    fallback=lambda: self._fallback_explanation(correct_answer)
+                ),
+                "recommendations_ticket": self.runtime.submit_generation(
+                    self._attach_questions, recommendations, fallback=lambda: unattached
+                )
+            }
+        
+        if not concurrent:
+            # Generate RAG-enhanced explanation
+            explanation = self.generate_rag_explanation(question, user_answer, correct_answer)
+            next_recommendations = self.get_next_items(skill)
+        else:
+            deadline = time.monotonic() + generation_timeout if generation_timeout is not None else None
+            explanation_future = self.runtime.submit(
+                self.generate_rag_explanation, question, user_answer, correct_answer
+            )
+            # Question generations fan out inside get_next_items while the explanation runs
+            next_recommendations = self.get_next_items(skill, concurrent=True, deadline=deadline)
+            explanation = self._result_or_fallback(
+                explanation_future, deadline, lambda: self._fallback_explanation(correct_answer)
+            )
+        
         return {
             "correct": is_correct,
             "mastery_theta": new_theta,
             "mastery_probability": mastery_prob,
             "explanation": explanation,
-            "next_recommendations": self.get_next_items(skill)
+            "next_recommendations": next_recommendations
         }
     
+    def _result_or_fallback(self, future: Future, deadline: Optional[float], fallback) -> Dict[str, Any]:
+        """A generation's result, or its fallback if the shared deadline passes first."""
+        timeout = None if deadline is None else max(deadline - time.monotonic(), 0.0)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            self.runtime.abandon(future)
+            return fallback()
+        except GenerationOverloaded:
+            return fallback()
+    
     def generate_rag_explanation(self, question: str, user_answer: str, 
                                 correct_answer: str) -> Dict[str, Any]:
         """Generate explanation with knowledge grounding."""
@@ -92,16 +163,20 @@ class AdaptiveTutor:
             
         except Exception as e:
             # Fallback to basic explanation
-            explanation = {
-                "hint": "Review the problem steps carefully.",
-                "guided": "Compare your answer with the correct solution.",
-                "full": f"The correct answer is {correct_answer}. Please review the method.",
-                "knowledge_citations": [],
-                "fact_sources": []
-            }
+            explanation = self._fallback_explanation(correct_answer)
         
         return explanation
     
+    @staticmethod
+    def _fallback_explanation(correct_answer: str) -> Dict[str, Any]:
+        return {
+            "hint": "Review the problem steps carefully.",
+            "guided": "Compare your answer with the correct solution.",
+            "full": f"The correct answer is {correct_answer}. Please review the method.",
+            "knowledge_citations": [],
+            "fact_sources": []
+        }
+    
     def generate_adaptive_hints(self, question: str, hint_level: int = 1) -> List[str]:
         """Generate contextual hints using RAG."""
         return self.retriever.get_contextual_hints(question, hint_level)
@@ -113,42 +188,37 @@ class AdaptiveTutor:
             mastery = self.knowledge_tracer.get_mastery_probability(skill)
             difficulty = 1.0 - mastery  # Inverse relationship
         
-        # Retrieve relevant knowledge for the skill
-        knowledge_items = self.knowledge_base.retrieve_by_skill(skill, limit=3)
-        
-        # Prepare input for question generation
-        prompt_input = {
-            "skill": skill,
-            "mastery_level": 1.0 - difficulty,
-            "knowledge_content": [item["content"] for item in knowledge_items],
-            "difficulty": difficulty
-        }
-        
         try:
-            question = run_prompt(
-                "adaptive_question_generation",
-                prompt_input,
-                model_id="Qwen/Qwen3-7B-Instruct"
-            )
-            
-            # Add knowledge citations
-            question["knowledge_sources"] = [item["id"] for item in knowledge_items]
-            
+            question = author_adaptive_question(self.knowledge_base, skill, difficulty)
         except Exception as e:
             # Fallback question template
-            question = {
-                "question": f"Practice problem for {skill} at difficulty {difficulty:.2f}",
-                "answer": "Answer to be determined",
-                "explanation": "Explanation to be provided",
-                "difficulty": difficulty,
-                "skill": skill,
-                "knowledge_sources": []
-            }
+            question = self._fallback_question(skill, difficulty)
         
         return question
     
-    def get_next_items(self, current_skill: str = None, max_items: int = 5) -> List[Dict[str, Any]]:
-        """Get next item recommendations using entropy-based scheduling."""
+    @staticmethod
+    def _fallback_question(skill: str, difficulty: float) -> Dict[str, Any]:
+        return {
+            "question": f"Practice problem for {skill} at difficulty {difficulty:.2f}",
+            "answer": "Answer to be determined",
+            "explanation": "Explanation to be provided",
+            "difficulty": difficulty,
+            "skill": skill,
+            "knowledge_sources": []
+        }
+    
+    def get_next_items(self, current_skill: str = None, max_items: int = 5, concurrent: bool = False,
+                       deadline: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Get next item recommendations using entropy-based scheduling.
+        
+        With concurrent=True the adaptive questions are generated in parallel;
+        deadline is a time.monotonic() value after which fallbacks are used.
+        """
+        recommendations = self._rank_items(current_skill, max_items)
+        return self._attach_questions(recommendations, concurrent, deadline)
+    
+    def _rank_items(self, current_skill: str = None, max_items: int = 5) -> List[Dict[str, Any]]:
+        """Candidate items ranked by the knowledge tracer, without questions attached."""
         
         # Generate candidate items
         candidates = []
@@ -167,15 +237,38 @@ class AdaptiveTutor:
                 })
         
         # Get recommendations from knowledge tracer
-        recommendations = self.knowledge_tracer.get_next_item_recommendations(
-            candidates, max_items
-        )
+        return self.knowledge_tracer.get_next_item_recommendations(candidates, max_items)
+    
+    def _attach_questions(self, recommendations: List[Dict[str, Any]], concurrent: bool = False,
+                          deadline: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Add adaptive questions to ranked items; reads no mastery state, so it can run on any thread."""
         
-        # Add adaptive questions for top recommendations
+        # Add adaptive questions for top recommendations, from the bank when it has one
+        practice = []
+        bank = self.runtime.question_bank
         for rec in recommendations:
-            if rec["type"] == "practice":
+            if rec["type"] != "practice":
+                continue
+            banked = bank.serve(self.user_id, rec["skill"], rec["difficulty"]) if bank is not None else None
+            if banked is not None:
+                rec.update(banked)
+            else:
+                practice.append(rec)
+        
+        if not concurrent:
+            for rec in practice:
                 adaptive_q = self.generate_adaptive_question(rec["skill"], rec["difficulty"])
                 rec.update(adaptive_q)
+            return recommendations
+        
+        futures = [
+            self.runtime.submit(self.generate_adaptive_question, rec["skill"], rec["difficulty"])
+            for rec in practice
+        ]
+        for rec, future in zip(practice, futures):
+            rec.update(self._result_or_fallback(
+                future, deadline, lambda rec=rec: self._fallback_question(rec["skill"], rec["difficulty"])
+            ))
         
         return recommendations
     
@@ -267,6 +360,8 @@ class AdaptiveTutor:
         else:
             session_learning_gain = 0.0
         
+        masteries = self.knowledge_tracer.mastery_snapshot()
+        
         # Combine all metrics
         research_metrics = {
             "session_metrics": {
@@ -279,27 +374,33 @@ class AdaptiveTutor:
             },
             "cumulative_metrics": tracer_metrics,
             "knowledge_tracing": {
-                "tracked_skills": len(self.knowledge_tracer.skill_masteries),
+                "tracked_skills": len(masteries),
                 "skill_masteries": {
                     skill: {
                         "theta": mastery.theta,
                         "mastery_prob": self.knowledge_tracer.get_mastery_probability(skill),
                         "practice_count": mastery.practice_count
                     }
-                    for skill, mastery in self.knowledge_tracer.skill_masteries.items()
+                    for skill, mastery in masteries.items()
                 }
             }
         }
         
         return research_metrics
     
-    def _evaluate_answer(self, user_answer: str, correct_answer: str) -> bool:
-        """Evaluate if user answer is correct."""
-        # Simple string comparison - can be enhanced with semantic matching
-        return user_answer.strip().lower() == correct_answer.strip().lower()
+    def _evaluate_answer(self, user_answer: str, correct_answer: str, skill: Optional[str] = None) -> bool:
+        """Evaluate if user answer is correct: equal as math (0.5, 1/2, x = 1/2) or as normalized text."""
+        return answers_equivalent(
+            user_answer, correct_answer,
+            expression_equivalence=skill in self.EXPRESSION_EQUIVALENT_SKILLS
+        )
     
-    def _estimate_item_difficulty(self, skill: str, question: str) -> float:
-        """Estimate item difficulty based on skill and question complexity."""
+    def _estimate_item_difficulty(self, skill: str, question: str, item_id: Optional[str] = None) -> float:
+        """Estimate item difficulty as an IRT b (logit scale), preferring the calibrated value."""
+        calibrated = self.knowledge_tracer.item_parameters(item_id) if item_id else None
+        if calibrated is not None:
+            return calibrated[0]
+        
         # Base difficulty on skill type
         skill_difficulties = {
             "algebra_simplification": 0.3,
@@ -313,4 +414,4 @@ class AdaptiveTutor:
         # Adjust based on question length (proxy for complexity)
         length_factor = min(len(question) / 100.0, 0.3)
         
-        return np.clip(base_difficulty + length_factor, 0.1, 0.9)
+        return float(difficulty_to_logit(np.clip(base_difficulty + length_factor, 0.1, 0.9)))
@@ -0,0 +1,324 @@
+"""Offline IRT item calibration: 1PL/2PL marginal maximum likelihood by EM."""
+import argparse
+import json
+import sqlite3
+import time
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Sequence
+
+import numpy as np
+from scipy import sparse
+
+from .knowledge_tracing import TracingStore
+
+CALIBRATION_MODELS = ("1pl", "2pl")
+
+# Weak Gaussian priors keep sparse items from drifting to extreme values
+_DISCRIMINATION_PRIOR_SD = 1.0
+_INTERCEPT_PRIOR_SD = 4.0
+_DISCRIMINATION_RANGE = (0.25, 3.0)
+_DIFFICULTY_RANGE = (-6.0, 6.0)
+
+
+class ResponseMatrix:
+    """Learner x item response counts as two sparse matrices.
+
+    correct[l, i] counts learner l's correct answers to item i and
+    attempts[l, i] all their answers, so repeated attempts are kept as
+    binomial observations instead of being dropped.
+    """
+
+    def __init__(self, correct: sparse.csr_matrix, attempts: sparse.csr_matrix,
+                 item_ids: List[str], item_skills: List[Optional[str]]):
+        self.correct = correct
+        self.attempts = attempts
+        self.item_ids = item_ids
+        self.item_skills = item_skills
+
+    @property
+    def n_learners(self) -> int:
+        return self.attempts.shape[0]
+
+    @property
+    def n_items(self) -> int:
+        return self.attempts.shape[1]
+
+    @property
+    def item_counts(self) -> np.ndarray:
+        return np.asarray(self.attempts.sum(axis=0)).ravel().astype(np.int64)
+
+
+def load_response_matrix(db_paths: Sequence[str], min_item_responses: int = 20,
+                         fetch_size: int = 200_000) -> ResponseMatrix:
+    """Aggregate item_responses into sparse learner x item counts.
+
+    SQLite groups responses per (user, item) and rows stream in fetch_size
+    batches, so memory scales with the number of distinct pairs, not with
+    the raw response log. Items answered fewer than min_item_responses times
+    are dropped.
+    """
+    learners: Dict[str, int] = {}
+    items: Dict[str, int] = {}
+    skills: Dict[str, str] = {}
+    rows: List[np.ndarray] = []
+    cols: List[np.ndarray] = []
+    correct: List[np.ndarray] = []
+    attempts: List[np.ndarray] = []
+
+    for db_path in db_paths:
+        with sqlite3.connect(db_path) as conn:
+            for item_id, skill in conn.execute(
+                "SELECT item_id, MIN(skill) FROM item_responses GROUP BY item_id"
+            ):
+                skills.setdefault(item_id, skill)
+
+            cursor = conn.execute("""
+                SELECT user_id, item_id, SUM(correct), COUNT(*)
+                FROM item_responses
+                GROUP BY user_id, item_id
+            """)
+            while True:
+                batch = cursor.fetchmany(fetch_size)
+                if not batch:
+                    break
+                # Shards partition users, so a learner id is never split across databases
+                rows.append(np.fromiter(
+                    (learners.setdefault(f"{db_path}\x1f{row[0]}", len(learners)) for row in batch),
+                    dtype=np.int32, count=len(batch)
+                ))
+                cols.append(np.fromiter(
+                    (items.setdefault(row[1], len(items)) for row in batch),
+                    dtype=np.int32, count=len(batch)
+                ))
+                correct.append(np.fromiter((row[2] for row in batch), dtype=np.int32, count=len(batch)))
+                attempts.append(np.fromiter((row[3] for row in batch), dtype=np.int32, count=len(batch)))
+
+    shape = (len(learners), len(items))
+    if not rows:
+        empty = sparse.csr_matrix(shape, dtype=np.float64)
+        return ResponseMatrix(empty, empty.copy(), [], [])
+
+    coordinates = (np.concatenate(rows), np.concatenate(cols))
+    del rows, cols
+    correct_matrix = sparse.csr_matrix((np.concatenate(correct), coordinates), shape=shape, dtype=np.float64)
+    attempts_matrix = sparse.csr_matrix((np.concatenate(attempts), coordinates), shape=shape, dtype=np.float64)
+    del correct, attempts, coordinates
+
+    item_ids = list(items)
+    keep = np.flatnonzero(np.asarray(attempts_matrix.sum(axis=0)).ravel() >= min_item_responses)
+    return ResponseMatrix(
+        correct_matrix[:, keep],
+        attempts_matrix[:, keep],
+        [item_ids[i] for i in keep],
+        [skills.get(item_ids[i]) for i in keep]
+    )
+
+
+class ItemCalibration:
+    """Fitted item parameters, aligned with ResponseMatrix.item_ids."""
+
+    def __init__(self, model: str, item_ids: List[str], item_skills: List[Optional[str]],
+                 difficulty: np.ndarray, discrimination: np.ndarray, n_responses: np.ndarray,
+                 iterations: int, log_likelihood: float, converged: bool):
+        self.model = model
+        self.item_ids = item_ids
+        self.item_skills = item_skills
+        self.difficulty = difficulty
+        self.discrimination = discrimination
+        self.n_responses = n_responses
+        self.iterations = iterations
+        self.log_likelihood = log_likelihood
+        self.converged = converged
+
+
+def _expected_counts(matrix: ResponseMatrix, difficulty: np.ndarray, discrimination: np.ndarray,
+                     nodes: np.ndarray, log_prior: np.ndarray, chunk_size: int):
+    """E-step: expected correct and attempt counts per item at each quadrature node.
+
+    Learners are processed chunk_size rows at a time, so the posterior
+    weights held in memory are chunk_size x n_nodes rather than
+    n_learners x n_nodes.
+    """
+    logits = discrimination[:, None] * (nodes[None, :] - difficulty[:, None])
+    log_p = -np.logaddexp(0.0, -logits)     # log P(correct | node), items x nodes
+    log_q = -np.logaddexp(0.0, logits)      # log P(incorrect | node)
+
+    expected_correct = np.zeros_like(logits)
+    expected_attempts = np.zeros_like(logits)
+    log_likelihood = 0.0
+
+    for start in range(0, matrix.n_learners, chunk_size):
+        correct = matrix.correct[start:start + chunk_size]
+        attempts = matrix.attempts[start:start + chunk_size]
+        incorrect = attempts - correct
+
+        joint = correct @ log_p + incorrect @ log_q + log_prior[None, :]
+        marginal = np.logaddexp.reduce(joint, axis=1, keepdims=True)
+        posterior = np.exp(joint - marginal)
+        log_likelihood += float(marginal.sum())
+
+        expected_correct += correct.T @ posterior
+        expected_attempts += attempts.T @ posterior
+
+    return expected_correct, expected_attempts, log_likelihood
+
+
+def _maximize(expected_correct: np.ndarray, expected_attempts: np.ndarray, nodes: np.ndarray,
+              slope: np.ndarray, intercept: np.ndarray, fit_slope: bool, newton_steps: int):
+    """M-step: Newton updates of every item's logit a*theta + c at once."""
+    for _ in range(newton_steps):
+        p = 1.0 / (1.0 + np.exp(-(slope[:, None] * nodes[None, :] + intercept[:, None])))
+        residual = expected_correct - expected_attempts * p
+        weight = expected_attempts * p * (1.0 - p)
+
+        grad_c = residual.sum(axis=1) - intercept / _INTERCEPT_PRIOR_SD ** 2
+        h_cc = -weight.sum(axis=1) - 1.0 / _INTERCEPT_PRIOR_SD ** 2
+        if not fit_slope:
+            intercept = intercept - grad_c / h_cc
+            continue
+
+        grad_a = (residual * nodes).sum(axis=1) - (slope - 1.0) / _DISCRIMINATION_PRIOR_SD ** 2
+        h_aa = -(weight * nodes ** 2).sum(axis=1) - 1.0 / _DISCRIMINATION_PRIOR_SD ** 2
+        h_ac = -(weight * nodes).sum(axis=1)
+
+        # Closed-form 2x2 solve per item; the priors keep the Hessian negative definite
+        det = h_aa * h_cc - h_ac ** 2
+        step_a = np.clip(-(h_cc * grad_a - h_ac * grad_c) / det, -0.5, 0.5)
+        step_c = np.clip(-(h_aa * grad_c - h_ac * grad_a) / det, -1.0, 1.0)
+        slope = np.clip(slope + step_a, *_DISCRIMINATION_RANGE)
+        intercept = intercept + step_c
+
+    return slope, intercept
+
+
+def fit_items(matrix: ResponseMatrix, model: str = "2pl", n_quadrature: int = 21,
+              max_iter: int = 200, tol: float = 1e-3, chunk_size: int = 20_000,
+              newton_steps: int = 3) -> ItemCalibration:
+    """Fit item parameters by marginal maximum likelihood (Bock-Aitkin EM).
+
+    Learner ability is integrated out over a standard-normal prior on a
+    fixed quadrature grid; "1pl" fixes every discrimination at 1.0.
+    Returned difficulties are on the theta (logit) scale.
+    """
+    if model not in CALIBRATION_MODELS:
+        raise ValueError(f"Unknown calibration model: {model}")
+
+    nodes = np.linspace(-4.0, 4.0, n_quadrature)
+    log_prior = -0.5 * nodes ** 2
+    log_prior -= np.logaddexp.reduce(log_prior)
+
+    n_responses = matrix.item_counts
+    total_correct = np.asarray(matrix.correct.sum(axis=0)).ravel()
+    p_value = np.clip(total_correct / np.maximum(n_responses, 1), 0.02, 0.98)
+
+    # Start from classical difficulties: the logit of each item's p-value
+    slope = np.ones(matrix.n_items)
+    intercept = np.log(p_value / (1.0 - p_value))
+    log_likelihood = 0.0
+    converged = False
+
+    iteration = 0
+    for iteration in range(1, max_iter + 1):
+        difficulty = -intercept / slope
+        expected_correct, expected_attempts, log_likelihood = _expected_counts(
+            matrix, difficulty, slope, nodes, log_prior, chunk_size
+        )
+        new_slope, new_intercept = _maximize(
+            expected_correct, expected_attempts, nodes, slope, intercept,
+            fit_slope=(model == "2pl"), newton_steps=newton_steps
+        )
+        change = max(
+            float(np.max(np.abs(new_slope - slope), initial=0.0)),
+            float(np.max(np.abs(new_intercept - intercept), initial=0.0))
+        )
+        slope, intercept = new_slope, new_intercept
+        if change < tol:
+            converged = True
+            break
+
+    return ItemCalibration(
+        model=model,
+        item_ids=matrix.item_ids,
+        item_skills=matrix.item_skills,
+        difficulty=np.clip(-intercept / slope, *_DIFFICULTY_RANGE),
+        discrimination=slope,
+        n_responses=n_responses,
+        iterations=iteration,
+        log_likelihood=log_likelihood,
+        converged=converged
+    )
+
+
+def write_item_parameters(db_paths: Sequence[str], calibration: ItemCalibration):
+    """Upsert fitted parameters into item_parameters of every database.
+
+    Items are shared across user shards, so each shard gets the full table
+    and tracers read parameters from their own database.
+    """
+    calibrated_at = datetime.now().isoformat()
+    rows = list(zip(
+        calibration.item_ids,
+        calibration.item_skills,
+        calibration.difficulty.tolist(),
+        calibration.discrimination.tolist(),
+        calibration.n_responses.tolist(),
+        [calibration.model] * len(calibration.item_ids),
+        [calibrated_at] * len(calibration.item_ids)
+    ))
+    for db_path in db_paths:
+        with sqlite3.connect(db_path) as conn:
+            conn.executemany("""
+                INSERT OR REPLACE INTO item_parameters
+                (item_id, skill, difficulty, discrimination, n_responses, model, calibrated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+
+
+def calibrate_store(store: TracingStore, model: str = "2pl", min_item_responses: int = 20,
+                    chunk_size: int = 20_000, **fit_options) -> Dict[str, Any]:
+    """Calibrate items from every shard of a store and publish the parameters."""
+    started = time.perf_counter()
+    store.flush()
+    matrix = load_response_matrix(store.shard_paths, min_item_responses)
+    loaded = time.perf_counter()
+
+    if matrix.n_items == 0:
+        return {"model": model, "learners": matrix.n_learners, "items": 0}
+
+    calibration = fit_items(matrix, model, chunk_size=chunk_size, **fit_options)
+    write_item_parameters(store.shard_paths, calibration)
+    store.reload_item_parameters()
+
+    return {
+        "model": model,
+        "learners": matrix.n_learners,
+        "items": matrix.n_items,
+        "observations": int(matrix.attempts.nnz),
+        "iterations": calibration.iterations,
+        "converged": calibration.converged,
+        "log_likelihood": round(calibration.log_likelihood, 3),
+        "load_seconds": round(loaded - started, 3),
+        "fit_seconds": round(time.perf_counter() - loaded, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate IRT item parameters from item_responses.")
+    parser.add_argument("--db", default="knowledge_tracing.sqlite")
+    parser.add_argument("--shards", type=int, default=1)
+    parser.add_argument("--model", choices=CALIBRATION_MODELS, default="2pl")
+    parser.add_argument("--min-responses", type=int, default=20)
+    parser.add_argument("--chunk-size", type=int, default=20_000,
+                        help="Learners per E-step block; bounds posterior memory")
+    parser.add_argument("--max-iter", type=int, default=200)
+    args = parser.parse_args()
+
+    store = TracingStore(args.db, num_shards=args.shards)
+    summary = calibrate_store(
+        store, args.model, args.min_responses, chunk_size=args.chunk_size, max_iter=args.max_iter
+    )
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+"""Near-duplicate detection for authored questions: MinHash signatures in an LSH index."""
+import argparse
+import json
+import re
+import sqlite3
+import sys
+import time
+import zlib
+from typing import List, Dict, Any, Optional, Tuple, Hashable, Sequence, Iterator
+
+import numpy as np
+
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+_CHUNK_SHINGLES = 65_536  # bounds the (num_perm x shingles) hash matrix to ~64MB at 128 permutations
+
+
+def question_text(question: Dict[str, Any]) -> str:
+    """The text a question is compared on: its stem, whichever prompt authored it."""
+    return str(question.get("question") or question.get("q") or "")
+
+
+def normalize_text(text: str) -> str:
+    """Lower-cased word characters separated by single spaces, so punctuation and spacing don't count."""
+    return " ".join(re.findall(r"\w+", text.lower()))
+
+
+def number_key(text: str) -> int:
+    """32-bit hash of the multiset of numbers in a text; near-duplicates must agree on it exactly.
+
+    One changed number barely moves the shingle Jaccard of a long word
+    problem, but it makes a different question.
+    """
+    return zlib.crc32(" ".join(sorted(_NUMBER.findall(text))).encode("utf-8"))
+
+
+def lsh_bands(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """(bands, rows) dividing num_perm whose S-curve midpoint (1/b)^(1/r) is closest to threshold."""
+    best = None
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        error = abs((1.0 / bands) ** (1.0 / rows) - threshold)
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+
+def _shingle_hashes(texts: Sequence[str], shingle_size: int) -> Tuple[np.ndarray, np.ndarray]:
+    """32-bit hashes of every word shingle, plus each text's first shingle offset.
+
+    Shingles are runs of shingle_size consecutive words, so changing a
+    number in a stem changes every shingle it takes part in. A text shorter
+    than one shingle, including an empty one, is compared as text: its
+    whole normalized form is its only shingle, so it only matches an equal
+    text rather than every other short text.
+    """
+    token_hashes: List[int] = []
+    lengths: List[int] = []
+    short_hashes: List[int] = []
+    counts = np.empty(len(texts), dtype=np.int64)
+    short = np.zeros(len(texts), dtype=bool)
+    for i, text in enumerate(texts):
+        words = normalize_text(text).split()
+        if len(words) < shingle_size:
+            short[i] = True
+            counts[i] = 1
+            short_hashes.append(zlib.crc32(("\x1f" + " ".join(words)).encode("utf-8")))
+        else:
+            token_hashes.extend(zlib.crc32(word.encode("utf-8")) for word in words)
+            lengths.append(len(words))
+            counts[i] = len(words) - shingle_size + 1
+    offsets = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.int64)
+    hashes = np.empty(int(counts.sum()), dtype=np.uint64)
+    hashes[offsets[short]] = np.array(short_hashes, dtype=np.uint64)
+
+    if lengths:
+        tokens = np.array(token_hashes, dtype=np.uint64)
+        long_counts = counts[~short]
+        # Window starts, skipping windows that straddle two texts
+        text_starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        long_offsets = np.concatenate([[0], np.cumsum(long_counts)[:-1]])
+        within = np.arange(long_counts.sum()) - np.repeat(long_offsets, long_counts)
+        starts = np.repeat(text_starts, long_counts) + within
+
+        windows = np.lib.stride_tricks.sliding_window_view(tokens, shingle_size)[starts]
+        powers = np.uint64(1_000_003) ** np.arange(shingle_size - 1, -1, -1, dtype=np.uint64)
+        hashes[np.repeat(offsets[~short], long_counts) + within] = (windows * powers).sum(axis=1, dtype=np.uint64)
+    return (hashes * _MIX) >> np.uint64(32), offsets
+
+
+class MinHashLSH:
+    """Index of MinHash signatures, banded for sub-linear near-duplicate lookup.
+
+    A signature keeps, for each of num_perm random hash functions, the
+    minimum hash over a text's word shingles; the fraction of equal
+    positions between two signatures estimates the Jaccard similarity of
+    their shingle sets. Its last column is the text's number_key, which is
+    part of every band key, so only texts with the same numbers are ever
+    compared. Signatures are split into bands, and only keys sharing a
+    whole band with the query are compared, so a lookup costs one dict
+    probe per band rather than a scan of the index. With max_keys, the
+    oldest keys are dropped once more are inserted.
+    """
+
+    def __init__(self, threshold: float = 0.7, num_perm: int = 128, shingle_size: int = 2, seed: int = 1,
+                 max_keys: Optional[int] = None):
+        self.threshold = threshold
+        self.max_keys = max_keys
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.bands, self.rows = lsh_bands(num_perm, threshold)
+        rng = np.random.default_rng(seed)
+        # Multiply-shift hashing: (a * x + b) mod 2^64, keeping the high 32 bits
+        self._a = (rng.integers(0, 1 << 63, size=num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1))[:, None]
+        self._b = rng.integers(0, 1 << 63, size=num_perm, dtype=np.uint64)[:, None]
+        self._buckets: List[Dict[bytes, List[Hashable]]] = [{} for _ in range(self.bands)]
+        self._signatures: Dict[Hashable, np.ndarray] = {}
+
+    def signatures(self, texts: Sequence[str]) -> np.ndarray:
+        """(len(texts), num_perm + 1) uint32 signatures, computed in bounded chunks."""
+        result = np.empty((len(texts), self.num_perm + 1), dtype=np.uint32)
+        result[:, -1] = [number_key(text) for text in texts]
+        start = 0
+        while start < len(texts):
+            # Grow the chunk until it holds about _CHUNK_SHINGLES shingles
+            stop, shingles = start, 0
+            while stop < len(texts) and (stop == start or shingles < _CHUNK_SHINGLES):
+                shingles += texts[stop].count(" ") + 1
+                stop += 1
+            hashes, offsets = _shingle_hashes(texts[start:stop], self.shingle_size)
+            permuted = (self._a * hashes + self._b) >> np.uint64(32)
+            result[start:stop, :-1] = np.minimum.reduceat(permuted, offsets, axis=1).T.astype(np.uint32)
+            start = stop
+        return result
+
+    def signature(self, text: str) -> np.ndarray:
+        return self.signatures([text])[0]
+
+    def _band_keys(self, signature: np.ndarray) -> Iterator[Tuple[int, bytes]]:
+        numbers = signature[-1:].tobytes()
+        for band in range(self.bands):
+            yield band, numbers + signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def query(self, signature: np.ndarray) -> Optional[Tuple[Hashable, float]]:
+        """The indexed key most similar to a signature, with its estimated Jaccard, if above threshold."""
+        candidates = {}
+        for band, key in self._band_keys(signature):
+            for candidate in self._buckets[band].get(key, ()):
+                candidates[candidate] = None
+        if not candidates:
+            return None
+
+        keys = list(candidates)
+        stacked = np.stack([self._signatures[key] for key in keys])
+        similarities = (stacked[:, :-1] == signature[:-1]).mean(axis=1)
+        similarities[stacked[:, -1] != signature[-1]] = 0.0
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.threshold:
+            return None
+        return keys[best], float(similarities[best])
+
+    def insert(self, key: Hashable, signature: np.ndarray):
+        if key in self._signatures:
+            raise ValueError(f"Key already indexed: {key!r}")
+        self._signatures[key] = signature
+        for band, band_key in self._band_keys(signature):
+            self._buckets[band].setdefault(band_key, []).append(key)
+        if self.max_keys is not None and len(self._signatures) > self.max_keys:
+            self.remove(next(iter(self._signatures)))
+
+    def remove(self, key: Hashable):
+        signature = self._signatures.pop(key)
+        for band, band_key in self._band_keys(signature):
+            bucket = self._buckets[band][band_key]
+            bucket.remove(key)
+            if not bucket:
+                del self._buckets[band][band_key]
+
+    def add_if_unique(self, key: Hashable, signature: np.ndarray) -> Optional[Hashable]:
+        """Index a signature unless a near-duplicate is already present; returns that duplicate's key."""
+        match = self.query(signature)
+        if match is not None:
+            return match[0]
+        self.insert(key, signature)
+        return None
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._signatures
+
+
+def find_duplicates(texts: Sequence[str], keys: Optional[Sequence[Hashable]] = None,
+                    index: Optional[MinHashLSH] = None) -> List[Tuple[Hashable, Hashable]]:
+    """(duplicate, kept) key pairs for texts in order, keeping the first of each near-duplicate group."""
+    index = index if index is not None else MinHashLSH()
+    keys = list(range(len(texts))) if keys is None else keys
+    duplicates = []
+    for key, signature in zip(keys, index.signatures(texts)):
+        kept = index.add_if_unique(key, signature)
+        if kept is not None:
+            duplicates.append((key, kept))
+    return duplicates
+
+
+def dedupe_question_bank(db_path: str, threshold: float = 0.7, delete: bool = False,
+                         num_perm: int = 128) -> Dict[str, Any]:
+    """Find near-duplicate questions already in a question bank, per skill, oldest kept.
+
+    With delete=True the duplicates are removed; user cursors stay valid
+    because they point at ids. Banks already open on the file keep serving
+    their in-memory pools until their reload() is called; QuestionBank.dedupe
+    does both for a bank in this process.
+    """
+    with sqlite3.connect(db_path) as conn:
+        skills = [row[0] for row in conn.execute("SELECT DISTINCT skill FROM question_bank ORDER BY skill")]
+        started = time.perf_counter()
+        scanned = 0
+        duplicates: List[Tuple[int, int]] = []
+        for skill in skills:
+            rows = conn.execute(
+                "SELECT id, payload FROM question_bank WHERE skill = ? ORDER BY id", (skill,)
+            ).fetchall()
+            scanned += len(rows)
+            duplicates.extend(find_duplicates(
+                [question_text(json.loads(payload)) for _, payload in rows],
+                [question_id for question_id, _ in rows],
+                MinHashLSH(threshold=threshold, num_perm=num_perm)
+            ))
+        seconds = time.perf_counter() - started
+
+        if delete and duplicates:
+            conn.executemany("DELETE FROM question_bank WHERE id = ?", [(dup,) for dup, _ in duplicates])
+
+    return {
+        "db_path": db_path,
+        "questions": scanned,
+        "duplicates": len(duplicates),
+        "deleted": len(duplicates) if delete else 0,
+        "seconds": round(seconds, 3),
+        "questions_per_second": round(scanned / seconds, 1) if seconds > 0 else None,
+        "pairs": duplicates,
+    }
+
+
+def _synthetic_questions(n_questions: int, duplicate_rate: float,
+                         rng: np.random.Generator) -> Tuple[List[str], np.ndarray]:
+    """Templated questions with planted near-duplicates; returns texts and each text's origin index."""
+    verbs = ["Simplify", "Solve", "Evaluate", "Factor", "Expand", "Compute"]
+    objects = ["the expression", "the equation", "for x", "the ratio", "the fraction", "the sum"]
+    texts: List[str] = []
+    origins = np.empty(n_questions, dtype=np.int64)
+    for i in range(n_questions):
+        if texts and rng.random() < duplicate_rate:
+            # A light edit of an earlier question: case, punctuation and one filler word
+            origin = int(origins[rng.integers(len(texts))])
+            words = texts[origin].split()
+            words.insert(int(rng.integers(len(words))), str(rng.choice(["now", "please", "carefully"])))
+            texts.append(" ".join(words).upper() + "?")
+            origins[i] = origin
+        else:
+            numbers = rng.integers(1, 100, size=4)
+            texts.append(f"{rng.choice(verbs)} {rng.choice(objects)}: {numbers[0]}x + {numbers[1]} "
+                         f"= {numbers[2]}x - {numbers[3]} when x is an integer")
+            origins[i] = i
+    return texts, origins
+
+
+def run_benchmark(sizes: List[int], duplicate_rate: float = 0.1, threshold: float = 0.7,
+                  num_perm: int = 128, seed: int = 0) -> Dict[str, Any]:
+    """Throughput and duplicate recall/precision of the filter on synthetic pools."""
+    rng = np.random.default_rng(seed)
+    results = []
+    for n_questions in sizes:
+        texts, origins = _synthetic_questions(n_questions, duplicate_rate, rng)
+        index = MinHashLSH(threshold=threshold, num_perm=num_perm)
+
+        started = time.perf_counter()
+        signatures = index.signatures(texts)
+        signature_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        flagged = np.zeros(n_questions, dtype=bool)
+        for i, signature in enumerate(signatures):
+            flagged[i] = index.add_if_unique(i, signature) is not None
+        index_seconds = time.perf_counter() - started
+
+        planted = origins != np.arange(n_questions)
+        true_positives = int((flagged & planted).sum())
+        row = {
+            "n_questions": n_questions,
+            "planted_duplicates": int(planted.sum()),
+            "flagged": int(flagged.sum()),
+            "recall": round(true_positives / max(int(planted.sum()), 1), 4),
+            "precision": round(true_positives / max(int(flagged.sum()), 1), 4),
+            "signatures_per_second": round(n_questions / signature_seconds, 1),
+            "inserts_per_second": round(n_questions / index_seconds, 1),
+            "questions_per_second": round(n_questions / (signature_seconds + index_seconds), 1),
+            "bands": index.bands,
+            "rows": index.rows,
+        }
+        results.append(row)
+        print(json.dumps(row), file=sys.stderr)
+    return {"threshold": threshold, "num_perm": num_perm, "seed": seed, "results": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Near-duplicate detection for question banks.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    dedupe = commands.add_parser("dedupe", help="Find (and optionally delete) duplicates in a question bank")
+    dedupe.add_argument("--db", default="question_bank.sqlite")
+    dedupe.add_argument("--threshold", type=float, default=0.7)
+    dedupe.add_argument("--delete", action="store_true")
+
+    benchmark = commands.add_parser("benchmark", help="Measure filter throughput on synthetic pools")
+    benchmark.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    benchmark.add_argument("--duplicate-rate", type=float, default=0.1)
+    benchmark.add_argument("--threshold", type=float, default=0.7)
+    benchmark.add_argument("--seed", type=int, default=0)
+    benchmark.add_argument("--out", default=None)
+    args = parser.parse_args()
+
+    if args.command == "dedupe":
+        report = dedupe_question_bank(args.db, threshold=args.threshold, delete=args.delete)
+        report.pop("pairs")
+    else:
+        report = run_benchmark(args.sizes, args.duplicate_rate, args.threshold, seed=args.seed)
+
+    if getattr(args, "out", None):
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.out}")
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
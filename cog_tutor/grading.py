@@ -0,0 +1,296 @@
+"""Local answer-equivalence grading: math answers compared by canonical form, never by a model."""
+import ast
+import math
+import re
+from fractions import Fraction
+from functools import lru_cache
+from typing import Dict, Tuple, Optional, NamedTuple, Hashable, List
+
+MAX_DEGREE = 12
+MAX_TERMS = 64
+MAX_LENGTH = 200
+MAX_BITS = 256
+CANONICAL_CACHE_SIZE = 65_536
+
+Monomial = Tuple[Tuple[str, int], ...]
+Polynomial = Dict[Monomial, Fraction]
+
+_SYMBOLS = str.maketrans({"−": "-", "–": "-", "×": "*", "·": "*", "÷": "/", "^": "**"})
+_THOUSANDS = re.compile(r"(?<=\d),(?=\d{3}(?!\d))")
+_LIST_WORDS = re.compile(r"\s+(?:or|and)\s+")
+_DECIMAL = re.compile(r"-?\d*\.(\d+)")
+
+
+class Canonical(NamedTuple):
+    """An answer's canonical form.
+
+    kind is "num", "poly", "eq", "ratio", "seq", "set" or "text". decimals is
+    the number of places of an answer written as a plain decimal, so 0.33
+    can be accepted for 1/3. form is a "poly" answer's expression as
+    written, so 2(x + 1) and 2x + 2 share a value but not a form.
+    """
+    kind: str
+    value: Hashable
+    decimals: Optional[int] = None
+    form: Optional[str] = None
+
+
+class _Unsupported(ValueError):
+    """The text is not an expression this grader handles; it falls back to text comparison."""
+
+
+def normalize_answer(text: str) -> str:
+    """Lower-cased, single-spaced, with math symbols in ASCII and trailing full stops removed."""
+    text = " ".join(str(text).translate(_SYMBOLS).lower().split())
+    return text.rstrip(".").strip()
+
+
+def _constant(value: Fraction) -> Polynomial:
+    return {(): value} if value else {}
+
+
+def _bounded(poly: Polynomial) -> Polynomial:
+    """poly, unless a coefficient has grown past MAX_BITS; keeps nested powers like (9**12)**12 cheap to reject."""
+    for coefficient in poly.values():
+        if coefficient.numerator.bit_length() > MAX_BITS or coefficient.denominator.bit_length() > MAX_BITS:
+            raise _Unsupported("constant too large")
+    return poly
+
+
+def _add(a: Polynomial, b: Polynomial, sign: int = 1) -> Polynomial:
+    result = dict(a)
+    for monomial, coefficient in b.items():
+        total = result.get(monomial, 0) + sign * coefficient
+        if total:
+            result[monomial] = total
+        else:
+            result.pop(monomial, None)
+    return result
+
+
+def _multiply(a: Polynomial, b: Polynomial) -> Polynomial:
+    result: Polynomial = {}
+    for m1, c1 in a.items():
+        for m2, c2 in b.items():
+            powers = dict(m1)
+            for var, power in m2:
+                powers[var] = powers.get(var, 0) + power
+            if sum(powers.values()) > MAX_DEGREE:
+                raise _Unsupported("degree too high")
+            monomial = tuple(sorted(powers.items()))
+            total = result.get(monomial, 0) + c1 * c2
+            if total:
+                result[monomial] = total
+            else:
+                result.pop(monomial, None)
+    if len(result) > MAX_TERMS:
+        raise _Unsupported("too many terms")
+    return result
+
+
+def _as_constant(poly: Polynomial) -> Fraction:
+    if any(poly.keys() - {()}):
+        raise _Unsupported("not a constant")
+    return poly.get((), Fraction(0))
+
+
+def _polynomial(node: ast.AST) -> Polynomial:
+    """Evaluate a parsed expression to an exact polynomial, allowing only arithmetic on numbers and letters."""
+    if isinstance(node, ast.Expression):
+        return _polynomial(node.body)
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+        # repr keeps the literal's decimal digits, so 0.1 is exactly 1/10
+        return _bounded(_constant(Fraction(repr(node.value))))
+    if isinstance(node, ast.Name) and len(node.id) == 1:
+        return {((node.id, 1),): Fraction(1)}
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        operand = _polynomial(node.operand)
+        return {m: -c for m, c in operand.items()} if isinstance(node.op, ast.USub) else operand
+    if isinstance(node, ast.BinOp):
+        left, right = _polynomial(node.left), _polynomial(node.right)
+        if isinstance(node.op, ast.Add):
+            return _bounded(_add(left, right))
+        if isinstance(node.op, ast.Sub):
+            return _bounded(_add(left, right, -1))
+        if isinstance(node.op, ast.Mult):
+            return _bounded(_multiply(left, right))
+        if isinstance(node.op, ast.Div):
+            divisor = _as_constant(right)
+            if divisor == 0:
+                raise _Unsupported("division by zero")
+            return _bounded({m: c / divisor for m, c in left.items()})
+        if isinstance(node.op, ast.Pow):
+            exponent = _as_constant(right)
+            if exponent.denominator != 1 or not 0 <= exponent <= MAX_DEGREE:
+                raise _Unsupported("unsupported exponent")
+            result = _constant(Fraction(1))
+            for _ in range(int(exponent)):
+                result = _bounded(_multiply(result, left))
+            return result
+    raise _Unsupported(type(node).__name__)
+
+
+def _parse_tree(expression: str) -> ast.Expression:
+    if re.search(r"[a-z]{2,}", expression):
+        raise _Unsupported("words")
+    # Implicit multiplication: 2x, 3(x + 1), x(x - 1), (x + 1)(x - 1), (x)2
+    expression = re.sub(r"(?<=[\d)a-z.])\s*(?=\()", "*", expression)
+    expression = re.sub(r"(?<=[\d)])\s*(?=[a-z])", "*", expression)
+    expression = re.sub(r"(?<=[)a-z])\s*(?=[\d(a-z])", "*", expression)
+    try:
+        tree = ast.parse(expression.strip(), mode="eval")
+    except (SyntaxError, ValueError):
+        raise _Unsupported("syntax")
+    return tree
+
+
+def _parse(expression: str) -> Polynomial:
+    return _polynomial(_parse_tree(expression))
+
+
+def _freeze(poly: Polynomial) -> Canonical:
+    if not any(poly.keys() - {()}):
+        return Canonical("num", poly.get((), Fraction(0)))
+    return Canonical("poly", tuple(sorted(poly.items())))
+
+
+def _is_variable(poly: Polynomial) -> bool:
+    if len(poly) != 1:
+        return False
+    ((monomial, coefficient),) = poly.items()
+    return coefficient == 1 and len(monomial) == 1 and monomial[0][1] == 1
+
+
+def _equation(left: str, right: str) -> Canonical:
+    """An equation as lhs - rhs = 0 scaled so its leading coefficient is 1.
+
+    Only a solved equation, a bare variable on one side and a number on the
+    other, becomes its value: x = 1/2 matches 1/2, but 2x = 1 and
+    2x + 3 = 7 stay equations, so restating the question is not an answer.
+    """
+    left_poly, right_poly = _parse(left), _parse(right)
+    for variable, value in ((left_poly, right_poly), (right_poly, left_poly)):
+        if _is_variable(variable) and not any(value.keys() - {()}):
+            return Canonical("num", value.get((), Fraction(0)))
+    difference = _add(left_poly, right_poly, -1)
+    if not any(difference.keys() - {()}):
+        raise _Unsupported("no unknowns")
+    leading = difference[max(difference)]
+    return Canonical("eq", tuple(sorted((m, c / leading) for m, c in difference.items())))
+
+
+def _ratio(parts: List[str]) -> Canonical:
+    values = [_as_constant(_parse(part)) for part in parts]
+    if not any(values):
+        raise _Unsupported("zero ratio")
+    # Scale to coprime integers: 2:4, 0.5:1 and 1/2:1 are all 1:2
+    scale = 1
+    for value in values:
+        scale = scale * value.denominator // math.gcd(scale, value.denominator)
+    integers = [int(value * scale) for value in values]
+    divisor = 0
+    for n in integers:
+        divisor = math.gcd(divisor, abs(n))
+    return Canonical("ratio", tuple(n // divisor for n in integers))
+
+
+def _split_top_level(text: str, separators: str) -> List[str]:
+    """Split on separator characters that are not inside brackets."""
+    parts, depth, start = [], 0, 0
+    for i, char in enumerate(text):
+        if char in "([":
+            depth += 1
+        elif char in ")]":
+            depth -= 1
+        elif depth == 0 and char in separators:
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return [part.strip() for part in parts]
+
+
+def _single(text: str) -> Canonical:
+    if text.endswith("%"):
+        return Canonical("num", _as_constant(_parse(text[:-1])) / 100)
+    if ":" in text:
+        return _ratio(text.split(":"))
+    if "=" in text:
+        sides = text.split("=")
+        if len(sides) != 2:
+            raise _Unsupported("chained equation")
+        return _equation(*sides)
+
+    tree = _parse_tree(text)
+    canonical = _freeze(_polynomial(tree))
+    if canonical.kind == "poly":
+        return canonical._replace(form=ast.dump(tree))
+    decimal = _DECIMAL.fullmatch(text)
+    if decimal is not None:
+        return canonical._replace(decimals=len(decimal.group(1)))
+    return canonical
+
+
+def _strip_decimals(canonical: Canonical) -> Canonical:
+    return canonical._replace(decimals=None)
+
+
+@lru_cache(maxsize=CANONICAL_CACHE_SIZE)
+def canonical_answer(answer: str) -> Canonical:
+    """Canonical form of an answer; memoized, since the same expected answers recur constantly.
+
+    Numbers, fractions, decimals and percentages become exact Fractions;
+    simple polynomial expressions become sorted term tuples, keeping their
+    written form; x = 1/2 becomes 1/2; ratios reduce to coprime integers; (a, b) is an
+    ordered pair and "a, b" or "a or b" an unordered set. Anything else is
+    compared as normalized text.
+    """
+    text = normalize_answer(answer)
+    if not text or len(text) > MAX_LENGTH:
+        return Canonical("text", text)
+    try:
+        text = _THOUSANDS.sub("", text)
+        if text[0] in "([" and text[-1] in ")]" and len(_split_top_level(text[1:-1], ",;")) > 1:
+            items = _split_top_level(text[1:-1], ",;")
+            return Canonical("seq", tuple(_strip_decimals(_single(item)) for item in items))
+        items = _split_top_level(_LIST_WORDS.sub(",", text), ",;")
+        if len(items) > 1:
+            return Canonical("set", tuple(sorted(
+                {_strip_decimals(_single(item)) for item in items}, key=repr
+            )))
+        return _single(text)
+    except (ValueError, ZeroDivisionError, OverflowError, RecursionError):
+        return Canonical("text", normalize_answer(answer))
+
+
+def _comparison_key(canonical: Canonical, expression_equivalence: bool) -> Hashable:
+    if canonical.kind == "poly" and not expression_equivalence:
+        return canonical.form
+    if canonical.kind == "seq":
+        return tuple(_comparison_key(item, expression_equivalence) for item in canonical.value)
+    if canonical.kind == "set":
+        return frozenset(_comparison_key(item, expression_equivalence) for item in canonical.value)
+    return canonical.value
+
+
+def answers_equivalent(user_answer: str, correct_answer: str, expression_equivalence: bool = False) -> bool:
+    """Whether two answers agree by canonical form.
+
+    Expressions must be written the same way, up to spacing and implicit
+    multiplication, unless expression_equivalence is set: then 2(x + 1)
+    matches 2x + 2 and (x + 1)(x - 1) matches x^2 - 1. Leave it off for
+    skills such as simplifying or factoring, where the form is the answer.
+    A plain decimal of two or more places also matches a value that rounds
+    to it, e.g. 0.33 or 0.333 for 1/3.
+    """
+    user, expected = canonical_answer(user_answer), canonical_answer(correct_answer)
+    if user.kind != expected.kind:
+        return False
+    if _comparison_key(user, expression_equivalence) == _comparison_key(expected, expression_equivalence):
+        return True
+    if user.kind != "num":
+        return False
+    for written, exact in ((user, expected), (expected, user)):
+        if written.decimals is not None and written.decimals >= 2 and exact.decimals is None:
+            if round(exact.value, written.decimals) == written.value:
+                return True
+    return False
@@ -1,4 +1,5 @@
 import json
+import threading
 from typing import Dict, Any
 from . import prompts
 from .schemas import (
@@ -70,13 +71,16 @@ OUTPUT_MODELS = {
 }
 
 _adapter = None
+_adapter_lock = threading.Lock()
 SPECIAL_CACHE_KEYS = {'item_explanation', 'hint_generation'}
 
 
 def _get_adapter(model_id: str) -> QwenAdapter:
     global _adapter
     if _adapter is None:
-        _adapter = QwenAdapter(model_name=model_id)
+        with _adapter_lock:
+            if _adapter is None:
+                _adapter = QwenAdapter(model_name=model_id)
     return _adapter
 
 def _cache_key(prompt_name: str, input_data: Dict[str, Any], model_id: str, temperature: float) -> str:
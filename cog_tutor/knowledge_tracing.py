@@ -1,10 +1,22 @@
 import numpy as np
 import json
-from typing import Dict, List, Any, Tuple
-from dataclasses import dataclass
+import hashlib
+import threading
+import weakref
+import atexit
+import logging
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from pathlib import Path
+from typing import Dict, List, Any, Tuple, Optional
+from dataclasses import dataclass, replace
 from datetime import datetime, timedelta
 import sqlite3
 
+from .research_metrics import ResearchMetrics
+
+logger = logging.getLogger(__name__)
+
 @dataclass
 class SkillMastery:
     skill: str
@@ -21,291 +33,1069 @@ class ItemResponse:
     correct: bool
     response_time: float
     hints_used: int
-    difficulty: float
+    difficulty: float  # IRT b, on the theta (logit) scale
     timestamp: datetime
 
-class KnowledgeTracer:
-    """Knowledge tracing system using Item Response Theory and Bayesian updating."""
+FORGETTING_RATE = 0.05  # 5% decay per day
+SUCCESS_RATE_ALPHA = 0.1  # Learning rate for EMA
+DIFFICULTY_EPSILON = 0.01  # 0-1 difficulties are kept this far from 0 and 1 before the logit
+
+def difficulty_to_logit(difficulty):
+    """A 0-1 question difficulty as an IRT b on the theta (logit) scale.
+    
+    Questions, candidates and the question bank describe difficulty on 0-1;
+    responses, engines and calibrated item parameters use the logit scale.
+    This and logit_to_difficulty are the only conversions between them.
+    """
+    p = np.clip(difficulty, DIFFICULTY_EPSILON, 1.0 - DIFFICULTY_EPSILON)
+    return np.log(p / (1.0 - p))
+
+def logit_to_difficulty(logit):
+    """An IRT b as a 0-1 question difficulty; the inverse of difficulty_to_logit."""
+    return 1.0 / (1.0 + np.exp(-np.asarray(logit, dtype=float)))
+
+def decay_theta(theta, days_since_practice, rate=FORGETTING_RATE, baseline=0.0):
+    """Forgetting since last practice: theta relaxes toward baseline exponentially.
+    
+    Stored thetas are the values as of last_practiced; this gives the value
+    now, so readers apply it instead of rewriting rows.
+    """
+    return baseline + (theta - baseline) * np.exp(-rate * days_since_practice)
+
+def irt_update(theta, sem, correct, difficulty, days_since_practice, discrimination=1.0,
+               forgetting_rate=FORGETTING_RATE):
+    """One Bayesian IRT step; works elementwise on scalars or NumPy arrays.
+    
+    Returns (theta, sem). This is the single definition of the update rule,
+    shared by live updates and batch replay.
+    """
+    # The prior is the ability as of this response, after forgetting
+    theta = decay_theta(theta, days_since_practice, forgetting_rate)
+    
+    # IRT 2-parameter model update
+    # P(correct) = 1 / (1 + exp(-a*(theta - b)))
+    # where a = discrimination (1.0 unless calibrated), b = difficulty
+    
+    # Calculate likelihood of response given current theta
+    logit = discrimination * (theta - difficulty)
+    p_correct = 1.0 / (1.0 + np.exp(-logit))
+    
+    # Bayesian update using response as evidence
+    # Posterior precision = prior precision + information
+    prior_precision = 1.0 / (sem ** 2)
+    
+    # Information function for 2PL IRT
+    information = discrimination ** 2 * p_correct * (1 - p_correct)
+    
+    posterior_precision = prior_precision + information
+    posterior_sem = np.sqrt(1.0 / posterior_precision)
+    
+    # One Newton step on the log posterior: the residual (correct - p) moves
+    # theta, so a correct answer never lowers it and an expected one barely
+    # moves it, whatever side of zero the difficulty is on
+    residual = np.asarray(correct, dtype=float) - p_correct
+    theta_update = theta + discrimination * residual / posterior_precision
+    
+    return np.clip(theta_update, -3.0, 3.0), posterior_sem
+
+def ema_success_rate(current_rate, count, correct):
+    """Exponential moving average of success rate; elementwise like irt_update."""
+    observed = np.asarray(correct, dtype=float)
+    return np.where(count == 0, observed, SUCCESS_RATE_ALPHA * observed + (1 - SUCCESS_RATE_ALPHA) * current_rate)
+
+class TracingEngine(ABC):
+    """Update and prediction rules behind KnowledgeTracer and batch replay.
+    
+    Every engine keeps its per-skill state in SkillMastery's theta (and
+    optionally sem), with theta on a logit scale so mastery probability is
+    sigmoid(theta) for all of them. Methods work elementwise on scalars or
+    NumPy arrays.
+    """
+    
+    name = "base"
+    initial_theta = 0.0
+    forgetting_rate = 0.0
+    
+    @abstractmethod
+    def update(self, theta, sem, count, correct, difficulty, days_since_practice, discrimination=1.0):
+        """Return (theta, sem) after one response."""
+    
+    def predict(self, theta, difficulty, discrimination=1.0):
+        """P(correct) on an item before the response is seen."""
+        return 1.0 / (1.0 + np.exp(-discrimination * (theta - difficulty)))
+    
+    def information(self, theta, difficulty, discrimination=1.0):
+        """Expected information from practising an item (Fisher information for 2PL)."""
+        p_correct = self.predict(theta, difficulty, discrimination)
+        return discrimination ** 2 * p_correct * (1 - p_correct)
     
-    def __init__(self, db_path: str = "knowledge_tracing.sqlite"):
+    def decay(self, theta, days_since_practice):
+        """Theta as of days_since_practice after it was stored."""
+        if not self.forgetting_rate:
+            return theta
+        return decay_theta(theta, days_since_practice, self.forgetting_rate, self.initial_theta)
+    
+    def mastery_probability(self, theta):
+        # Logistic transformation: theta=0 -> 0.5, theta=+2 -> 0.88, theta=-2 -> 0.12
+        return 1.0 / (1.0 + np.exp(-theta))
+
+class IRTEngine(TracingEngine):
+    """The Bayesian IRT update of irt_update."""
+    
+    name = "irt"
+    forgetting_rate = FORGETTING_RATE
+    
+    def update(self, theta, sem, count, correct, difficulty, days_since_practice, discrimination=1.0):
+        return irt_update(
+            theta, sem, correct, difficulty, days_since_practice, discrimination, self.forgetting_rate
+        )
+
+class BKTEngine(TracingEngine):
+    """Bayesian Knowledge Tracing; theta holds logit P(skill known).
+    
+    Items only enter through the guess and slip rates, so difficulty and
+    discrimination are ignored.
+    """
+    
+    name = "bkt"
+    
+    def __init__(self, p_init: float = 0.2, p_learn: float = 0.15,
+                 p_guess: float = 0.2, p_slip: float = 0.1):
+        self.p_init = p_init
+        self.p_learn = p_learn
+        self.p_guess = p_guess
+        self.p_slip = p_slip
+        self.initial_theta = float(np.log(p_init / (1.0 - p_init)))
+    
+    def update(self, theta, sem, count, correct, difficulty, days_since_practice, discrimination=1.0):
+        known = self.mastery_probability(theta)
+        # Posterior P(known | response), then the chance of learning from the attempt
+        if_correct = known * (1 - self.p_slip) / (known * (1 - self.p_slip) + (1 - known) * self.p_guess)
+        if_incorrect = known * self.p_slip / (known * self.p_slip + (1 - known) * (1 - self.p_guess))
+        posterior = np.where(correct, if_correct, if_incorrect)
+        known = np.clip(posterior + (1 - posterior) * self.p_learn, 1e-4, 1 - 1e-4)
+        return np.log(known / (1 - known)), sem
+    
+    def predict(self, theta, difficulty, discrimination=1.0):
+        known = self.mastery_probability(theta)
+        return known * (1 - self.p_slip) + (1 - known) * self.p_guess
+    
+    def information(self, theta, difficulty, discrimination=1.0):
+        p_correct = self.predict(theta, difficulty, discrimination)
+        return p_correct * (1 - p_correct)
+
+class LogisticEngine(TracingEngine):
+    """Online logistic regression on theta (an Elo-style update).
+    
+    Each response moves theta by the prediction error, with a step that
+    shrinks as practice accumulates.
+    """
+    
+    name = "logistic"
+    
+    def __init__(self, learning_rate: float = 0.8, step_decay: float = 0.05):
+        self.learning_rate = learning_rate
+        self.step_decay = step_decay
+    
+    def update(self, theta, sem, count, correct, difficulty, days_since_practice, discrimination=1.0):
+        error = np.asarray(correct, dtype=float) - self.predict(theta, difficulty, discrimination)
+        step = self.learning_rate / (1.0 + self.step_decay * count)
+        return np.clip(theta + step * discrimination * error, -3.0, 3.0), sem
+
+TRACING_ENGINES = {engine.name: engine for engine in (IRTEngine, BKTEngine, LogisticEngine)}
+
+def get_engine(engine=None) -> TracingEngine:
+    """An engine instance from an instance, a registered name, or None for IRT."""
+    if engine is None:
+        return IRTEngine()
+    if isinstance(engine, TracingEngine):
+        return engine
+    if engine not in TRACING_ENGINES:
+        raise ValueError(f"Unknown tracing engine: {engine}")
+    return TRACING_ENGINES[engine]()
+
+def _legacy_difficulty_to_logit(difficulty: Optional[float]) -> Optional[float]:
+    return None if difficulty is None else float(difficulty_to_logit(difficulty))
+
+def _init_tracing_database(db_path: str):
+    """Create tracing tables, adding user scoping columns to older databases."""
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS user_skill_mastery (
+                user_id TEXT NOT NULL,
+                skill TEXT NOT NULL,
+                theta REAL DEFAULT 0.0,
+                sem REAL DEFAULT 1.0,
+                last_practiced TIMESTAMP,
+                practice_count INTEGER DEFAULT 0,
+                success_rate REAL DEFAULT 0.0,
+                PRIMARY KEY (user_id, skill)
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS item_responses (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                item_id TEXT,
+                skill TEXT,
+                correct BOOLEAN,
+                response_time REAL,
+                hints_used INTEGER,
+                difficulty REAL,
+                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                user_id TEXT DEFAULT 'default',
+                discrimination REAL DEFAULT 1.0
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS item_parameters (
+                item_id TEXT PRIMARY KEY,
+                skill TEXT,
+                difficulty REAL NOT NULL,
+                discrimination REAL NOT NULL DEFAULT 1.0,
+                n_responses INTEGER,
+                model TEXT,
+                calibrated_at TIMESTAMP
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS review_queue (
+                user_id TEXT NOT NULL,
+                skill TEXT NOT NULL,
+                due_at TIMESTAMP NOT NULL,
+                interval_days REAL,
+                PRIMARY KEY (user_id, skill)
+            )
+        """)
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_review_due ON review_queue(due_at, user_id)
+        """)
+        
+        # Older databases predate user scoping
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(item_responses)")}
+        if "user_id" not in columns:
+            conn.execute("ALTER TABLE item_responses ADD COLUMN user_id TEXT DEFAULT 'default'")
+        if "discrimination" not in columns:
+            # Difficulties written before the column existed are on the 0-1 question
+            # scale; convert them to logits in the same transaction that adds it, so
+            # the migration can never run twice over the same rows
+            conn.create_function("difficulty_to_logit", 1, _legacy_difficulty_to_logit, deterministic=True)
+            conn.execute("UPDATE item_responses SET difficulty = difficulty_to_logit(difficulty)")
+            conn.execute("ALTER TABLE item_responses ADD COLUMN discrimination REAL DEFAULT 1.0")
+        
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_skill_responses ON item_responses(skill)
+        """)
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_user_skill_responses ON item_responses(user_id, skill)
+        """)
+
+def _migrate_legacy_masteries(source_path: str, target_path: str):
+    """Copy a pre-user-scoped skill_mastery table, if source_path has one, to user "default" in target_path."""
+    if not Path(source_path).exists():
+        return
+    with sqlite3.connect(source_path) as source:
+        if source.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'skill_mastery'"
+        ).fetchone() is None:
+            return
+        rows = source.execute("""
+            SELECT 'default', skill, theta, sem, last_practiced, practice_count, success_rate
+            FROM skill_mastery
+        """).fetchall()
+    if not rows:
+        return
+    with sqlite3.connect(target_path) as target:
+        target.executemany("""
+            INSERT OR IGNORE INTO user_skill_mastery
+            (user_id, skill, theta, sem, last_practiced, practice_count, success_rate)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+
+def _row_to_mastery(row: sqlite3.Row) -> SkillMastery:
+    return SkillMastery(
+        skill=row['skill'],
+        theta=row['theta'],
+        sem=row['sem'],
+        last_practiced=datetime.fromisoformat(row['last_practiced']),
+        practice_count=row['practice_count'],
+        success_rate=row['success_rate']
+    )
+
+class _RunningTotals:
+    """Incrementally maintained response aggregates for one skill (or all skills)."""
+    
+    __slots__ = ("count", "correct", "response_time", "hints", "first", "recent")
+    
+    def __init__(self, window: int):
+        self.count = 0
+        self.correct = 0
+        self.response_time = 0.0
+        self.hints = 0
+        self.first: List[bool] = []          # first `window` outcomes, kept forever
+        self.recent: deque = deque(maxlen=window)  # latest `window` outcomes
+    
+    def add(self, correct: bool, response_time: float, hints_used: int):
+        self.count += 1
+        self.correct += bool(correct)
+        self.response_time += response_time
+        self.hints += hints_used
+        if len(self.first) < self.recent.maxlen:
+            self.first.append(bool(correct))
+        self.recent.append(bool(correct))
+
+class ResponseHistory:
+    """Bounded ring buffer of responses stored as typed NumPy columns.
+    
+    Columns start at INITIAL_SLOTS and double as responses arrive, so a short
+    session holds a few KB rather than the full capacity. Memory stays flat
+    however long a session runs: once capacity is reached, the oldest
+    response is overwritten. Aggregates cover every response ever appended.
+    """
+    
+    LEARNING_GAIN_WINDOW = 10
+    INITIAL_SLOTS = 64
+    COLUMNS = ("skill_codes", "correct", "response_time", "hints_used", "difficulty", "timestamp", "item_ids")
+    
+    def __init__(self, capacity: int = 10000):
+        self.capacity = capacity
+        slots = min(capacity, self.INITIAL_SLOTS)
+        self.skill_codes = np.zeros(slots, dtype=np.int32)
+        self.correct = np.zeros(slots, dtype=bool)
+        self.response_time = np.zeros(slots, dtype=np.float32)
+        self.hints_used = np.zeros(slots, dtype=np.int32)
+        self.difficulty = np.zeros(slots, dtype=np.float32)
+        self.timestamp = np.zeros(slots, dtype=np.float64)  # seconds since epoch
+        self.item_ids = np.empty(slots, dtype=object)
+        
+        self._skills: List[str] = []
+        self._codes: Dict[str, int] = {}
+        self._next = 0
+        self._size = 0
+        self.totals = _RunningTotals(self.LEARNING_GAIN_WINDOW)
+        self.by_skill: Dict[str, _RunningTotals] = {}
+    
+    def append(self, response: ItemResponse):
+        code = self._codes.get(response.skill)
+        if code is None:
+            code = self._codes[response.skill] = len(self._skills)
+            self._skills.append(response.skill)
+        
+        i = self._next
+        if i == len(self.correct):
+            self._grow()
+        self.skill_codes[i] = code
+        self.correct[i] = response.correct
+        self.response_time[i] = response.response_time
+        self.hints_used[i] = response.hints_used
+        self.difficulty[i] = response.difficulty
+        self.timestamp[i] = response.timestamp.timestamp()
+        self.item_ids[i] = response.item_id
+        self._next = (i + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+        
+        self.totals.add(response.correct, response.response_time, response.hints_used)
+        skill_totals = self.by_skill.get(response.skill)
+        if skill_totals is None:
+            skill_totals = self.by_skill[response.skill] = _RunningTotals(self.LEARNING_GAIN_WINDOW)
+        skill_totals.add(response.correct, response.response_time, response.hints_used)
+    
+    def _grow(self):
+        """Double the columns, up to capacity; only called before the buffer first wraps."""
+        slots = min(2 * len(self.correct), self.capacity)
+        for name in self.COLUMNS:
+            column = getattr(self, name)
+            grown = np.zeros(slots, dtype=column.dtype) if column.dtype != object else np.empty(slots, dtype=object)
+            grown[:len(column)] = column
+            setattr(self, name, grown)
+    
+    def __len__(self) -> int:
+        return self._size
+    
+    def _order(self) -> np.ndarray:
+        """Buffer slots from oldest to newest."""
+        if self._size < self.capacity:
+            return np.arange(self._size)
+        return (np.arange(self.capacity) + self._next) % self.capacity
+    
+    def __iter__(self):
+        for i in self._order():
+            yield ItemResponse(
+                item_id=self.item_ids[i],
+                skill=self._skills[self.skill_codes[i]],
+                correct=bool(self.correct[i]),
+                response_time=float(self.response_time[i]),
+                hints_used=int(self.hints_used[i]),
+                difficulty=float(self.difficulty[i]),
+                timestamp=datetime.fromtimestamp(self.timestamp[i])
+            )
+    
+    def aggregate(self, skill: Optional[str] = None) -> Optional[_RunningTotals]:
+        return self.by_skill.get(skill) if skill else self.totals
+    
+    def retention_rate(self, skill: Optional[str] = None, now: Optional[datetime] = None,
+                       min_days: int = 3) -> Optional[float]:
+        """Accuracy on buffered responses practiced more than min_days ago."""
+        if self._size == 0:
+            return None
+        now = (now or datetime.now()).timestamp()
+        
+        # Performance on items practiced > min_days ago
+        mask = np.floor((now - self.timestamp[:self._size]) / 86400.0) > min_days
+        if skill:
+            code = self._codes.get(skill)
+            if code is None:
+                return None
+            mask &= self.skill_codes[:self._size] == code
+        
+        n = int(mask.sum())
+        if n == 0:
+            return None
+        return float(self.correct[:self._size][mask].sum()) / n
+
+Statement = Tuple[str, tuple]
+
+class WriteBehindQueue:
+    """Buffers tracing writes and commits them in one transaction per database per batch.
+    
+    A background thread flushes when batch_size statements are pending or
+    every flush_interval seconds; close() (also run at interpreter exit)
+    forces a final flush. Statements whose database fails to commit go back
+    to the front of the queue and are retried; after max_retries
+    consecutive failures they are logged and dropped, so one bad statement
+    cannot block its database forever.
+    """
+    
+    def __init__(self, batch_size: int = 256, flush_interval: float = 0.5, max_retries: int = 3):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self._failed_attempts = 0
+        self.statements_dropped = 0
+        self._pending: List[Tuple[str, Statement]] = []
+        self._condition = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._closed = False
+        self.batches_written = 0
+        self._thread = threading.Thread(target=self._run, name="tracing-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+    
+    def put(self, db_path: str, statements: List[Statement]):
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("write-behind queue is closed")
+            self._pending.extend((db_path, statement) for statement in statements)
+            if len(self._pending) >= self.batch_size:
+                self._condition.notify()
+    
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+    
+    def flush(self):
+        """Write everything queued so far before returning.
+        
+        Flushes are serialized and take the batch while holding the write
+        lock, so batches reach disk in queue order and a flush that finds
+        the queue empty still waits for one in progress to commit.
+        """
+        with self._write_lock:
+            with self._condition:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return
+            
+            by_database: Dict[str, List[Statement]] = {}
+            for db_path, statement in batch:
+                by_database.setdefault(db_path, []).append(statement)
+            committed = set()
+            try:
+                for db_path, statements in by_database.items():
+                    _execute_in_transaction(db_path, statements)
+                    committed.add(db_path)
+            except Exception:
+                failed = [(db_path, statement) for db_path, statement in batch if db_path not in committed]
+                self._failed_attempts += 1
+                if self._failed_attempts > self.max_retries:
+                    logger.error("Dropping %d tracing statements after %d failed commits: %r",
+                                 len(failed), self._failed_attempts, failed)
+                    self.statements_dropped += len(failed)
+                    self._failed_attempts = 0
+                else:
+                    # Requeue what did not commit ahead of anything queued since
+                    with self._condition:
+                        self._pending[:0] = failed
+                raise
+            self._failed_attempts = 0
+            self.batches_written += 1
+    
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._closed and len(self._pending) < self.batch_size:
+                    self._condition.wait(self.flush_interval)
+                closed = self._closed
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Write-behind flush failed; %d statements kept for retry", self.pending)
+                if not closed:
+                    # Back off instead of spinning on a full queue that cannot commit
+                    with self._condition:
+                        self._condition.wait(self.flush_interval)
+            if closed:
+                return
+    
+    def close(self):
+        """Stop the background writer after a final flush."""
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify()
+        atexit.unregister(self.close)
+        self._thread.join()
+        self.flush()
+
+def _execute_in_transaction(db_path: str, statements: List[Statement]):
+    """Run statements on one connection as a single transaction."""
+    with sqlite3.connect(db_path) as conn:
+        for sql, params in statements:
+            conn.execute(sql, params)
+
+class _UserMasteries(dict):
+    """A user's masteries by skill; weakly referenceable so the store can find live ones."""
+    __slots__ = ("__weakref__",)
+
+
+class TracingStore:
+    """User-scoped tracing storage shared by all tracers in a process.
+    
+    Users are spread over num_shards SQLite files by a stable hash of user_id,
+    so concurrent sessions do not all contend for one database's write lock.
+    The masteries of recently active users are kept in a bounded LRU cache;
+    a dict evicted from it while a tracer still holds it stays the user's
+    dict, so every handle on a user keeps sharing one set of masteries.
+    One ResearchMetrics over every shard is shared by all readers; it
+    refreshes its rollups at most every metrics_staleness seconds.
+    """
+    
+    def __init__(self, db_path: str = "knowledge_tracing.sqlite", num_shards: int = 1,
+                 cache_size: int = 1024, write_behind: bool = False,
+                 batch_size: int = 256, flush_interval: float = 0.5,
+                 metrics_staleness: float = 30.0):
         self.db_path = db_path
-        self._init_database()
-        self.skill_masteries: Dict[str, SkillMastery] = {}
-        self.response_history: List[ItemResponse] = []
+        self.num_shards = max(1, num_shards)
+        self.cache_size = cache_size
+        self.metrics_staleness = metrics_staleness
+        
+        if self.num_shards == 1:
+            self.shard_paths = [db_path]
+        else:
+            path = Path(db_path)
+            self.shard_paths = [
+                str(path.with_name(f"{path.stem}.shard{i}{path.suffix}")) for i in range(self.num_shards)
+            ]
+        for shard_path in self.shard_paths:
+            _init_tracing_database(shard_path)
+        # Pre-user-scoped masteries belong to user "default", in that user's shard only
+        _migrate_legacy_masteries(db_path, self.shard_path("default"))
+        
+        self._cache: "OrderedDict[str, Dict[str, SkillMastery]]" = OrderedDict()
+        self._live: "weakref.WeakValueDictionary[str, _UserMasteries]" = weakref.WeakValueDictionary()
+        self._item_parameters: Dict[str, Dict[str, Tuple[float, float]]] = {}
+        self._lock = threading.Lock()
+        self.writer = WriteBehindQueue(batch_size, flush_interval) if write_behind else None
+        self._research_metrics: Optional[ResearchMetrics] = None
     
-    def _init_database(self):
-        """Initialize database for storing tracing data."""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute("""
-                CREATE TABLE IF NOT EXISTS skill_mastery (
-                    skill TEXT PRIMARY KEY,
-                    theta REAL DEFAULT 0.0,
-                    sem REAL DEFAULT 1.0,
-                    last_practiced TIMESTAMP,
-                    practice_count INTEGER DEFAULT 0,
-                    success_rate REAL DEFAULT 0.0
-                )
-            """)
-            conn.execute("""
-                CREATE TABLE IF NOT EXISTS item_responses (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    item_id TEXT,
-                    skill TEXT,
-                    correct BOOLEAN,
-                    response_time REAL,
-                    hints_used INTEGER,
-                    difficulty REAL,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_skill_responses ON item_responses(skill)
-            """)
+    @property
+    def research_metrics(self) -> ResearchMetrics:
+        """The store's shared metrics rollups, created on first use."""
+        metrics = self._research_metrics
+        if metrics is None:
+            # Built outside the lock, since it creates tables in every shard
+            created = ResearchMetrics.for_store(self, max_staleness=self.metrics_staleness)
+            with self._lock:
+                if self._research_metrics is None:
+                    self._research_metrics = created
+                metrics = self._research_metrics
+        return metrics
+    
+    def shard_path(self, user_id: str) -> str:
+        """Database file holding this user's tracing data."""
+        if self.num_shards == 1:
+            return self.shard_paths[0]
+        digest = hashlib.md5(user_id.encode("utf-8")).digest()
+        return self.shard_paths[int.from_bytes(digest[:4], "big") % self.num_shards]
+    
+    def masteries(self, user_id: str) -> Dict[str, SkillMastery]:
+        """The user's skill masteries; loaded with one query on a cache miss."""
+        with self._lock:
+            cached = self._cached(user_id)
+            if cached is not None:
+                return cached
+        
+        loaded = _UserMasteries(self._read_masteries(user_id))
+        with self._lock:
+            # Another thread may have loaded the same user meanwhile; keep one dict
+            masteries = self._cached(user_id)
+            if masteries is None:
+                masteries = self._live[user_id] = loaded
+                self._cache_user(user_id, masteries)
+        return masteries
+    
+    def _cached(self, user_id: str) -> Optional[Dict[str, SkillMastery]]:
+        """The user's dict if cached or still held by a tracer; call with the lock held."""
+        masteries = self._cache.get(user_id)
+        if masteries is None:
+            # Evicted, but a live handle still writes into it: it stays the user's dict
+            masteries = self._live.get(user_id)
+            if masteries is None:
+                return None
+        self._cache_user(user_id, masteries)
+        return masteries
+    
+    def _cache_user(self, user_id: str, masteries: Dict[str, SkillMastery]):
+        self._cache[user_id] = masteries
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+    
+    def _read_masteries(self, user_id: str) -> Dict[str, SkillMastery]:
+        # Queued writes must land before reading the user back from disk
+        self.flush()
+        with sqlite3.connect(self.shard_path(user_id)) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.execute(
+                "SELECT * FROM user_skill_mastery WHERE user_id = ?", (user_id,)
+            )
+            return {row['skill']: _row_to_mastery(row) for row in cursor.fetchall()}
     
-    def update_mastery(self, response: ItemResponse) -> float:
-        """Update skill mastery using Bayesian updating with IRT."""
+    def put_masteries(self, masteries: Dict[str, SkillMastery], updates: List[SkillMastery],
+                      overwrite: bool = True):
+        """Write into a dict returned by masteries(), which every handle on the user shares.
+        
+        With overwrite=False only skills not already present are added, so a
+        value read from disk never replaces a newer one from another handle.
+        """
+        with self._lock:
+            for mastery in updates:
+                if overwrite:
+                    masteries[mastery.skill] = mastery
+                else:
+                    masteries.setdefault(mastery.skill, mastery)
+    
+    def copy_masteries(self, masteries: Dict[str, SkillMastery]) -> Dict[str, SkillMastery]:
+        """A consistent copy of a dict returned by masteries(), safe to iterate."""
+        with self._lock:
+            return dict(masteries)
+    
+    def item_parameters(self, db_path: str) -> Dict[str, Tuple[float, float]]:
+        """Calibrated (difficulty, discrimination) by item_id for one shard, loaded once."""
+        parameters = self._item_parameters.get(db_path)
+        if parameters is None:
+            with sqlite3.connect(db_path) as conn:
+                rows = conn.execute(
+                    "SELECT item_id, difficulty, discrimination FROM item_parameters"
+                ).fetchall()
+            parameters = {item_id: (difficulty, discrimination) for item_id, difficulty, discrimination in rows}
+            self._item_parameters[db_path] = parameters
+        return parameters
+    
+    def reload_item_parameters(self):
+        """Drop cached item parameters, e.g. after a calibration run."""
+        self._item_parameters.clear()
+    
+    def decayed_masteries(self, user_ids: Optional[List[str]] = None, now: Optional[datetime] = None,
+                          engine: Optional["TracingEngine"] = None) -> Dict[str, np.ndarray]:
+        """Masteries decayed to now for many users at once, read-only.
+        
+        Returns parallel columns (user_id, skill, theta, decayed_theta,
+        mastery_probability) over every stored skill of the given users, or of
+        all users; decay is one vectorized pass over the rows and nothing is
+        written back.
+        """
+        engine = get_engine(engine)
+        self.flush()
+        
+        queries: List[Tuple[str, str, tuple]] = []
+        if user_ids is None:
+            queries = [(path, "", ()) for path in self.shard_paths]
+        else:
+            by_shard: Dict[str, List[str]] = {}
+            for user_id in dict.fromkeys(user_ids):
+                by_shard.setdefault(self.shard_path(user_id), []).append(user_id)
+            for path, users in by_shard.items():
+                for start in range(0, len(users), 500):
+                    batch = tuple(users[start:start + 500])
+                    queries.append((path, f"WHERE user_id IN ({','.join('?' * len(batch))})", batch))
+        
+        rows = []
+        for path, where, params in queries:
+            with sqlite3.connect(path) as conn:
+                rows.extend(conn.execute(
+                    f"SELECT user_id, skill, theta, last_practiced FROM user_skill_mastery {where}", params
+                ).fetchall())
+        
+        if not rows:
+            empty = np.empty(0)
+            return {'user_id': np.empty(0, dtype=object), 'skill': np.empty(0, dtype=object),
+                    'theta': empty, 'decayed_theta': empty, 'mastery_probability': empty}
+        
+        users, skills, thetas, stamps = zip(*rows)
+        theta = np.array(thetas, dtype=float)
+        elapsed = np.datetime64(now or datetime.now(), "us") - np.array(stamps, dtype="datetime64[us]")
+        days_since_practice = np.maximum(elapsed // np.timedelta64(1, "D"), 0)
+        decayed = engine.decay(theta, days_since_practice)
+        return {
+            'user_id': np.array(users, dtype=object),
+            'skill': np.array(skills, dtype=object),
+            'theta': theta,
+            'decayed_theta': decayed,
+            'mastery_probability': engine.mastery_probability(decayed)
+        }
+    
+    def write(self, db_path: str, statements: List[Statement], durable: bool = False):
+        """Persist statements together; queued in write-behind mode unless durable."""
+        if self.writer is None:
+            _execute_in_transaction(db_path, statements)
+            return
+        self.writer.put(db_path, statements)
+        if durable:
+            self.writer.flush()
+    
+    def flush(self):
+        """Force any queued writes to disk."""
+        if self.writer is not None:
+            self.writer.flush()
+    
+    def close(self):
+        """Flush and stop the background writer, if any."""
+        if self.writer is not None:
+            self.writer.close()
+    
+    def evict(self, user_id: str):
+        """Drop a user's masteries from the cache; they stay on disk and with live tracers."""
+        with self._lock:
+            self._cache.pop(user_id, None)
+    
+    def clear_cache(self):
+        """Drop every cached user, e.g. after masteries were rewritten on disk.
+        
+        Users a live tracer still holds are reloaded in place instead, so the
+        tracer sees the rewritten masteries rather than writing stale ones back.
+        """
+        with self._lock:
+            self._cache.clear()
+            live = list(self._live.items())
+        for user_id, masteries in live:
+            loaded = self._read_masteries(user_id)
+            with self._lock:
+                masteries.clear()
+                masteries.update(loaded)
+    
+    @property
+    def cached_users(self) -> int:
+        return len(self._cache)
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    keep = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+    return keep[np.argsort(-scores[keep], kind="stable")]
+
+class KnowledgeTracer:
+    """Knowledge tracing system using Item Response Theory and Bayesian updating."""
+    
+    def __init__(self, db_path: str = "knowledge_tracing.sqlite", user_id: str = "default",
+                 store: Optional[TracingStore] = None, history_capacity: int = 10000,
+                 scheduler=None, engine=None):
+        self.user_id = user_id
+        self.engine = get_engine(engine)
+        self.scheduler = scheduler
+        self.store = store or (scheduler.store if scheduler is not None else TracingStore(db_path))
+        self.db_path = self.store.shard_path(user_id)
+        self.skill_masteries: Dict[str, SkillMastery] = self.store.masteries(user_id)
+        self.response_history = ResponseHistory(history_capacity)
+        self._absent_skills: set = set()
+    
+    def update_mastery(self, response: ItemResponse, durable: bool = False) -> float:
+        """Update skill mastery with the tracer's engine (Bayesian IRT by default).
+        
+        Set durable=True to have the write on disk before returning when the
+        store runs in write-behind mode.
+        """
         skill = response.skill
         
+        # Calibrated item parameters override the caller's difficulty estimate
+        discrimination = 1.0
+        calibrated = self.item_parameters(response.item_id)
+        if calibrated is not None:
+            difficulty, discrimination = calibrated
+            response = replace(response, difficulty=difficulty)
+        
         # Load current mastery if exists
         if skill not in self.skill_masteries:
             self._load_skill_mastery(skill)
         
+        # A first response has no gap since last practice
         current = self.skill_masteries.get(skill, SkillMastery(
-            skill=skill, theta=0.0, sem=1.0, 
-            last_practiced=datetime.now(), 
+            skill=skill, theta=self.engine.initial_theta, sem=1.0, 
+            last_practiced=response.timestamp, 
             practice_count=0, success_rate=0.0
         ))
         
-        # IRT 2-parameter model update
-        # P(correct) = 1 / (1 + exp(-a*(theta - b)))
-        # where a = discrimination (fixed at 1.0), b = difficulty
-        
-        # Calculate likelihood of response given current theta
-        logit = current.theta - response.difficulty
-        p_correct = 1.0 / (1.0 + np.exp(-logit))
-        
-        # Bayesian update using response as evidence
-        # Posterior precision = prior precision + information
-        prior_precision = 1.0 / (current.sem ** 2)
-        
-        # Information function for 2PL IRT
-        information = p_correct * (1 - p_correct)
-        
-        posterior_precision = prior_precision + information
-        posterior_sem = np.sqrt(1.0 / posterior_precision)
-        
-        # Update theta based on response
-        if response.correct:
-            # Correct response increases theta
-            theta_update = (current.theta / (current.sem ** 2) + 
-                          information * response.difficulty) / posterior_precision
-        else:
-            # Incorrect response decreases theta
-            theta_update = (current.theta / (current.sem ** 2) - 
-                          information * (1 - response.difficulty)) / posterior_precision
-        
-        # Apply forgetting factor for time since last practice
         days_since_practice = (response.timestamp - current.last_practiced).days
-        forgetting_factor = np.exp(-0.05 * days_since_practice)  # 5% decay per day
-        
-        theta_update *= forgetting_factor
+        theta, sem = self.engine.update(
+            current.theta, current.sem, current.practice_count, response.correct,
+            response.difficulty, days_since_practice, discrimination
+        )
         
         # Update mastery
         updated = SkillMastery(
             skill=skill,
-            theta=np.clip(theta_update, -3.0, 3.0),
-            sem=posterior_sem,
+            theta=float(theta),
+            sem=float(sem),
             last_practiced=response.timestamp,
             practice_count=current.practice_count + 1,
             success_rate=self._update_success_rate(current.success_rate, current.practice_count, response.correct)
         )
         
-        self.skill_masteries[skill] = updated
+        self.store.put_masteries(self.skill_masteries, [updated])
         self.response_history.append(response)
         
-        # Save to database
-        self._save_skill_mastery(updated)
-        self._save_response(response)
+        # Save mastery, response and next review together in one transaction (or one queued batch)
+        statements = [self._mastery_statement(updated), self._response_statement(response, discrimination)]
+        if self.scheduler is not None:
+            statements.append(self.scheduler.reschedule(self.user_id, updated))
+        self.store.write(self.db_path, statements, durable=durable)
         
         return updated.theta
     
     def _update_success_rate(self, current_rate: float, count: int, correct: bool) -> float:
         """Update exponential moving average of success rate."""
-        alpha = 0.1  # Learning rate for EMA
-        if count == 0:
-            return 1.0 if correct else 0.0
-        return alpha * (1.0 if correct else 0.0) + (1 - alpha) * current_rate
+        return float(ema_success_rate(current_rate, count, correct))
     
-    def get_mastery_probability(self, skill: str) -> float:
-        """Convert theta to mastery probability (0-1 scale)."""
+    def get_decayed_theta(self, skill: str, now: Optional[datetime] = None) -> float:
+        """Theta as of now: the stored value with forgetting since last practice applied."""
         if skill not in self.skill_masteries:
             self._load_skill_mastery(skill)
         
         # Use default theta if skill not found
-        theta = self.skill_masteries.get(skill, SkillMastery(
-            skill=skill, theta=0.0, sem=1.0,
-            last_practiced=datetime.now(),
-            practice_count=0, success_rate=0.0
-        )).theta
-        
-        # Logistic transformation: theta=0 -> 0.5, theta=+2 -> 0.88, theta=-2 -> 0.12
-        return 1.0 / (1.0 + np.exp(-theta))
+        mastery = self.skill_masteries.get(skill)
+        if mastery is None:
+            return self.engine.initial_theta
+        days_since_practice = max(((now or datetime.now()) - mastery.last_practiced).days, 0)
+        return float(self.engine.decay(mastery.theta, days_since_practice))
+    
+    def get_mastery_probability(self, skill: str, now: Optional[datetime] = None) -> float:
+        """Convert theta to mastery probability (0-1 scale), decayed to now."""
+        return float(self.engine.mastery_probability(self.get_decayed_theta(skill, now)))
     
     def calculate_information_gain(self, skill: str, difficulty: float) -> float:
         """Calculate expected information gain for an item."""
-        if skill not in self.skill_masteries:
-            self._load_skill_mastery(skill)
-        
-        # Use default theta if skill not found
-        theta = self.skill_masteries.get(skill, SkillMastery(
-            skill=skill, theta=0.0, sem=1.0,
-            last_practiced=datetime.now(),
-            practice_count=0, success_rate=0.0
-        )).theta
+        theta = self.get_decayed_theta(skill)
         
         # Expected information = I(theta) where I is Fisher information
-        logit = theta - difficulty
-        p_correct = 1.0 / (1.0 + np.exp(-logit))
-        information = p_correct * (1 - p_correct)
-        
-        return information
+        return float(self.engine.information(theta, difficulty))
+    
+    def mastery_snapshot(self) -> Dict[str, SkillMastery]:
+        """A copy of the user's masteries that other handles' updates cannot change mid-iteration."""
+        return self.store.copy_masteries(self.skill_masteries)
+    
+    def item_parameters(self, item_id: str) -> Optional[Tuple[float, float]]:
+        """Calibrated (difficulty, discrimination) for an item, if it has been calibrated."""
+        return self.store.item_parameters(self.db_path).get(item_id)
     
     def get_next_item_recommendations(self, candidate_items: List[Dict[str, Any]], 
                                      max_items: int = 5) -> List[Dict[str, Any]]:
-        """Recommend next items based on information gain and spacing."""
-        scored_items = []
+        """Recommend next items based on information gain and spacing.
         
-        for item in candidate_items:
-            skill = item['skill']
-            difficulty = item['difficulty']
-            
-            # Calculate information gain
-            info_gain = self.calculate_information_gain(skill, difficulty)
-            
-            # Calculate spacing benefit (higher for items not practiced recently)
-            if skill in self.skill_masteries:
-                days_since = (datetime.now() - self.skill_masteries[skill].last_practiced).days
-                spacing_bonus = min(days_since / 7.0, 1.0)  # Max bonus after 1 week
-            else:
-                spacing_bonus = 1.0  # New skill gets max bonus
-            
-            # Calculate mastery urgency (higher for lower mastery)
-            mastery = self.get_mastery_probability(skill)
-            urgency = 1.0 - mastery
-            
-            # Combined score
-            score = 0.4 * info_gain + 0.3 * spacing_bonus + 0.3 * urgency
-            
-            scored_items.append({
-                **item,
-                'score': score,
-                'information_gain': info_gain,
-                'spacing_bonus': spacing_bonus,
-                'urgency': urgency,
-                'current_mastery': mastery
-            })
-        
-        # Sort by score and return top items
-        scored_items.sort(key=lambda x: x['score'], reverse=True)
-        return scored_items[:max_items]
-    
-    def get_research_metrics(self, skill: str = None) -> Dict[str, Any]:
-        """Calculate research metrics for evaluation."""
-        if skill:
-            responses = [r for r in self.response_history if r.skill == skill]
-        else:
-            responses = self.response_history
+        Candidate and recommendation 'difficulty' values are on the 0-1
+        question scale; calibrated items report their fitted b converted to it.
+        """
+        if not candidate_items:
+            return []
         
-        if not responses:
-            return {}
+        # Integer skill codes let per-skill values be computed once and gathered
+        skill_codes: Dict[str, int] = {}
+        codes = np.fromiter(
+            (skill_codes.setdefault(item['skill'], len(skill_codes)) for item in candidate_items),
+            dtype=np.int64, count=len(candidate_items)
+        )
+        difficulties = difficulty_to_logit(np.fromiter(
+            (item['difficulty'] for item in candidate_items),
+            dtype=np.float64, count=len(candidate_items)
+        ))
+        discriminations = None
         
-        # Basic metrics
-        total_responses = len(responses)
-        correct_responses = sum(1 for r in responses if r.correct)
-        accuracy = correct_responses / total_responses
+        # Calibrated items are scored with their fitted parameters
+        calibrated = self.store.item_parameters(self.db_path)
+        if calibrated:
+            discriminations = np.ones(len(candidate_items))
+            for i, item in enumerate(candidate_items):
+                parameters = calibrated.get(item.get('item_id'))
+                if parameters is not None:
+                    difficulties[i], discriminations[i] = parameters
         
-        # Time metrics
-        avg_response_time = np.mean([r.response_time for r in responses])
+        scores = self.score_candidates(list(skill_codes), codes, difficulties, discriminations=discriminations)
+        return [
+            {
+                **candidate_items[i],
+                'difficulty': float(logit_to_difficulty(difficulties[i])),
+                'score': float(scores['score'][i]),
+                'information_gain': float(scores['information_gain'][i]),
+                'spacing_bonus': float(scores['spacing_bonus'][i]),
+                'urgency': float(scores['urgency'][i]),
+                'current_mastery': float(scores['current_mastery'][i])
+            }
+            for i in top_k_indices(scores['score'], max_items)
+        ]
+    
+    def score_candidates(self, skills: List[str], skill_codes: np.ndarray,
+                         difficulties: np.ndarray, now: Optional[datetime] = None,
+                         discriminations: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+        """Score a candidate pool given as arrays.
+        
+        skills lists the distinct skills; candidate i practices skills[skill_codes[i]]
+        at difficulties[i], an IRT b on the logit scale (with discriminations[i],
+        default 1.0). Returns one
+        array per score component, aligned with the candidates.
+        """
+        now = now or datetime.now()
+        self._load_skill_masteries(skills)
+        
+        # Per-skill state: a handful of values, however large the pool
+        theta = np.full(len(skills), self.engine.initial_theta)
+        spacing = np.ones(len(skills))  # New skills get max bonus
+        for j, skill in enumerate(skills):
+            mastery = self.skill_masteries.get(skill)
+            if mastery is not None:
+                days_since = max((now - mastery.last_practiced).days, 0)
+                theta[j] = self.engine.decay(mastery.theta, days_since)
+                spacing[j] = min(days_since / 7.0, 1.0)  # Max bonus after 1 week
+        
+        a = 1.0 if discriminations is None else discriminations
+        information_gain = self.engine.information(theta[skill_codes], difficulties, a)
+        mastery = self.engine.mastery_probability(theta)[skill_codes]
+        urgency = 1.0 - mastery
+        spacing_bonus = spacing[skill_codes]
+        
+        return {
+            'score': 0.4 * information_gain + 0.3 * spacing_bonus + 0.3 * urgency,
+            'information_gain': information_gain,
+            'spacing_bonus': spacing_bonus,
+            'urgency': urgency,
+            'current_mastery': mastery
+        }
+    
+    def get_research_metrics(self, skill: str = None, source: str = "session") -> Dict[str, Any]:
+        """Calculate research metrics for evaluation.
+        
+        Counts, accuracy, timing, hints and learning gain come from running
+        aggregates in O(1); retention scans only the bounded history buffer.
+        With source="database" they cover every stored response of the user,
+        read from the store's shared SQL rollups instead, which may lag by up
+        to the store's metrics_staleness seconds.
+        """
+        if source == "database":
+            metrics = self.store.research_metrics.summary(user_id=self.user_id, skill=skill)
+            if metrics:
+                metrics['skill_masteries'] = len(self.skill_masteries)
+            return metrics
+        if source != "session":
+            raise ValueError(f"Unknown metrics source: {source}")
         
-        # Hint metrics
-        hints_per_response = np.mean([r.hints_used for r in responses])
+        totals = self.response_history.aggregate(skill)
+        if totals is None or totals.count == 0:
+            return {}
         
         # Learning gain (compare first vs last 10 responses)
-        if len(responses) >= 20:
-            early_responses = responses[:10]
-            late_responses = responses[-10:]
-            
-            early_accuracy = sum(1 for r in early_responses if r.correct) / len(early_responses)
-            late_accuracy = sum(1 for r in late_responses if r.correct) / len(late_responses)
+        if totals.count >= 20:
+            early_accuracy = sum(totals.first) / len(totals.first)
+            late_accuracy = sum(totals.recent) / len(totals.recent)
             learning_gain = late_accuracy - early_accuracy
         else:
             learning_gain = 0.0
         
-        # Retention (performance on items practiced > 3 days ago)
-        retention_items = [r for r in responses 
-                          if (datetime.now() - r.timestamp).days > 3]
-        if retention_items:
-            retention_rate = sum(1 for r in retention_items if r.correct) / len(retention_items)
-        else:
-            retention_rate = None
-        
         return {
-            'total_responses': total_responses,
-            'accuracy': accuracy,
-            'avg_response_time': avg_response_time,
-            'hints_per_response': hints_per_response,
+            'total_responses': totals.count,
+            'accuracy': totals.correct / totals.count,
+            'avg_response_time': totals.response_time / totals.count,
+            'hints_per_response': totals.hints / totals.count,
             'learning_gain': learning_gain,
-            'retention_rate': retention_rate,
+            'retention_rate': self.response_history.retention_rate(skill),
             'skill_masteries': len(self.skill_masteries)
         }
     
     def _load_skill_mastery(self, skill: str):
         """Load skill mastery from database."""
+        self._load_skill_masteries([skill])
+    
+    def _load_skill_masteries(self, skills: List[str]):
+        """Load every listed skill not already known, in one query per 500 skills."""
+        wanted = [
+            skill for skill in skills
+            if skill not in self.skill_masteries and skill not in self._absent_skills
+        ]
+        if not wanted:
+            return
+        
+        loaded = []
         with sqlite3.connect(self.db_path) as conn:
             conn.row_factory = sqlite3.Row
-            cursor = conn.execute(
-                "SELECT * FROM skill_mastery WHERE skill = ?", (skill,)
-            )
-            row = cursor.fetchone()
-            if row:
-                self.skill_masteries[skill] = SkillMastery(
-                    skill=row['skill'],
-                    theta=row['theta'],
-                    sem=row['sem'],
-                    last_practiced=datetime.fromisoformat(row['last_practiced']),
-                    practice_count=row['practice_count'],
-                    success_rate=row['success_rate']
+            for start in range(0, len(wanted), 500):
+                batch = wanted[start:start + 500]
+                cursor = conn.execute(
+                    f"SELECT * FROM user_skill_mastery WHERE user_id = ? "
+                    f"AND skill IN ({','.join('?' * len(batch))})",
+                    (self.user_id, *batch)
                 )
+                loaded.extend(_row_to_mastery(row) for row in cursor.fetchall())
+        self.store.put_masteries(self.skill_masteries, loaded, overwrite=False)
+        
+        # Remember misses so unpractised skills are not queried on every call
+        self._absent_skills.update(skill for skill in wanted if skill not in self.skill_masteries)
+    
+    def _mastery_statement(self, mastery: SkillMastery) -> Statement:
+        return ("""
+            INSERT OR REPLACE INTO user_skill_mastery 
+            (user_id, skill, theta, sem, last_practiced, practice_count, success_rate)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (
+            self.user_id,
+            mastery.skill,
+            float(mastery.theta),
+            float(mastery.sem),
+            mastery.last_practiced.isoformat(),
+            mastery.practice_count,
+            float(mastery.success_rate)
+        ))
+    
+    def _response_statement(self, response: ItemResponse, discrimination: float = 1.0) -> Statement:
+        return ("""
+            INSERT INTO item_responses 
+            (user_id, item_id, skill, correct, response_time, hints_used, difficulty, timestamp,
+             discrimination)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (
+            self.user_id,
+            response.item_id,
+            response.skill,
+            bool(response.correct),
+            float(response.response_time),
+            int(response.hints_used),
+            float(response.difficulty),
+            response.timestamp.isoformat(),
+            float(discrimination)
+        ))
     
     def _save_skill_mastery(self, mastery: SkillMastery):
         """Save skill mastery to database."""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute("""
-                INSERT OR REPLACE INTO skill_mastery 
-                (skill, theta, sem, last_practiced, practice_count, success_rate)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (
-                mastery.skill,
-                mastery.theta,
-                mastery.sem,
-                mastery.last_practiced.isoformat(),
-                mastery.practice_count,
-                mastery.success_rate
-            ))
+        self.store.write(self.db_path, [self._mastery_statement(mastery)])
     
     def _save_response(self, response: ItemResponse):
         """Save item response to database."""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute("""
-                INSERT INTO item_responses 
-                (item_id, skill, correct, response_time, hints_used, difficulty, timestamp)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (
-                response.item_id,
-                response.skill,
-                response.correct,
-                response.response_time,
-                response.hints_used,
-                response.difficulty,
-                response.timestamp.isoformat()
-            ))
+        self.store.write(self.db_path, [self._response_statement(response)])
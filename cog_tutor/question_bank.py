@@ -0,0 +1,395 @@
+"""Pre-generated question pools per (skill, difficulty band), refilled in the background."""
+import bisect
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Callable, Tuple
+
+from .inference import run_prompt
+from .dedupe import MinHashLSH, question_text, dedupe_question_bank
+from .knowledge_tracing import WriteBehindQueue
+from .rag.knowledge_base import KnowledgeBase
+from .rag.retriever import difficulty_band, DIFFICULTY_BANDS
+
+QuestionGenerator = Callable[[str, float], Dict[str, Any]]
+
+
+def author_adaptive_question(knowledge_base: KnowledgeBase, skill: str, difficulty: float) -> Dict[str, Any]:
+    """Author one question grounded in the skill's knowledge items; raises if generation fails."""
+    # Retrieve relevant knowledge for the skill
+    knowledge_items = knowledge_base.retrieve_by_skill(skill, limit=3)
+
+    # Prepare input for question generation
+    prompt_input = {
+        "skill": skill,
+        "mastery_level": 1.0 - difficulty,
+        "knowledge_content": [item["content"] for item in knowledge_items],
+        "difficulty": difficulty
+    }
+    question = run_prompt(
+        "adaptive_question_generation",
+        prompt_input,
+        model_id="Qwen/Qwen3-7B-Instruct"
+    )
+
+    # Add knowledge citations
+    question["knowledge_sources"] = [item["id"] for item in knowledge_items]
+    return question
+
+
+def band_difficulty(band: int) -> float:
+    """Representative difficulty of a band: its midpoint."""
+    return (band + 0.5) / DIFFICULTY_BANDS
+
+
+class _Pool:
+    """Question ids of one (skill, band) in insertion order, with their payloads."""
+
+    __slots__ = ("ids", "questions")
+
+    def __init__(self):
+        self.ids: List[int] = []
+        self.questions: Dict[int, Dict[str, Any]] = {}
+
+    def add(self, question_id: int, question: Dict[str, Any]):
+        if question_id in self.questions:
+            return  # already picked up when the pool was loaded from disk
+        if not self.ids or question_id > self.ids[-1]:
+            self.ids.append(question_id)
+        else:
+            bisect.insort(self.ids, question_id)
+        self.questions[question_id] = question
+
+
+class QuestionBank:
+    """Serve pre-generated questions without waiting on a model call.
+
+    Questions live in SQLite under (skill, band) with increasing ids. Each
+    user has a cursor per pool holding the id of the last question served
+    to them, so serving is a binary search plus a cursor bump, and no user is
+    served the same question twice. When the questions left for a user fall
+    below low_watermark, a background job authors refill_batch more; after
+    a refill that stores nothing, the pool waits refill_backoff seconds
+    (doubling up to max_refill_backoff) before trying again. Cursor moves
+    go through writer, a WriteBehindQueue such as the tracing store's; the
+    bank starts and owns one when none is given.
+
+    Questions whose stems are near-duplicates of one of the skill's last
+    dedupe_capacity banked questions (MinHash Jaccard >= dedupe_threshold)
+    are dropped at insert time, as are questions with no stem; pass
+    dedupe_threshold=None to bank everything else.
+    """
+
+    def __init__(self, db_path: str = "question_bank.sqlite", generator: Optional[QuestionGenerator] = None,
+                 low_watermark: int = 5, refill_batch: int = 10, refill_workers: int = 2,
+                 cursor_cache_size: int = 100_000, dedupe_threshold: Optional[float] = 0.7,
+                 dedupe_capacity: int = 20_000, writer: Optional[WriteBehindQueue] = None, refill_backoff: float = 1.0,
+                 max_refill_backoff: float = 300.0):
+        self.db_path = db_path
+        self.generator = generator
+        self.low_watermark = low_watermark
+        self.refill_batch = refill_batch
+        self.cursor_cache_size = cursor_cache_size
+        self.dedupe_threshold = dedupe_threshold
+        self.dedupe_capacity = dedupe_capacity
+        self.refill_backoff = refill_backoff
+        self.max_refill_backoff = max_refill_backoff
+        self.duplicates_rejected = 0
+        self._init_database()
+
+        self._pools: Dict[Tuple[str, int], _Pool] = {}
+        # Id of the last question served, per (user, skill, band)
+        self._cursors: "OrderedDict[Tuple[str, str, int], int]" = OrderedDict()
+        self._refilling: Dict[Tuple[str, int], Future] = {}
+        # (consecutive empty refills, time.monotonic() before which not to retry) per pool
+        self._refill_failures: Dict[Tuple[str, int], Tuple[int, float]] = {}
+        self._lock = threading.RLock()
+        self._dedupe: Dict[str, MinHashLSH] = {}
+        self._dedupe_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=refill_workers, thread_name_prefix="question-refill")
+        # Cursor moves are persisted in batches, off the serving path
+        self._owns_writer = writer is None
+        self._writer = writer if writer is not None else WriteBehindQueue()
+
+    def _init_database(self):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS question_bank (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    skill TEXT NOT NULL,
+                    band INTEGER NOT NULL,
+                    difficulty REAL,
+                    payload TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_question_pool ON question_bank(skill, band, id)
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS question_cursors (
+                    user_id TEXT NOT NULL,
+                    skill TEXT NOT NULL,
+                    band INTEGER NOT NULL,
+                    last_id INTEGER NOT NULL,
+                    PRIMARY KEY (user_id, skill, band)
+                )
+            """)
+
+    def _load_pool(self, skill: str, band: int, after: int = 0) -> _Pool:
+        pool = _Pool()
+        with sqlite3.connect(self.db_path) as conn:
+            for question_id, payload in conn.execute(
+                "SELECT id, payload FROM question_bank WHERE skill = ? AND band = ? AND id > ? ORDER BY id",
+                (skill, band, after)
+            ):
+                pool.add(question_id, json.loads(payload))
+        return pool
+
+    def _pool(self, skill: str, band: int) -> _Pool:
+        """The (skill, band) pool, read from disk outside the lock on first use."""
+        key = (skill, band)
+        with self._lock:
+            pool = self._pools.get(key)
+        if pool is not None:
+            return pool
+
+        loaded = self._load_pool(skill, band)
+        with self._lock:
+            pool = self._pools.setdefault(key, loaded)
+        if pool is loaded:
+            # Questions committed between the read and publishing the pool
+            # were not added by add_questions; pick them up now
+            missed = self._load_pool(skill, band, after=loaded.ids[-1] if loaded.ids else 0)
+            with self._lock:
+                for question_id in missed.ids:
+                    pool.add(question_id, missed.questions[question_id])
+        return pool
+
+    def _remember(self, key: Tuple[str, str, int], last_id: int):
+        """Record a cursor in the LRU cache; call with the lock held."""
+        self._cursors[key] = last_id
+        self._cursors.move_to_end(key)
+        while len(self._cursors) > self.cursor_cache_size:
+            self._cursors.popitem(last=False)
+
+    def _last_served(self, user_id: str, skill: str, band: int) -> int:
+        """Id of the last question served to the user from a pool, 0 if none; read from disk outside the lock."""
+        key = (user_id, skill, band)
+        with self._lock:
+            last_id = self._cursors.get(key)
+            if last_id is not None:
+                self._cursors.move_to_end(key)
+                return last_id
+
+        self._writer.flush()
+        with sqlite3.connect(self.db_path) as conn:
+            row = conn.execute(
+                "SELECT last_id FROM question_cursors WHERE user_id = ? AND skill = ? AND band = ?", key
+            ).fetchone()
+        with self._lock:
+            # A concurrent serve may have cached (and moved) the cursor meanwhile
+            last_id = self._cursors.get(key, row[0] if row else 0)
+            self._remember(key, last_id)
+        return last_id
+
+    def serve(self, user_id: str, skill: str, difficulty: float) -> Optional[Dict[str, Any]]:
+        """Next unseen question for the user at this difficulty, or None if the pool is used up.
+
+        Running low (or out) schedules a background refill either way. Disk
+        reads for pools and cursors not yet in memory happen before the lock
+        is taken, so one slow load does not stall every other session.
+        """
+        band = difficulty_band(difficulty)
+        key = (user_id, skill, band)
+        pool = self._pool(skill, band)
+        last_id = self._last_served(user_id, skill, band)
+        with self._lock:
+            last_id = self._cursors.get(key, last_id)
+            cursor = bisect.bisect_right(pool.ids, last_id)
+            remaining = len(pool.ids) - cursor
+            if remaining - 1 < self.low_watermark:
+                self._schedule_refill(skill, band)
+            if remaining <= 0:
+                return None
+
+            question_id = pool.ids[cursor]
+            self._remember(key, question_id)
+            question = dict(pool.questions[question_id])
+
+        self._writer.put(self.db_path, [("""
+            INSERT OR REPLACE INTO question_cursors (user_id, skill, band, last_id)
+            VALUES (?, ?, ?, ?)
+        """, (user_id, skill, band, question_id))])
+        question["question_id"] = question_id
+        return question
+
+    def _index_rows(self, index: MinHashLSH, skill: str, after: int = 0, limit: Optional[int] = None) -> int:
+        """Index the skill's banked questions with ids above after, at most the newest limit; returns the last id."""
+        with sqlite3.connect(self.db_path) as conn:
+            rows = conn.execute(
+                "SELECT id, payload FROM question_bank WHERE skill = ? AND id > ? ORDER BY id DESC LIMIT ?",
+                (skill, after, -1 if limit is None else limit)
+            ).fetchall()
+        rows.reverse()
+        if rows:
+            signatures = index.signatures([question_text(json.loads(payload)) for _, payload in rows])
+            for (question_id, _), signature in zip(rows, signatures):
+                index.insert(question_id, signature)
+        return rows[-1][0] if rows else after
+
+    def _dedupe_index(self, skill: str) -> MinHashLSH:
+        """The skill's near-duplicate index over every band, built from disk on first use.
+
+        The scan runs outside the dedupe lock; rows inserted meanwhile are
+        indexed when the index is published under it.
+        """
+        with self._dedupe_lock:
+            index = self._dedupe.get(skill)
+        if index is not None:
+            return index
+
+        built = MinHashLSH(threshold=self.dedupe_threshold, max_keys=self.dedupe_capacity)
+        last_id = self._index_rows(built, skill, limit=self.dedupe_capacity)
+        with self._dedupe_lock:
+            index = self._dedupe.get(skill)
+            if index is None:
+                self._index_rows(built, skill, after=last_id)
+                index = self._dedupe[skill] = built
+        return index
+
+    def add_questions(self, skill: str, band: int, questions: List[Dict[str, Any]]) -> List[int]:
+        """Store questions in a pool, skipping near-duplicates and questions without a stem; returns the ids stored."""
+        now = datetime.now().isoformat()
+        stored: List[Tuple[int, Dict[str, Any]]] = []
+        questions = [q for q in questions if question_text(q).strip()]
+        index = self._dedupe_index(skill) if self.dedupe_threshold is not None and questions else None
+        signatures = index.signatures([question_text(q) for q in questions]) if index is not None else None
+        # Checks and inserts are serialized per bank so two refills can't bank the same question
+        with self._dedupe_lock:
+            try:
+                with sqlite3.connect(self.db_path) as conn:
+                    for i, question in enumerate(questions):
+                        if index is not None and index.query(signatures[i]) is not None:
+                            self.duplicates_rejected += 1
+                            continue
+                        cursor = conn.execute("""
+                            INSERT INTO question_bank (skill, band, difficulty, payload, created_at)
+                            VALUES (?, ?, ?, ?, ?)
+                        """, (skill, band, question.get("difficulty"), json.dumps(question), now))
+                        stored.append((cursor.lastrowid, question))
+                        if index is not None:
+                            index.insert(cursor.lastrowid, signatures[i])
+            except Exception:
+                # The transaction rolled back; forget what it indexed
+                if index is not None:
+                    for question_id, _ in stored:
+                        if question_id in index:
+                            index.remove(question_id)
+                raise
+
+        with self._lock:
+            pool = self._pools.get((skill, band))
+            if pool is not None:
+                for question_id, question in stored:
+                    pool.add(question_id, question)
+        return [question_id for question_id, _ in stored]
+
+    def reload(self):
+        """Drop in-memory pools and dedupe indexes so they are re-read from disk, e.g. after rows were deleted.
+
+        Cursors are ids, so users keep their place.
+        """
+        with self._dedupe_lock:
+            self._dedupe.clear()
+        with self._lock:
+            self._pools.clear()
+
+    def dedupe(self, delete: bool = False) -> Dict[str, Any]:
+        """Find (and with delete=True remove) near-duplicates already banked, then reload this bank."""
+        report = dedupe_question_bank(
+            self.db_path, threshold=self.dedupe_threshold if self.dedupe_threshold is not None else 0.7,
+            delete=delete
+        )
+        if delete:
+            self.reload()
+        return report
+
+    def refill(self, skill: str, band: int, count: Optional[int] = None) -> int:
+        """Author up to count questions for a pool now; returns how many were stored.
+
+        Failed generations are skipped rather than banked as placeholders,
+        as are near-duplicates.
+        """
+        if self.generator is None:
+            return 0
+        difficulty = band_difficulty(band)
+        questions = []
+        for _ in range(count or self.refill_batch):
+            try:
+                question = self.generator(skill, difficulty)
+            except Exception:
+                continue
+            question.setdefault("skill", skill)
+            question.setdefault("difficulty", difficulty)
+            questions.append(question)
+        return len(self.add_questions(skill, band, questions)) if questions else 0
+
+    def _schedule_refill(self, skill: str, band: int):
+        """Start a background refill unless one for this pool is running or backing off."""
+        if self.generator is None:
+            return
+        key = (skill, band)
+        with self._lock:
+            running = self._refilling.get(key)
+            if running is not None and not running.done():
+                return
+            failures = self._refill_failures.get(key)
+            if failures is not None and time.monotonic() < failures[1]:
+                return
+            future = self._executor.submit(self.refill, skill, band)
+            self._refilling[key] = future
+        future.add_done_callback(lambda done: self._refill_finished(key, done))
+
+    def _refill_finished(self, key: Tuple[str, int], future: Future):
+        stored = not future.cancelled() and future.exception() is None and future.result() > 0
+        with self._lock:
+            if self._refilling.get(key) is future:
+                del self._refilling[key]
+            if stored:
+                self._refill_failures.pop(key, None)
+            else:
+                # A generator that keeps failing would otherwise be retried on every serve
+                count = self._refill_failures.get(key, (0, 0.0))[0] + 1
+                delay = min(self.refill_backoff * 2 ** (count - 1), self.max_refill_backoff)
+                self._refill_failures[key] = (count, time.monotonic() + delay)
+
+    def warm(self, skills: List[str], bands: Optional[List[int]] = None) -> List[Future]:
+        """Queue refills for every (skill, band) pool, e.g. at startup."""
+        futures = []
+        for skill in skills:
+            for band in (range(DIFFICULTY_BANDS) if bands is None else bands):
+                with self._lock:
+                    self._schedule_refill(skill, band)
+                    future = self._refilling.get((skill, band))
+                if future is not None:
+                    futures.append(future)
+        return futures
+
+    def pool_sizes(self) -> Dict[Tuple[str, int], int]:
+        """Stored questions per (skill, band), read from disk."""
+        with sqlite3.connect(self.db_path) as conn:
+            rows = conn.execute("SELECT skill, band, COUNT(*) FROM question_bank GROUP BY skill, band")
+            return {(skill, band): count for skill, band, count in rows}
+
+    def close(self):
+        """Wait for running refills and persist cursor moves."""
+        self._executor.shutdown(wait=True)
+        if self._owns_writer:
+            self._writer.close()
+        else:
+            self._writer.flush()
@@ -1,5 +1,10 @@
 from .retriever import KnowledgeRetriever
 from .knowledge_base import KnowledgeBase
 from .rag_prompts import RAGEnhancedPrompts
+from .dense import DenseRetriever, IVFIndex
+from .sharded import ShardedRetriever, ShardError
 
-__all__ = ["KnowledgeRetriever", "KnowledgeBase", "RAGEnhancedPrompts"]
+__all__ = [
+    "KnowledgeRetriever", "KnowledgeBase", "RAGEnhancedPrompts",
+    "DenseRetriever", "IVFIndex", "ShardedRetriever", "ShardError"
+]
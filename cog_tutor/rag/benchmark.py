@@ -0,0 +1,258 @@
+"""Retrieval benchmark: synthetic curricula, latency percentiles and recall@k per mode."""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from typing import List, Dict, Any, Tuple, Callable
+
+import numpy as np
+
+from .knowledge_base import KnowledgeBase
+from .retriever import KnowledgeRetriever
+from .dense import DenseRetriever
+from .sharded import ShardedRetriever
+
+BENCHMARK_MODES = ("sql", "tfidf", "dense", "hybrid")
+
+
+def _make_vocabulary(size: int, rng: np.random.Generator) -> List[str]:
+    """Pronounceable pseudo-words, so stop-word filtering and n-grams behave like text."""
+    consonants = list("bcdfghklmnprstvz")
+    vowels = list("aeiou")
+    words = set()
+    while len(words) < size:
+        n_syllables = rng.integers(2, 4)
+        words.add("".join(rng.choice(consonants) + rng.choice(vowels) for _ in range(n_syllables)))
+    return sorted(words)
+
+
+def generate_synthetic_curriculum(n_items: int, n_queries: int = 200, n_skills: int = 20,
+                                  words_per_item: int = 30, words_per_query: int = 6,
+                                  seed: int = 0) -> Tuple[List[Dict[str, Any]], List[Tuple[str, str, str]]]:
+    """Build n_items knowledge items plus labelled (query, skill, item_id) pairs.
+
+    Each skill draws from its own Zipf-weighted slice of the vocabulary; a
+    query is a handful of words sampled from one target item.
+    """
+    rng = np.random.default_rng(seed)
+    vocabulary = np.array(_make_vocabulary(max(2000, n_skills * 200), rng))
+    slices = np.array_split(np.arange(len(vocabulary)), n_skills)
+    skills = [f"skill_{s:03d}" for s in range(n_skills)]
+
+    items = []
+    for i in range(n_items):
+        s = int(rng.integers(n_skills))
+        pool = slices[s]
+        weights = 1.0 / np.arange(1, len(pool) + 1)
+        words = vocabulary[rng.choice(pool, size=words_per_item, p=weights / weights.sum())]
+        items.append({
+            "id": f"synthetic_{i:07d}",
+            "skill": skills[s],
+            "content": " ".join(words),
+            "facts": [" ".join(words[:8])],
+            "difficulty": float(rng.random()),
+            "prerequisite_skills": []
+        })
+
+    queries = []
+    for i in rng.choice(n_items, size=min(n_queries, n_items), replace=False):
+        words = items[i]["content"].split()
+        picked = rng.choice(len(words), size=min(words_per_query, len(words)), replace=False)
+        queries.append((" ".join(words[j] for j in sorted(picked)), items[i]["skill"], items[i]["id"]))
+
+    return items, queries
+
+
+def _measure_build(build: Callable[[], Any]) -> Tuple[Any, float, int]:
+    """Run a builder, returning (result, seconds, peak traced bytes)."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def _measure_queries(search: Callable[[str], List[Dict[str, Any]]],
+                     queries: List[Tuple[str, str, str]], top_k: int) -> Dict[str, Any]:
+    latencies = []
+    hits = 0
+    for query, _, target in queries:
+        start = time.perf_counter()
+        results = search(query)
+        latencies.append(time.perf_counter() - start)
+        hits += any(item["id"] == target for item in results[:top_k])
+
+    latencies_ms = np.array(latencies) * 1000.0
+    return {
+        "n_queries": len(queries),
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 4),
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 4),
+        f"recall@{top_k}": round(hits / float(len(queries)), 4),
+    }
+
+
+def run_benchmark(sizes: List[int], modes: List[str] = BENCHMARK_MODES, n_queries: int = 200,
+                  top_k: int = 10, seed: int = 0, workdir: str = None) -> Dict[str, Any]:
+    """Benchmark every mode at every corpus size; returns a JSON-serializable report."""
+    results = []
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        for n_items in sizes:
+            items, queries = generate_synthetic_curriculum(n_items, n_queries=n_queries, seed=seed)
+            kb = KnowledgeBase(os.path.join(tmp, f"bench_{n_items}.sqlite"))
+            _, ingest_seconds, _ = _measure_build(lambda: kb.add_knowledge_items(items))
+            del items
+
+            built: Dict[str, Any] = {}
+            for mode in modes:
+                row = {"n_items": n_items, "mode": mode, "ingest_seconds": round(ingest_seconds, 3)}
+
+                if mode == "sql":
+                    search = lambda q: kb.retrieve_by_query(q, limit=top_k)
+                    row.update(build_seconds=0.0, build_peak_bytes=0)
+                elif mode == "tfidf":
+                    # Caching is disabled so latency reflects the index, not repeats
+                    retriever, seconds, peak = _measure_build(lambda: KnowledgeRetriever(kb, cache_size=0))
+                    built["tfidf"] = retriever
+                    search = lambda q, r=retriever: r.retrieve_relevant_knowledge(q, top_k=top_k)
+                    row.update(build_seconds=round(seconds, 3), build_peak_bytes=peak)
+                elif mode == "dense":
+                    dense, seconds, peak = _measure_build(lambda: DenseRetriever(kb))
+                    built["dense"] = dense
+                    search = lambda q, d=dense: d.retrieve_relevant_knowledge(q, top_k=top_k)
+                    row.update(build_seconds=round(seconds, 3), build_peak_bytes=peak)
+                elif mode == "hybrid":
+                    dense = built.get("dense") or DenseRetriever(kb)
+                    retriever, seconds, peak = _measure_build(
+                        lambda: KnowledgeRetriever(kb, dense_retriever=dense, cache_size=0)
+                    )
+                    search = lambda q, r=retriever: r.retrieve_relevant_knowledge(q, top_k=top_k, mode="hybrid")
+                    row.update(build_seconds=round(seconds, 3), build_peak_bytes=peak)
+                else:
+                    raise ValueError(f"Unknown benchmark mode: {mode}")
+
+                row.update(_measure_queries(search, queries, top_k))
+                results.append(row)
+                print(json.dumps(row), file=sys.stderr)
+
+    return {
+        "meta": {
+            "created_at": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "seed": seed,
+            "top_k": top_k,
+        },
+        "results": results,
+    }
+
+
+def run_shard_scaling(sizes: List[int], shard_counts: List[int], n_queries: int = 200,
+                      batch_size: int = 50, top_k: int = 10, seed: int = 0,
+                      workdir: str = None) -> List[Dict[str, Any]]:
+    """Build and batch-query a ShardedRetriever at each shard count to see how it scales with cores.
+
+    Speedups are relative to the first shard count at the same corpus size;
+    they only mean something with at least that many free cores.
+    """
+    results = []
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        for n_items in sizes:
+            items, queries = generate_synthetic_curriculum(n_items, n_queries=n_queries, seed=seed)
+            kb = KnowledgeBase(os.path.join(tmp, f"shards_{n_items}.sqlite"))
+            kb.add_knowledge_items(items)
+            del items
+            texts = [query for query, _, _ in queries]
+
+            baseline = None
+            for num_shards in shard_counts:
+                start = time.perf_counter()
+                sharded = ShardedRetriever(kb, num_shards=num_shards)
+                build_seconds = time.perf_counter() - start
+                try:
+                    hits = 0
+                    start = time.perf_counter()
+                    for i in range(0, len(queries), batch_size):
+                        batch = sharded.retrieve_many(texts[i:i + batch_size], top_k=top_k)
+                        for results_for_query, (_, _, target) in zip(batch, queries[i:i + batch_size]):
+                            hits += any(item["id"] == target for item in results_for_query)
+                    query_seconds = time.perf_counter() - start
+                finally:
+                    sharded.close()
+
+                row = {
+                    "n_items": n_items,
+                    "num_shards": num_shards,
+                    "build_seconds": round(build_seconds, 3),
+                    "queries_per_second": round(len(queries) / query_seconds, 1),
+                    f"recall@{top_k}": round(hits / float(len(queries)), 4),
+                }
+                if baseline is None:
+                    baseline = row
+                row["build_speedup"] = round(baseline["build_seconds"] / max(build_seconds, 1e-9), 2)
+                row["query_speedup"] = round(row["queries_per_second"] / baseline["queries_per_second"], 2)
+                results.append(row)
+                print(json.dumps(row), file=sys.stderr)
+    return results
+
+
+def compare_reports(baseline: Dict[str, Any], current: Dict[str, Any],
+                    latency_tolerance: float = 0.2, recall_tolerance: float = 0.01) -> List[str]:
+    """List regressions between two reports: slower p99 or lower recall beyond tolerance."""
+    recall_key = f"recall@{current['meta']['top_k']}"
+    previous = {(r["n_items"], r["mode"]): r for r in baseline["results"]}
+    regressions = []
+    for row in current["results"]:
+        old = previous.get((row["n_items"], row["mode"]))
+        if old is None:
+            continue
+        label = f"{row['mode']}@{row['n_items']}"
+        if row["p99_ms"] > old["p99_ms"] * (1.0 + latency_tolerance):
+            regressions.append(f"{label}: p99 {old['p99_ms']}ms -> {row['p99_ms']}ms")
+        if recall_key in old and row[recall_key] < old[recall_key] - recall_tolerance:
+            regressions.append(f"{label}: {recall_key} {old[recall_key]} -> {row[recall_key]}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark knowledge retrieval on synthetic curricula.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000],
+                        help="Corpus sizes; add 1000000 for the full-scale run")
+    parser.add_argument("--modes", nargs="+", choices=BENCHMARK_MODES, default=list(BENCHMARK_MODES))
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="retrieval_benchmark.json")
+    parser.add_argument("--compare", default=None, help="Baseline report to check for regressions")
+    parser.add_argument("--shards", type=int, nargs="+", default=None,
+                        help="Also measure ShardedRetriever scaling at these shard counts, e.g. 1 2 4 8")
+    args = parser.parse_args()
+
+    report = run_benchmark(args.sizes, args.modes, n_queries=args.queries, top_k=args.top_k, seed=args.seed)
+    if args.shards:
+        report["shard_scaling"] = run_shard_scaling(
+            args.sizes, args.shards, n_queries=args.queries, top_k=args.top_k, seed=args.seed
+        )
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare_reports(json.load(f), report)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""Streaming ingestion of long-form curriculum into knowledge-base passages."""
+import argparse
+import re
+from collections import deque
+from pathlib import Path
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Union, TextIO
+
+from .knowledge_base import KnowledgeBase
+
+# Overlap never exceeds this share of the passage it is cut from
+MAX_OVERLAP_FRACTION = 0.5
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9(\"'])")
+
+# Cues that a sentence states a rule or definition rather than narrating
+_FACT_CUES = re.compile(
+    r"\b(is|are|means|equals|called|defined|always|never|must|can be|has|have)\b|=",
+    re.IGNORECASE
+)
+
+DEFAULT_SKILL_KEYWORDS = {
+    "algebra_simplification": ["like terms", "simplify", "coefficient", "expression", "combine"],
+    "linear_equations": ["equation", "isolate", "solve for", "inverse operation", "both sides"],
+    "fraction_operations": ["fraction", "numerator", "denominator", "reciprocal"],
+    "ratios": ["ratio", "proportion", "cross-multiply", "rate"],
+}
+
+
+def iter_sentences(lines: Iterable[str], max_chars: int = 2000) -> Iterator[str]:
+    """Yield sentences from a line stream, holding at most one partial sentence in memory."""
+    buffer = ""
+    for line in lines:
+        stripped = line.strip()
+        if not stripped:
+            # Blank line ends a paragraph, and with it any open sentence
+            if buffer:
+                yield buffer
+                buffer = ""
+            continue
+
+        buffer = f"{buffer} {stripped}" if buffer else stripped
+        parts = _SENTENCE_END.split(buffer)
+        for sentence in parts[:-1]:
+            yield sentence.strip()
+        buffer = parts[-1]
+
+        # Guard against unpunctuated text growing the buffer without bound
+        if len(buffer) > max_chars:
+            yield buffer
+            buffer = ""
+
+    if buffer:
+        yield buffer
+
+
+def chunk_sentences(sentences: Iterable[str], chunk_words: int = 120,
+                    overlap_words: int = 30) -> Iterator[List[str]]:
+    """Group sentences into passages of about chunk_words, overlapping by up to overlap_words.
+
+    The overlap is whole trailing sentences and is capped at
+    MAX_OVERLAP_FRACTION of the passage, so a long final sentence or an
+    overlap_words close to chunk_words cannot make passages mostly repeats.
+    """
+    window: deque = deque()
+    window_words = 0
+    fresh = False  # whether the window holds sentences not yet emitted
+
+    for sentence in sentences:
+        window.append(sentence)
+        window_words += len(sentence.split())
+        fresh = True
+        if window_words < chunk_words:
+            continue
+
+        yield list(window)
+        fresh = False
+
+        # Keep trailing sentences as overlap for the next passage, within the cap
+        budget = min(overlap_words, int(window_words * MAX_OVERLAP_FRACTION))
+        kept_words = 0
+        kept: deque = deque()
+        while window:
+            tail_words = len(window[-1].split())
+            if kept_words + tail_words > budget:
+                break
+            kept.appendleft(window.pop())
+            kept_words += tail_words
+        window, window_words = kept, kept_words
+
+    if fresh and window:
+        yield list(window)
+
+
+def extract_facts(sentences: List[str], max_facts: int = 5) -> List[str]:
+    """Pick declarative, rule-like sentences of reasonable length as facts."""
+    facts = []
+    for sentence in sentences:
+        words = len(sentence.split())
+        if sentence.endswith("?") or not 5 <= words <= 40:
+            continue
+        if _FACT_CUES.search(sentence):
+            facts.append(sentence.rstrip("."))
+            if len(facts) >= max_facts:
+                break
+    return facts
+
+
+class SkillTagger:
+    """Tag a passage with the skill whose keywords it mentions most."""
+
+    def __init__(self, skill_keywords: Optional[Dict[str, List[str]]] = None,
+                 default_skill: str = "general"):
+        keywords = skill_keywords or DEFAULT_SKILL_KEYWORDS
+        self.default_skill = default_skill
+        self.patterns = {
+            skill: re.compile("|".join(re.escape(k) for k in words), re.IGNORECASE)
+            for skill, words in keywords.items()
+        }
+
+    def tag(self, text: str) -> str:
+        best_skill, best_hits = self.default_skill, 0
+        for skill, pattern in self.patterns.items():
+            hits = len(pattern.findall(text))
+            if hits > best_hits:
+                best_skill, best_hits = skill, hits
+        return best_skill
+
+
+def chunk_document(lines: Iterable[str], doc_id: str, skill: Optional[str] = None,
+                   tagger: Optional[SkillTagger] = None, chunk_words: int = 120,
+                   overlap_words: int = 30, difficulty: float = 0.5) -> Iterator[Dict[str, Any]]:
+    """Turn a line stream into knowledge items, one passage at a time.
+
+    A fixed skill applies to every passage; otherwise each passage is tagged
+    by keyword.
+    """
+    tagger = tagger or SkillTagger()
+    sentences = iter_sentences(lines)
+    for n, passage in enumerate(chunk_sentences(sentences, chunk_words, overlap_words)):
+        content = " ".join(passage)
+        yield {
+            "id": f"{doc_id}_{n:05d}",
+            "skill": skill or tagger.tag(content),
+            "content": content,
+            "facts": extract_facts(passage),
+            "difficulty": difficulty,
+            "prerequisite_skills": []
+        }
+
+
+def ingest_document(kb: KnowledgeBase, source: Union[str, Path, TextIO], doc_id: Optional[str] = None,
+                    batch_size: int = 500, **chunk_options) -> int:
+    """Stream a document from a path or open file into the knowledge base; returns passages written."""
+    if isinstance(source, (str, Path)):
+        path = Path(source)
+        with open(path, encoding="utf-8") as handle:
+            return kb.add_knowledge_items(
+                chunk_document(handle, doc_id or path.stem, **chunk_options), batch_size=batch_size
+            )
+
+    if doc_id is None:
+        raise ValueError("doc_id is required when ingesting from a file object")
+    return kb.add_knowledge_items(chunk_document(source, doc_id, **chunk_options), batch_size=batch_size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chunk curriculum documents into the knowledge base.")
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("--db", default="knowledge_base.sqlite")
+    parser.add_argument("--skill", default=None, help="Fixed skill for every passage (default: keyword tagging)")
+    parser.add_argument("--chunk-words", type=int, default=120)
+    parser.add_argument("--overlap-words", type=int, default=30)
+    parser.add_argument("--difficulty", type=float, default=0.5)
+    args = parser.parse_args()
+
+    kb = KnowledgeBase(args.db)
+    for path in args.paths:
+        written = ingest_document(
+            kb, path,
+            skill=args.skill,
+            chunk_words=args.chunk_words,
+            overlap_words=args.overlap_words,
+            difficulty=args.difficulty
+        )
+        print(f"{path}: {written} passages")
+
+
+if __name__ == "__main__":
+    main()
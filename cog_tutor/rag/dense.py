@@ -0,0 +1,473 @@
+"""Dense embedding retrieval backed by a pure-NumPy IVF approximate-nearest-neighbour index."""
+import argparse
+import json
+import threading
+import time
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer
+
+from .knowledge_base import KnowledgeBase
+from .retriever import item_text
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize rows in place so dot products are cosine similarities."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    vectors /= norms
+    return vectors
+
+
+class HashingEncoder:
+    """Dependency-free CPU encoder: signed feature hashing of word and character n-grams."""
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+        self.word_vectorizer = HashingVectorizer(
+            n_features=dim, ngram_range=(1, 2), stop_words='english',
+            alternate_sign=True, norm=None
+        )
+        self.char_vectorizer = HashingVectorizer(
+            n_features=dim, analyzer='char_wb', ngram_range=(3, 4),
+            alternate_sign=True, norm=None
+        )
+
+    def encode(self, texts: List[str], batch_size: int = 256) -> np.ndarray:
+        """Encode texts into unit-length float32 vectors."""
+        embeddings = np.empty((len(texts), self.dim), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            batch = texts[start:start + batch_size]
+            # Whole words carry more meaning than character fragments
+            hashed = 2.0 * self.word_vectorizer.transform(batch) + self.char_vectorizer.transform(batch)
+            embeddings[start:start + len(batch)] = hashed.toarray()
+        return _normalize(embeddings)
+
+
+class SentenceTransformerEncoder:
+    """Small local sentence-transformers model (MiniLM by default) running on CPU."""
+
+    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2", device: str = "cpu"):
+        # Store model name for lazy initialization
+        self.model_name = model_name
+        self.device = device
+        self.model = None
+
+    def _initialize_model(self):
+        if self.model is None:
+            from sentence_transformers import SentenceTransformer
+            self.model = SentenceTransformer(self.model_name, device=self.device)
+
+    @property
+    def dim(self) -> int:
+        self._initialize_model()
+        return self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts: List[str], batch_size: int = 64) -> np.ndarray:
+        """Encode texts into unit-length float32 vectors."""
+        self._initialize_model()
+        embeddings = self.model.encode(
+            texts,
+            batch_size=batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True
+        )
+        return embeddings.astype(np.float32)
+
+
+def load_default_encoder():
+    """Use sentence-transformers when it is installed, otherwise the hashing encoder."""
+    try:
+        import sentence_transformers  # noqa: F401
+    except ImportError:
+        return HashingEncoder()
+    return SentenceTransformerEncoder()
+
+
+class QuantizedVectors:
+    """Append-only vector store kept as float16 or int8 with per-row scales."""
+
+    def __init__(self, dim: int, storage: str = "int8"):
+        if storage not in ("int8", "float16"):
+            raise ValueError(f"Unknown storage type: {storage}")
+        self.dim = dim
+        self.storage = storage
+        self.data = np.empty((0, dim), dtype=np.int8 if storage == "int8" else np.float16)
+        self.scales = np.empty(0, dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes + self.scales.nbytes
+
+    def encode_block(self, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Quantize a block of float vectors without storing it."""
+        if self.storage == "float16":
+            return vectors.astype(np.float16), np.ones(len(vectors), dtype=np.float32)
+
+        # Symmetric per-row int8: x ~= q * scale with q in [-127, 127]
+        peaks = np.abs(vectors).max(axis=1)
+        peaks[peaks == 0] = 1.0
+        quantized = np.round(vectors / peaks[:, None] * 127.0).astype(np.int8)
+        return quantized, (peaks / 127.0).astype(np.float32)
+
+    def replace(self, data: np.ndarray, scales: np.ndarray):
+        """Swap in an already quantized layout."""
+        self.data = data
+        self.scales = scales
+
+    def scores(self, start: int, stop: int, queries: np.ndarray) -> np.ndarray:
+        """Dot products of queries (m, dim) against stored rows [start, stop)."""
+        block = self.data[start:stop].astype(np.float32)
+        return (queries @ block.T) * self.scales[start:stop]
+
+
+def default_nlist(n_items: int) -> int:
+    """Number of IVF lists: about sqrt(n), and a single list for tiny corpora."""
+    if n_items < 1000:
+        return 1
+    return int(np.sqrt(n_items))
+
+
+class IVFIndex:
+    """Inverted-file ANN index: spherical k-means lists searched with nprobe.
+
+    Added batches are folded into the list-contiguous layout on the next
+    read, under a lock, so concurrent first searches cannot merge the same
+    batch twice. Searches may run concurrently with each other, but not with
+    add(); DenseRetriever finishes adding before it serves any query.
+    """
+
+    def __init__(self, dim: int, nlist: int = 1, nprobe: int = 8, storage: str = "int8",
+                 n_iter: int = 10, seed: int = 0):
+        self.dim = dim
+        self.nlist = max(1, nlist)
+        self.nprobe = nprobe
+        self.n_iter = n_iter
+        self.seed = seed
+        self.centroids = np.zeros((self.nlist, dim), dtype=np.float32)
+        self.vectors = QuantizedVectors(dim, storage)
+
+        # Rows are kept grouped by list; ids map a stored row back to its insert order
+        self.ids = np.empty(0, dtype=np.int64)
+        self.positions = np.empty(0, dtype=np.int64)
+        self.offsets = np.zeros(self.nlist + 1, dtype=np.int64)
+        self._pending: List[Tuple[np.ndarray, np.ndarray, np.ndarray]] = []
+        self._pending_ids: List[np.ndarray] = []
+        self._layout_lock = threading.Lock()
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def train(self, sample: np.ndarray):
+        """Fit list centroids on a sample of unit vectors."""
+        sample = np.asarray(sample, dtype=np.float32)
+        rng = np.random.default_rng(self.seed)
+        if len(sample) == 0:
+            return
+        if self.nlist >= len(sample):
+            self.nlist = len(sample)
+            self.centroids = sample.copy()
+            self.offsets = np.zeros(self.nlist + 1, dtype=np.int64)
+            return
+
+        centroids = sample[rng.choice(len(sample), self.nlist, replace=False)].copy()
+        for _ in range(self.n_iter):
+            assignments = self._assign(sample, centroids)
+            membership = sparse.csr_matrix(
+                (np.ones(len(sample), dtype=np.float32), (assignments, np.arange(len(sample)))),
+                shape=(self.nlist, len(sample))
+            )
+            sums = np.asarray(membership @ sample)
+
+            # Re-seed empty lists from random sample points
+            empty = np.flatnonzero(np.bincount(assignments, minlength=self.nlist) == 0)
+            if len(empty):
+                sums[empty] = sample[rng.choice(len(sample), len(empty), replace=False)]
+            centroids = _normalize(sums.astype(np.float32))
+
+        self.centroids = centroids
+
+    def _assign(self, vectors: np.ndarray, centroids: np.ndarray, block_size: int = 8192) -> np.ndarray:
+        """Nearest centroid (max inner product) per vector."""
+        assignments = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), block_size):
+            block = vectors[start:start + block_size]
+            assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        return assignments
+
+    def add(self, vectors: np.ndarray) -> np.ndarray:
+        """Quantize and add a batch of unit vectors; returns their ids."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        ids = np.arange(self._size, self._size + len(vectors), dtype=np.int64)
+        data, scales = self.vectors.encode_block(vectors)
+        with self._layout_lock:
+            self._pending.append((self._assign(vectors, self.centroids), data, scales))
+            self._pending_ids.append(ids)
+            self._size += len(vectors)
+        return ids
+
+    def _ensure_layout(self):
+        """Fold pending batches into the list-contiguous layout."""
+        if not self._pending:
+            return
+        with self._layout_lock:
+            # Another reader may have folded them in while we waited
+            if self._pending:
+                self._fold_pending()
+
+    def _fold_pending(self):
+        """Merge pending batches with the stored rows; called with the layout lock held."""
+        # Recover the list of every stored row, then merge with the pending rows
+        stored_lists = np.repeat(np.arange(self.nlist), np.diff(self.offsets))
+        lists = np.concatenate([stored_lists] + [p[0] for p in self._pending])
+        data = np.concatenate([self.vectors.data] + [p[1] for p in self._pending])
+        scales = np.concatenate([self.vectors.scales] + [p[2] for p in self._pending])
+        ids = np.concatenate([self.ids] + self._pending_ids)
+
+        order = np.argsort(lists, kind="stable")
+        self.vectors.replace(data[order], scales[order])
+        positions = np.empty_like(ids)
+        positions[ids[order]] = np.arange(len(ids))
+        self.ids = ids[order]
+        self.positions = positions
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(lists, minlength=self.nlist))])
+        self._pending = []
+        self._pending_ids = []
+
+    def search(self, queries: np.ndarray, top_k: int, nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Approximate top-k by inner product; ids are -1 where fewer than k were found."""
+        self._ensure_layout()
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+
+        top_scores = np.full((len(queries), top_k), -np.inf, dtype=np.float32)
+        top_ids = np.full((len(queries), top_k), -1, dtype=np.int64)
+        if self._size == 0 or top_k <= 0:
+            return top_scores, top_ids
+
+        # Pick the nprobe closest lists for every query at once
+        centroid_scores = queries @ self.centroids.T
+        if nprobe < self.nlist:
+            probes = np.argpartition(-centroid_scores, nprobe - 1, axis=1)[:, :nprobe]
+        else:
+            probes = np.tile(np.arange(self.nlist), (len(queries), 1))
+
+        for i, query in enumerate(queries):
+            scores = []
+            ids = []
+            for lst in probes[i]:
+                start, stop = self.offsets[lst], self.offsets[lst + 1]
+                if start == stop:
+                    continue
+                scores.append(self.vectors.scores(start, stop, query[None, :])[0])
+                ids.append(self.ids[start:stop])
+            if not scores:
+                continue
+            self._write_top_k(np.concatenate(scores), np.concatenate(ids), top_scores[i], top_ids[i])
+
+        return top_scores, top_ids
+
+    def score_ids(self, query: np.ndarray, ids: np.ndarray) -> np.ndarray:
+        """Exact scores of one query against a subset of ids; cost scales with the subset."""
+        self._ensure_layout()
+        positions = self.positions[np.asarray(ids, dtype=np.int64)]
+        block = self.vectors.data[positions].astype(np.float32)
+        return (block @ np.asarray(query, dtype=np.float32)) * self.vectors.scales[positions]
+
+    def exact_search(self, queries: np.ndarray, top_k: int, block_size: int = 65536) -> Tuple[np.ndarray, np.ndarray]:
+        """Brute-force top-k over every stored vector, for recall measurement."""
+        self._ensure_layout()
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        top_scores = np.full((len(queries), top_k), -np.inf, dtype=np.float32)
+        top_ids = np.full((len(queries), top_k), -1, dtype=np.int64)
+
+        for start in range(0, self._size, block_size):
+            stop = min(start + block_size, self._size)
+            block_scores = self.vectors.scores(start, stop, queries)
+            block_ids = self.ids[start:stop]
+            for i in range(len(queries)):
+                # Merge the running top-k with this block's candidates
+                self._write_top_k(
+                    np.concatenate([top_scores[i], block_scores[i]]),
+                    np.concatenate([top_ids[i], block_ids]),
+                    top_scores[i], top_ids[i]
+                )
+
+        return top_scores, top_ids
+
+    @staticmethod
+    def _write_top_k(scores: np.ndarray, ids: np.ndarray, out_scores: np.ndarray, out_ids: np.ndarray):
+        """Write the best len(out_scores) candidates into the output rows, best first."""
+        k = min(len(out_scores), len(scores))
+        if k < len(scores):
+            keep = np.argpartition(-scores, k - 1)[:k]
+        else:
+            keep = np.arange(len(scores))
+        keep = keep[np.argsort(-scores[keep], kind="stable")]
+        out_scores[:k] = scores[keep]
+        out_ids[:k] = ids[keep]
+        out_scores[k:] = -np.inf
+        out_ids[k:] = -1
+
+
+class DenseRetriever:
+    """Embedding-based retrieval over the knowledge base."""
+
+    def __init__(self, knowledge_base: KnowledgeBase, encoder=None, storage: str = "int8",
+                 nlist: Optional[int] = None, nprobe: int = 8, batch_size: int = 256,
+                 min_score: float = 0.1):
+        self.kb = knowledge_base
+        self.encoder = encoder or load_default_encoder()
+        self.storage = storage
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.batch_size = batch_size
+        self.min_score = min_score
+        self._build_index()
+
+    def _build_index(self):
+        """Embed the knowledge base in batches and build the IVF index."""
+        self.all_items = self.kb.get_all_items()
+        corpus = [item_text(item) for item in self.all_items]
+
+        nlist = self.nlist or default_nlist(len(corpus))
+        self.index = IVFIndex(self.encoder.dim, nlist=nlist, nprobe=self.nprobe, storage=self.storage)
+        if not corpus:
+            return
+
+        # Train on a leading sample, then stream the remaining batches into compact storage
+        train_size = min(len(corpus), max(40 * nlist, self.batch_size))
+        sample = self.encoder.encode(corpus[:train_size], batch_size=self.batch_size)
+        self.index.train(sample)
+        self.index.add(sample)
+        del sample
+
+        for start in range(train_size, len(corpus), self.batch_size):
+            batch = corpus[start:start + self.batch_size]
+            self.index.add(self.encoder.encode(batch, batch_size=self.batch_size))
+        # Lay the index out now, so concurrent queries only ever read it
+        self.index._ensure_layout()
+
+    def reindexed(self) -> "DenseRetriever":
+        """A new retriever with the same settings over the current knowledge base."""
+        return DenseRetriever(
+            self.kb, encoder=self.encoder, storage=self.storage, nlist=self.nlist,
+            nprobe=self.nprobe, batch_size=self.batch_size, min_score=self.min_score
+        )
+
+    def search(self, queries: List[str], top_k: int = 3) -> Tuple[np.ndarray, np.ndarray]:
+        """Raw (scores, row ids) for a batch of queries."""
+        query_vectors = self.encoder.encode(list(queries), batch_size=self.batch_size)
+        return self.index.search(query_vectors, top_k)
+
+    def score_rows(self, query: str, rows: np.ndarray) -> np.ndarray:
+        """Exact dense scores for a subset of rows, e.g. one skill's posting list."""
+        query_vector = self.encoder.encode([query], batch_size=self.batch_size)[0]
+        return self.index.score_ids(query_vector, rows)
+
+    def retrieve_many(self, queries: List[str], top_k: int = 3) -> List[List[Dict[str, Any]]]:
+        """Retrieve relevant knowledge items for a batch of queries."""
+        if not queries or not self.all_items:
+            return [[] for _ in queries]
+
+        scores, rows = self.search(queries, top_k)
+        results = []
+        for row_scores, row_ids in zip(scores, rows):
+            items = []
+            for score, idx in zip(row_scores, row_ids):
+                if idx >= 0 and score > self.min_score:
+                    item = self.all_items[idx].copy()
+                    item["relevance_score"] = float(score)
+                    items.append(item)
+            results.append(items)
+        return results
+
+    def retrieve_relevant_knowledge(self, query: str, top_k: int = 3) -> List[Dict[str, Any]]:
+        """Retrieve relevant knowledge items for a query."""
+        return self.retrieve_many([query], top_k=top_k)[0]
+
+
+def synthetic_embeddings(n_items: int, dim: int, n_clusters: int = 1000, noise: float = 1.0,
+                         seed: int = 0, chunk_size: int = 65536):
+    """Yield clustered unit vectors in chunks, so large benchmarks never hold float32 copies."""
+    rng = np.random.default_rng(seed)
+    centers = _normalize(rng.standard_normal((n_clusters, dim)).astype(np.float32))
+    for start in range(0, n_items, chunk_size):
+        size = min(chunk_size, n_items - start)
+        labels = rng.integers(0, n_clusters, size)
+        points = centers[labels] + noise / np.sqrt(dim) * rng.standard_normal((size, dim)).astype(np.float32)
+        yield _normalize(points)
+
+
+def benchmark_ivf(n_items: int, dim: int = 128, n_queries: int = 200, top_k: int = 10,
+                  nlist: Optional[int] = None, nprobe: int = 16, storage: str = "int8",
+                  seed: int = 0) -> Dict[str, Any]:
+    """Measure IVF recall@k against exact search, and queries/sec for both."""
+    nlist = nlist or default_nlist(n_items)
+    index = IVFIndex(dim, nlist=nlist, nprobe=nprobe, storage=storage, seed=seed)
+
+    build_start = time.perf_counter()
+    chunks = synthetic_embeddings(n_items, dim, seed=seed)
+    first = next(chunks)
+    index.train(first[:max(40 * nlist, 1)])
+    index.add(first)
+    for chunk in chunks:
+        index.add(chunk)
+    index.search(first[:1], top_k)  # finalize the layout inside the timed build
+    build_seconds = time.perf_counter() - build_start
+
+    # Queries are perturbed corpus points, so every query has true neighbours
+    rng = np.random.default_rng(seed + 1)
+    queries = first[rng.choice(len(first), min(n_queries, len(first)), replace=False)]
+    queries = _normalize(queries + 0.1 / np.sqrt(dim) * rng.standard_normal(queries.shape).astype(np.float32))
+
+    start = time.perf_counter()
+    _, ann_ids = index.search(queries, top_k)
+    ann_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    _, exact_ids = index.exact_search(queries, top_k)
+    exact_seconds = time.perf_counter() - start
+
+    hits = sum(len(np.intersect1d(a[a >= 0], e[e >= 0])) for a, e in zip(ann_ids, exact_ids))
+    return {
+        "n_items": n_items,
+        "dim": dim,
+        "storage": storage,
+        "nlist": index.nlist,
+        "nprobe": nprobe,
+        "top_k": top_k,
+        "build_seconds": round(build_seconds, 3),
+        "index_bytes": int(index.vectors.nbytes + index.ids.nbytes + index.centroids.nbytes),
+        f"recall@{top_k}": round(hits / float(len(queries) * top_k), 4),
+        "ann_qps": round(len(queries) / ann_seconds, 1),
+        "exact_qps": round(len(queries) / exact_seconds, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the IVF index against exact search.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=128)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, default=16)
+    parser.add_argument("--storage", choices=["int8", "float16"], default="int8")
+    args = parser.parse_args()
+
+    results = [
+        benchmark_ivf(n, dim=args.dim, n_queries=args.queries, top_k=args.top_k,
+                      nprobe=args.nprobe, storage=args.storage)
+        for n in args.sizes
+    ]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
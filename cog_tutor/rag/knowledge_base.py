@@ -1,9 +1,35 @@
 import json
 import hashlib
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterable
 from pathlib import Path
 import sqlite3
 
+def read_items(db_path: str, part: int = 0, parts: int = 1) -> List[Dict[str, Any]]:
+    """Knowledge items in rowid order; with parts > 1, only those whose rowid % parts == part.
+    
+    Takes a path rather than a KnowledgeBase so index workers can read their
+    own partition without re-running the schema and sample-content setup.
+    """
+    with sqlite3.connect(db_path) as conn:
+        conn.row_factory = sqlite3.Row
+        if parts > 1:
+            cursor = conn.execute(
+                "SELECT * FROM knowledge_items WHERE rowid % ? = ? ORDER BY rowid", (parts, part)
+            )
+        else:
+            cursor = conn.execute("SELECT * FROM knowledge_items ORDER BY rowid")
+        
+        results = []
+        for row in cursor.fetchall():
+            results.append({
+                "id": row["id"],
+                "skill": row["skill"],
+                "content": row["content"],
+                "facts": json.loads(row["facts"]),
+                "difficulty": row["difficulty"]
+            })
+        return results
+
 class KnowledgeBase:
     """Knowledge base for educational content with fact-grounded explanations."""
     
@@ -156,6 +182,10 @@ class KnowledgeBase:
                 })
             return results
     
+    def get_all_items(self) -> List[Dict[str, Any]]:
+        """Load every knowledge item, in rowid order, for index building."""
+        return read_items(self.db_path)
+    
     def add_knowledge_item(self, item: Dict[str, Any]):
         """Add a new knowledge item to the database."""
         with sqlite3.connect(self.db_path) as conn:
@@ -171,3 +201,37 @@ class KnowledgeBase:
                 item["difficulty"],
                 json.dumps(item.get("prerequisite_skills", []))
             ))
+    
+    def add_knowledge_items(self, items: Iterable[Dict[str, Any]], batch_size: int = 500) -> int:
+        """Bulk-insert knowledge items, one transaction per batch; returns the count written."""
+        def to_row(item: Dict[str, Any]):
+            return (
+                item["id"],
+                item["skill"],
+                item["content"],
+                json.dumps(item["facts"]),
+                item.get("difficulty", 0.5),
+                json.dumps(item.get("prerequisite_skills", []))
+            )
+        
+        written = 0
+        batch = []
+        with sqlite3.connect(self.db_path) as conn:
+            for item in items:
+                batch.append(to_row(item))
+                if len(batch) >= batch_size:
+                    written += self._write_batch(conn, batch)
+                    batch = []
+            if batch:
+                written += self._write_batch(conn, batch)
+        return written
+    
+    @staticmethod
+    def _write_batch(conn: sqlite3.Connection, rows: List[tuple]) -> int:
+        conn.executemany("""
+            INSERT OR REPLACE INTO knowledge_items 
+            (id, skill, content, facts, difficulty, prerequisite_skills)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, rows)
+        conn.commit()
+        return len(rows)
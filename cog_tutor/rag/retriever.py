@@ -1,80 +1,435 @@
 import hashlib
+import logging
+import re
 import sqlite3
-from typing import List, Dict, Any, Tuple
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Dict, Any, Tuple, Optional
 from .knowledge_base import KnowledgeBase
 import numpy as np
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+
+logger = logging.getLogger(__name__)
+
+RETRIEVAL_MODES = ("tfidf", "dense", "hybrid")
+DIFFICULTY_BANDS = 5
+
+def item_text(item: Dict[str, Any]) -> str:
+    """Flatten a knowledge item into the text that gets indexed."""
+    return f"{item['skill']} {item['content']} {' '.join(item['facts'])}"
+
+def difficulty_band(difficulty: float) -> int:
+    """Bucket a 0-1 difficulty into one of DIFFICULTY_BANDS equal-width bands."""
+    return int(np.clip(int(difficulty * DIFFICULTY_BANDS), 0, DIFFICULTY_BANDS - 1))
+
+def _posting_lists(keys) -> Dict[Any, np.ndarray]:
+    """Map each key to the sorted array of rows carrying it."""
+    postings: Dict[Any, List[int]] = {}
+    for row, key in enumerate(keys):
+        postings.setdefault(key, []).append(row)
+    return {key: np.array(rows, dtype=np.int64) for key, rows in postings.items()}
+
+def normalize_query(query: str) -> str:
+    """Canonical cache key for a query: lower-cased with collapsed whitespace."""
+    return re.sub(r"\s+", " ", query.strip().lower())
+
+def reciprocal_rank_fusion(rankings: List[List[int]], k: int = 60) -> List[Tuple[int, float]]:
+    """Fuse ranked id lists: score(d) = sum over lists of 1 / (k + rank(d))."""
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking, start=1):
+            fused[row] = fused.get(row, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda pair: pair[1], reverse=True)
+
+class QueryCache:
+    """Thread-safe bounded LRU of normalized query -> ranked (row, score[, fused score]) tuples."""
+    
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self._entries: "OrderedDict[Tuple, List[Tuple]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key: Tuple) -> Optional[List[Tuple]]:
+        with self._lock:
+            ranked = self._entries.get(key)
+            if ranked is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return ranked
+    
+    def put(self, key: Tuple, ranked: List[Tuple]):
+        with self._lock:
+            self._entries[key] = ranked
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class RetrievalIndex:
+    """Immutable snapshot of everything a lookup reads: vocabulary, matrix, items, postings.
+    
+    Readers take one reference to the current snapshot and use only that, so
+    a rebuild can publish a new snapshot with a single attribute assignment.
+    """
+    
+    def __init__(self, version: int, items: List[Dict[str, Any]], vectorizer: TfidfVectorizer, dense=None):
+        self.version = version
+        self.all_items = items
+        self.row_by_id = {item["id"]: row for row, item in enumerate(items)}
+        self.vectorizer = vectorizer
+        
+        # Build corpus for vectorization
+        corpus = [item_text(item) for item in items]
+        
+        # Fit vectorizer
+        self.tfidf_matrix = vectorizer.fit_transform(corpus) if corpus else None
+        
+        # Posting lists over matrix rows, so filtered search only touches the subset
+        self.skill_rows = _posting_lists(item["skill"] for item in items)
+        self.band_rows = _posting_lists(difficulty_band(item["difficulty"]) for item in items)
+        self.skill_subsets: Dict[str, np.ndarray] = {}
+        
+        self.dense = None
+        self.dense_rows = None
+        if dense is not None:
+            self.attach_dense(dense)
+    
+    def attach_dense(self, dense):
+        """Pair a dense retriever with this snapshot and map our rows onto its rows."""
+        dense_row_by_id = {item["id"]: row for row, item in enumerate(dense.all_items)}
+        self.dense_rows = np.array(
+            [dense_row_by_id.get(item["id"], -1) for item in self.all_items], dtype=np.int64
+        )
+        self.dense = dense
 
 class KnowledgeRetriever:
-    """Retrieval-augmented generation system for educational content."""
+    """Retrieval-augmented generation system for educational content.
+    
+    Safe for concurrent readers: lookups never block on rebuilds, which build a
+    fresh RetrievalIndex from a knowledge-base snapshot and swap it in atomically.
+    """
     
-    def __init__(self, knowledge_base: KnowledgeBase):
+    def __init__(self, knowledge_base: KnowledgeBase, dense_retriever=None,
+                 cache_size: int = 1024, candidate_depth: int = 20, min_score: float = 0.1):
         self.kb = knowledge_base
-        self.vectorizer = TfidfVectorizer(
+        self.candidate_depth = candidate_depth
+        self.min_score = min_score
+        self.query_cache = QueryCache(cache_size)
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="retrieval")
+        self._rebuild_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="retrieval-rebuild")
+        self._rebuild_lock = threading.Lock()
+        self._dense_lock = threading.Lock()
+        self._watch_stop: Optional[threading.Event] = None
+        self._index: Optional[RetrievalIndex] = None
+        
+        # Dense side of hybrid search; built lazily on first use if not supplied
+        self._index = self._build_index(dense_retriever)
+    
+    @staticmethod
+    def _make_vectorizer() -> TfidfVectorizer:
+        return TfidfVectorizer(
             stop_words='english',
             ngram_range=(1, 2),
             max_features=1000
         )
-        self._build_index()
-    
-    def _build_index(self):
-        """Build TF-IDF index for semantic search."""
-        # Get all knowledge items
-        all_items = []
-        with sqlite3.connect(self.kb.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.execute("SELECT * FROM knowledge_items")
-            for row in cursor.fetchall():
-                all_items.append({
-                    "id": row["id"],
-                    "skill": row["skill"],
-                    "content": row["content"],
-                    "facts": eval(row["facts"]),
-                    "difficulty": row["difficulty"]
-                })
-        
-        self.all_items = all_items
+    
+    def _build_index(self, dense_retriever=None) -> RetrievalIndex:
+        """Build a TF-IDF snapshot of the knowledge base for semantic search."""
+        version = self._index.version + 1 if self._index else 0
+        return RetrievalIndex(version, self.kb.get_all_items(), self._make_vectorizer(), dense_retriever)
+    
+    # Read-only views of the current snapshot
+    
+    @property
+    def index(self) -> RetrievalIndex:
+        return self._index
+    
+    @property
+    def all_items(self) -> List[Dict[str, Any]]:
+        return self._index.all_items
+    
+    @property
+    def vectorizer(self) -> TfidfVectorizer:
+        return self._index.vectorizer
+    
+    @property
+    def tfidf_matrix(self):
+        return self._index.tfidf_matrix
+    
+    @property
+    def dense_retriever(self):
+        return self._index.dense
+    
+    # Rebuilds
+    
+    def rebuild(self) -> RetrievalIndex:
+        """Rebuild from the current knowledge base and publish the new snapshot."""
+        with self._rebuild_lock:
+            current = self._index
+            dense = current.dense.reindexed() if current.dense is not None else None
+            fresh = self._build_index(dense)
+            
+            # Single reference assignment: readers see either the old or the new index
+            self._index = fresh
         
-        # Build corpus for vectorization
-        corpus = []
-        for item in self.all_items:
-            text = f"{item['skill']} {item['content']} {' '.join(item['facts'])}"
-            corpus.append(text)
+        # Cache keys carry the index version, so stale entries simply age out
+        return fresh
+    
+    def rebuild_async(self) -> Future:
+        """Rebuild on a background thread; lookups keep using the old index meanwhile."""
+        return self._rebuild_executor.submit(self.rebuild)
+    
+    def watch(self, interval: float = 2.0):
+        """Poll the knowledge-base file and rebuild in the background when it changes."""
+        if self._watch_stop is not None:
+            return
+        self._watch_stop = threading.Event()
+        # PRAGMA data_version changes whenever another connection commits; read
+        # the starting value now so commits made right after watch() are seen
+        conn = sqlite3.connect(self.kb.db_path, check_same_thread=False)
+        last_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        threading.Thread(
+            target=self._watch_loop, args=(self._watch_stop, interval, conn, last_version),
+            name="retrieval-watch", daemon=True
+        ).start()
+    
+    def stop_watching(self):
+        if self._watch_stop is not None:
+            self._watch_stop.set()
+            self._watch_stop = None
+    
+    def _watch_loop(self, stop: threading.Event, interval: float,
+                    conn: sqlite3.Connection, last_version: int):
+        try:
+            while not stop.wait(interval):
+                try:
+                    version = conn.execute("PRAGMA data_version").fetchone()[0]
+                    if version != last_version:
+                        self.rebuild_async().result()
+                        last_version = version
+                except Exception:
+                    # Keep serving the old index and retry on the next poll
+                    logger.exception("Knowledge-base rebuild failed; still watching %s", self.kb.db_path)
+        finally:
+            conn.close()
+    
+    def close(self):
+        """Stop watching and shut down background threads."""
+        self.stop_watching()
+        self._rebuild_executor.shutdown(wait=True)
+        self._executor.shutdown(wait=False)
+    
+    # Lookups
+    
+    def retrieve_relevant_knowledge(self, query: str, skill: str = None, top_k: int = 3,
+                                    mode: str = "tfidf", band: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Retrieve relevant knowledge items for a query.
         
-        # Fit vectorizer
-        self.tfidf_matrix = self.vectorizer.fit_transform(corpus)
+        mode is "tfidf" (lexical), "dense" (embeddings) or "hybrid" (both, fused
+        with reciprocal-rank fusion). relevance_score is always a cosine
+        similarity; in hybrid mode it is the higher of the item's TF-IDF and
+        dense scores, and the RRF score that orders the results is in
+        fused_score. Rankings are cached per normalized query.
+        With skill and/or band (see difficulty_band), matching rows rank first;
+        when fewer than top_k of them clear the relevance threshold, the list
+        is topped up from a search over everything.
+        """
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode: {mode}")
+        
+        index = self._index
+        if not index.all_items:
+            return []
+        
+        rows = self._filter_rows(index, skill, band)
+        if rows is not None and len(rows) == 0:
+            rows = None
+            skill, band = None, None
+        
+        # Rankings are cached at a fixed depth so any top_k up to it is a prefix
+        depth = max(top_k, self.candidate_depth)
+        key = (index.version, mode, normalize_query(query), depth, skill, band)
+        ranked = self.query_cache.get(key)
+        if ranked is None:
+            ranked = self._rank(index, query, mode, depth, rows)
+            self.query_cache.put(key, ranked)
+        
+        return [self._scored_item(index, *ranked_row) for ranked_row in ranked[:top_k]]
     
-    def retrieve_relevant_knowledge(self, query: str, skill: str = None, top_k: int = 3) -> List[Dict[str, Any]]:
-        """Retrieve relevant knowledge items for a query."""
-        # If skill is specified, prioritize skill-specific items
+    def _filter_rows(self, index: RetrievalIndex, skill: Optional[str],
+                     band: Optional[int]) -> Optional[np.ndarray]:
+        """Rows matching the skill and difficulty band, or None when unfiltered."""
+        rows = None
         if skill:
-            skill_items = self.kb.retrieve_by_skill(skill, limit=top_k)
-            if len(skill_items) >= top_k:
-                return skill_items[:top_k]
+            rows = self._skill_subset(index, skill)
+        if band is not None:
+            band_rows = index.band_rows.get(band, np.empty(0, dtype=np.int64))
+            rows = band_rows if rows is None else np.intersect1d(rows, band_rows, assume_unique=True)
+        return rows
+    
+    @staticmethod
+    def _skill_subset(index: RetrievalIndex, skill: str) -> np.ndarray:
+        """Rows for a skill; like retrieve_by_skill, substring matches count too."""
+        subset = index.skill_subsets.get(skill)
+        if subset is not None:
+            return subset
         
-        # Use semantic search
-        query_vec = self.vectorizer.transform([query])
-        similarities = cosine_similarity(query_vec, self.tfidf_matrix).flatten()
+        matches = [rows for name, rows in index.skill_rows.items() if skill in name]
+        if matches:
+            subset = np.unique(np.concatenate(matches))
+        else:
+            subset = np.empty(0, dtype=np.int64)
+        index.skill_subsets[skill] = subset
+        return subset
+    
+    def _rank(self, index: RetrievalIndex, query: str, mode: str, depth: int,
+              rows: Optional[np.ndarray] = None) -> List[Tuple]:
+        """Ranked (row, score) pairs for one query, subset matches first when rows are given.
+        
+        Hybrid rankings are (row, cosine score, fused score) triples.
+        """
+        ranked = self._rank_rows(index, query, mode, depth, rows)
+        if rows is not None and len(ranked) < depth:
+            # A thin subset is topped up from a search over every row
+            seen = {entry[0] for entry in ranked}
+            rest = [entry for entry in self._rank_rows(index, query, mode, depth) if entry[0] not in seen]
+            ranked += rest[:depth - len(ranked)]
+        return ranked
+    
+    def _rank_rows(self, index: RetrievalIndex, query: str, mode: str, depth: int,
+                   rows: Optional[np.ndarray] = None) -> List[Tuple]:
+        if mode == "tfidf":
+            return self._rank_lexical(index, query, depth, rows)
+        if mode == "dense":
+            return self._rank_dense(index, query, depth, rows)
         
-        # Get top-k most similar items
-        top_indices = np.argsort(similarities)[-top_k:][::-1]
+        # Hybrid: run both candidate generators in parallel, then fuse by rank
+        lexical = self._executor.submit(self._rank_lexical, index, query, depth, rows)
+        dense = self._executor.submit(self._rank_dense, index, query, depth, rows)
+        lexical_ranked, dense_ranked = lexical.result(), dense.result()
+        
+        # The RRF score orders the list; relevance_score stays a cosine similarity
+        cosine = dict(dense_ranked)
+        for row, score in lexical_ranked:
+            cosine[row] = max(score, cosine.get(row, 0.0))
+        fused = reciprocal_rank_fusion([
+            [row for row, _ in lexical_ranked],
+            [row for row, _ in dense_ranked]
+        ])[:depth]
+        return [(row, cosine[row], fused_score) for row, fused_score in fused]
+    
+    def _rank_lexical(self, index: RetrievalIndex, query: str, depth: int,
+                      rows: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """TF-IDF ranking over all rows, or only over the given subset."""
+        if rows is None:
+            return self._rank_many(index, [query], depth)[0]
+        
+        # Only the subset's matrix rows are multiplied
+        query_vec = index.vectorizer.transform([query])
+        scores = (index.tfidf_matrix[rows] @ query_vec.T).toarray().ravel()
+        return self._rank_subset(scores, rows, depth)
+    
+    def _rank_dense(self, index: RetrievalIndex, query: str, depth: int,
+                    rows: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """Dense candidates mapped onto the snapshot's rows."""
+        dense = self._get_dense_retriever(index)
+        if rows is not None:
+            dense_rows = index.dense_rows[rows]
+            present = dense_rows >= 0
+            scores = dense.score_rows(query, dense_rows[present])
+            return self._rank_subset(scores, rows[present], depth)
+        
+        ranked = []
+        for item in dense.retrieve_relevant_knowledge(query, top_k=depth):
+            row = index.row_by_id.get(item["id"])
+            if row is not None:
+                ranked.append((row, item["relevance_score"]))
+        return ranked
+    
+    def _rank_subset(self, scores: np.ndarray, rows: np.ndarray, depth: int) -> List[Tuple[int, float]]:
+        top = self._top_k_indices(scores[None, :], depth)[0]
+        return [(int(rows[i]), float(scores[i])) for i in top if scores[i] > self.min_score]
+    
+    def _get_dense_retriever(self, index: RetrievalIndex):
+        if index.dense is None:
+            with self._dense_lock:
+                if index.dense is None:
+                    from .dense import DenseRetriever
+                    index.attach_dense(DenseRetriever(self.kb))
+        return index.dense
+    
+    @staticmethod
+    def _scored_item(index: RetrievalIndex, row: int, score: float,
+                     fused_score: Optional[float] = None) -> Dict[str, Any]:
+        item = index.all_items[row].copy()
+        item["relevance_score"] = float(score)
+        if fused_score is not None:
+            item["fused_score"] = float(fused_score)
+        return item
+    
+    def retrieve_many(self, queries: List[str], top_k: int = 3) -> List[List[Dict[str, Any]]]:
+        """Retrieve relevant knowledge items for a batch of queries in one pass."""
+        index = self._index
+        return [
+            [self._scored_item(index, row, score) for row, score in ranked]
+            for ranked in self._rank_many(index, queries, top_k)
+        ]
+    
+    def _rank_many(self, index: RetrievalIndex, queries: List[str], top_k: int) -> List[List[Tuple[int, float]]]:
+        """TF-IDF (row, score) rankings for a batch of queries."""
+        if not queries or not index.all_items:
+            return [[] for _ in queries]
+        
+        # TF-IDF rows are L2-normalized, so one sparse product gives all cosine scores
+        query_matrix = index.vectorizer.transform(queries)
+        similarities = (query_matrix @ index.tfidf_matrix.T).toarray()
+        
+        top_indices = self._top_k_indices(similarities, top_k)
         
         results = []
-        for idx in top_indices:
-            if similarities[idx] > 0.1:  # Threshold for relevance
-                item = self.all_items[idx].copy()
-                item["relevance_score"] = float(similarities[idx])
-                results.append(item)
+        for row, indices in zip(similarities, top_indices):
+            # Threshold for relevance
+            results.append([(int(idx), float(row[idx])) for idx in indices if row[idx] > self.min_score])
         
         return results
     
+    @staticmethod
+    def _top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+        """Return column indices of the top-k scores per row, best first."""
+        n_cols = scores.shape[1]
+        k = min(top_k, n_cols)
+        if k <= 0:
+            return np.empty((scores.shape[0], 0), dtype=np.intp)
+        
+        # argpartition is O(n) per row; only the k survivors get sorted
+        if k < n_cols:
+            candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            candidates = np.tile(np.arange(n_cols), (scores.shape[0], 1))
+        candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+        order = np.argsort(-candidate_scores, axis=1, kind="stable")
+        return np.take_along_axis(candidates, order, axis=1)
+    
     def get_facts_for_explanation(self, question: str, user_answer: str, solution: str) -> List[str]:
         """Extract relevant facts for explaining a problem."""
         query = f"{question} {solution}"
         relevant_items = self.retrieve_relevant_knowledge(query, top_k=5)
-        
-        # Collect and deduplicate facts
+        return self._collect_facts(relevant_items)
+    
+    @staticmethod
+    def _collect_facts(relevant_items: List[Dict[str, Any]], limit: int = 5) -> List[str]:
+        """Collect and deduplicate facts from retrieved items."""
         all_facts = []
         seen_facts = set()
         
@@ -84,7 +439,7 @@ class KnowledgeRetriever:
                     all_facts.append(fact)
                     seen_facts.add(fact)
         
-        return all_facts[:5]  # Return top 5 most relevant facts
+        return all_facts[:limit]  # Return top N most relevant facts
     
     def get_contextual_hints(self, question: str, hint_level: int = 1) -> List[str]:
         """Generate contextual hints based on retrieved knowledge."""
@@ -108,8 +463,10 @@ class KnowledgeRetriever:
     
     def get_explanation_with_citations(self, question: str, user_answer: str, solution: str) -> Dict[str, Any]:
         """Generate explanation with knowledge citations."""
-        facts = self.get_facts_for_explanation(question, user_answer, solution)
-        relevant_items = self.retrieve_relevant_knowledge(f"{question} {solution}", top_k=3)
+        # Retrieve once: the top 3 citations are a prefix of the top 5 used for facts
+        retrieved = self.retrieve_relevant_knowledge(f"{question} {solution}", top_k=5)
+        facts = self._collect_facts(retrieved)
+        relevant_items = retrieved[:3]
         
         return {
             "facts": facts,
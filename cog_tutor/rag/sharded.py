@@ -0,0 +1,327 @@
+"""Sharded TF-IDF retrieval: the corpus is partitioned across worker processes."""
+import multiprocessing
+import os
+import threading
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+
+from .knowledge_base import KnowledgeBase, read_items
+from .retriever import item_text
+
+
+class ShardError(RuntimeError):
+    """A shard worker failed to run a command; the message carries the worker's exception."""
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k best scores, best first."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    keep = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+    return keep[np.argsort(-scores[keep], kind="stable")]
+
+
+def _fixed_vectorizer(vocabulary: Dict[str, int], idf: np.ndarray) -> TfidfVectorizer:
+    """A TF-IDF vectorizer over a vocabulary and IDF weights merged from every shard."""
+    vectorizer = TfidfVectorizer(stop_words='english', ngram_range=(1, 2), vocabulary=vocabulary)
+    vectorizer.idf_ = idf
+    return vectorizer
+
+
+def _term_statistics(corpus: List[str]) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """(terms, total counts, document frequencies) for one shard's slice of the corpus."""
+    counter = CountVectorizer(stop_words='english', ngram_range=(1, 2))
+    try:
+        counts = counter.fit_transform(corpus)
+    except ValueError:
+        # Empty slice, or nothing but stop words
+        return [], np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    term_counts = np.asarray(counts.sum(axis=0)).ravel()
+    doc_freq = np.bincount(counts.indices, minlength=counts.shape[1])
+    return counter.get_feature_names_out().tolist(), term_counts, doc_freq
+
+
+def _shard_worker(conn):
+    """Serve one shard: it reads, counts and indexes its own partition of the knowledge base.
+
+    The parent only ever sees term statistics and query results, never the
+    shard's TF-IDF rows or items. Every command gets exactly one reply,
+    ("ok", result) or ("error", repr(exception)), so a failing command is
+    reported instead of killing the worker and leaving the parent waiting.
+    """
+    matrix = None
+    items: List[Dict[str, Any]] = []
+    vectorizer: Optional[TfidfVectorizer] = None
+
+    while True:
+        command, *args = conn.recv()
+        if command == "stop":
+            conn.close()
+            return
+
+        try:
+            if command == "count":
+                # Phase one of a build: load the partition and report its term statistics
+                db_path, part, parts = args
+                items = read_items(db_path, part, parts)
+                matrix, vectorizer = None, None
+                reply = (len(items), *_term_statistics([item_text(item) for item in items]))
+            elif command == "index":
+                # Phase two: vectorize the partition in the merged vocabulary
+                vocabulary, idf = args
+                vectorizer = _fixed_vectorizer(vocabulary, idf) if vocabulary else None
+                if vectorizer is not None and items:
+                    matrix = vectorizer.transform([item_text(item) for item in items])
+                reply = len(items)
+            elif command == "append":
+                new_items = args[0]
+                if vectorizer is not None:
+                    rows = vectorizer.transform([item_text(item) for item in new_items])
+                    matrix = rows if matrix is None else sparse.vstack([matrix, rows], format="csr")
+                items = items + new_items
+                reply = len(items)
+            elif command == "adopt":
+                # Rows handed over from another shard during rebalancing
+                rows, new_items = args
+                if rows is not None:
+                    matrix = rows if matrix is None else sparse.vstack([matrix, rows], format="csr")
+                items = items + new_items
+                reply = len(items)
+            elif command == "remove":
+                drop = set(args[0])
+                keep = [i for i, item in enumerate(items) if item["id"] not in drop]
+                if len(keep) != len(items):
+                    if matrix is not None:
+                        matrix = matrix[keep]
+                    items = [items[i] for i in keep]
+                reply = len(items)
+            elif command == "take":
+                # Hand the last n rows to another shard during rebalancing
+                n = min(args[0], len(items))
+                split = len(items) - n
+                reply = (matrix[split:] if matrix is not None else None, items[split:])
+                matrix = matrix[:split] if matrix is not None else None
+                items = items[:split]
+            elif command == "search":
+                query_matrix, top_k, min_score = args
+                reply = []
+                if matrix is not None and matrix.shape[0] > 0:
+                    similarities = (query_matrix @ matrix.T).toarray()
+                    for row in similarities:
+                        top = [i for i in _top_k(row, top_k) if row[i] > min_score]
+                        reply.append([(float(row[i]), items[i]) for i in top])
+                else:
+                    reply = [[] for _ in range(query_matrix.shape[0])]
+            else:
+                raise ValueError(f"Unknown shard command: {command}")
+        except Exception as error:
+            conn.send(("error", repr(error)))
+            continue
+        conn.send(("ok", reply))
+
+
+def _merge_vocabulary(statistics, max_features: int) -> Tuple[Dict[str, int], np.ndarray]:
+    """Pick the max_features most frequent terms across shards and their smoothed IDF.
+
+    Matches what one TfidfVectorizer fitted on the whole corpus would choose,
+    so sharding does not change scores.
+    """
+    n_docs = 0
+    term_counts: Dict[str, int] = {}
+    doc_freq: Dict[str, int] = {}
+    for n, terms, counts, freqs in statistics:
+        n_docs += n
+        for term, count, freq in zip(terms, counts.tolist(), freqs.tolist()):
+            term_counts[term] = term_counts.get(term, 0) + count
+            doc_freq[term] = doc_freq.get(term, 0) + freq
+
+    kept = sorted(term_counts, key=lambda term: (-term_counts[term], term))[:max_features]
+    vocabulary = {term: i for i, term in enumerate(sorted(kept))}
+    df = np.array([doc_freq[term] for term in sorted(kept)], dtype=np.float64)
+    idf = np.log((1 + n_docs) / (1 + df)) + 1
+    return vocabulary, idf
+
+
+class _Shard:
+    """Parent-side handle for one worker process."""
+
+    def __init__(self, context, index: int):
+        self.index = index
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_shard_worker, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.size = 0
+
+    def send(self, *message):
+        self.conn.send(message)
+
+    def recv(self):
+        """The reply to the last command sent; raises ShardError if the worker reported a failure."""
+        status, result = self.conn.recv()
+        if status == "error":
+            raise ShardError(f"shard {self.index}: {result}")
+        return result
+
+    def call(self, *message):
+        self.send(*message)
+        return self.recv()
+
+
+class ShardedRetriever:
+    """TF-IDF retrieval fanned out over N worker processes, one shard each.
+
+    Each worker reads its own partition of the knowledge base and counts its
+    terms; the parent merges those counts into one vocabulary and IDF so every
+    shard scores queries on the same scale, then each worker vectorizes its
+    own rows. The parent holds only the vocabulary. Each query batch is sent
+    to all shards in parallel and their per-shard top-k lists are merged.
+
+    Safe to share across threads: every exchange with the workers runs
+    under one lock, so replies on a shard's pipe always reach the caller
+    that sent the command.
+    """
+
+    def __init__(self, knowledge_base: KnowledgeBase, num_shards: Optional[int] = None,
+                 rebalance_threshold: float = 1.25, max_features: int = 1000,
+                 min_score: float = 0.1):
+        self.kb = knowledge_base
+        self.num_shards = num_shards or os.cpu_count() or 1
+        self.rebalance_threshold = rebalance_threshold
+        self.max_features = max_features
+        self.min_score = min_score
+        self.vectorizer: Optional[TfidfVectorizer] = None
+
+        self._lock = threading.Lock()
+        context = multiprocessing.get_context()
+        self._shards = [_Shard(context, i) for i in range(self.num_shards)]
+        self._build_index()
+
+    def _fan_out(self, messages: List[tuple]) -> List[Any]:
+        """Send one command to each shard, then collect every reply before raising the first failure.
+
+        Draining all replies keeps every pipe in step even when a shard fails.
+        Callers hold self._lock.
+        """
+        for shard, message in zip(self._shards, messages):
+            shard.send(*message)
+        replies, failure = [], None
+        for shard in self._shards:
+            try:
+                replies.append(shard.recv())
+            except ShardError as error:
+                replies.append(None)
+                failure = failure or error
+        if failure is not None:
+            raise failure
+        return replies
+
+    def _build_index(self):
+        """Have every shard count its partition, merge the vocabulary, then index in parallel."""
+        with self._lock:
+            statistics = self._fan_out([
+                ("count", self.kb.db_path, part, self.num_shards) for part in range(self.num_shards)
+            ])
+
+            vocabulary, idf = _merge_vocabulary(statistics, self.max_features)
+            self.vectorizer = _fixed_vectorizer(vocabulary, idf) if vocabulary else None
+            sizes = self._fan_out([("index", vocabulary, idf)] * self.num_shards)
+            for shard, size in zip(self._shards, sizes):
+                shard.size = size
+
+    def rebuild(self):
+        """Refit the vocabulary from the knowledge base and repartition everything."""
+        self._build_index()
+
+    @property
+    def shard_sizes(self) -> List[int]:
+        return [shard.size for shard in self._shards]
+
+    def add_items(self, items: List[Dict[str, Any]]):
+        """Persist new items, index them on the least-loaded shard, then rebalance.
+
+        New items are vectorized with the existing vocabulary; call rebuild()
+        after large additions that introduce new terms.
+        """
+        if not items:
+            return
+        self.kb.add_knowledge_items(items)
+
+        with self._lock:
+            # Items may replace existing ids, so drop stale copies everywhere first
+            ids = [item["id"] for item in items]
+            for shard, size in zip(self._shards, self._fan_out([("remove", ids)] * self.num_shards)):
+                shard.size = size
+
+            target = min(self._shards, key=lambda shard: shard.size)
+            target.size = target.call("append", list(items))
+            self._rebalance()
+
+    def _rebalance(self):
+        """Move rows from the largest to the smallest shard until sizes are within threshold.
+
+        Callers hold self._lock.
+        """
+        while True:
+            largest = max(self._shards, key=lambda shard: shard.size)
+            smallest = min(self._shards, key=lambda shard: shard.size)
+            if largest.size <= max(1, smallest.size) * self.rebalance_threshold:
+                return
+
+            moved = (largest.size - smallest.size) // 2
+            if moved == 0:
+                return
+            rows, items = largest.call("take", moved)
+            largest.size -= len(items)
+            smallest.size = smallest.call("adopt", rows, items)
+
+    def retrieve_many(self, queries: List[str], top_k: int = 3) -> List[List[Dict[str, Any]]]:
+        """Retrieve relevant knowledge items for a batch of queries across all shards."""
+        if not queries:
+            return []
+
+        with self._lock:
+            # Read the vocabulary under the lock, so a concurrent rebuild cannot swap it mid-batch
+            if self.vectorizer is None or sum(self.shard_sizes) == 0:
+                return [[] for _ in queries]
+            query_matrix = self.vectorizer.transform(queries)
+            # Fan out: every shard works on the whole batch concurrently
+            per_shard = self._fan_out([("search", query_matrix, top_k, self.min_score)] * self.num_shards)
+
+        results = []
+        for i in range(len(queries)):
+            candidates: List[Tuple[float, Dict[str, Any]]] = []
+            for shard_results in per_shard:
+                candidates.extend(shard_results[i])
+            candidates.sort(key=lambda pair: pair[0], reverse=True)
+
+            items = []
+            for score, item in candidates[:top_k]:
+                item = dict(item)
+                item["relevance_score"] = score
+                items.append(item)
+            results.append(items)
+        return results
+
+    def retrieve_relevant_knowledge(self, query: str, top_k: int = 3) -> List[Dict[str, Any]]:
+        """Retrieve relevant knowledge items for a query."""
+        return self.retrieve_many([query], top_k=top_k)[0]
+
+    def close(self):
+        """Stop the worker processes."""
+        with self._lock:
+            for shard in self._shards:
+                if shard.process.is_alive():
+                    shard.send("stop")
+                    shard.process.join(timeout=5)
+            self._shards = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
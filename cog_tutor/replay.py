@@ -0,0 +1,241 @@
+"""Batch replay of item_responses: recompute every mastery with vectorized IRT updates."""
+import argparse
+import json
+import sqlite3
+import time
+from typing import Dict, Any, Optional, Tuple, List, Iterator, NamedTuple
+
+import numpy as np
+
+from .knowledge_tracing import TracingStore, TracingEngine, TRACING_ENGINES, get_engine, ema_success_rate
+
+_SECONDS_PER_DAY = 86400.0
+
+
+class MasteryState:
+    """Per-sequence mastery state as parallel NumPy columns."""
+
+    def __init__(self, n: int, initial_theta: float = 0.0):
+        self.theta = np.full(n, initial_theta)
+        self.sem = np.ones(n)
+        self.last = np.zeros(n)  # seconds since epoch of the previous response
+        self.count = np.zeros(n, dtype=np.int64)
+        self.rate = np.zeros(n)
+
+
+def _replay_chunk(keys: np.ndarray, correct: np.ndarray, difficulty: np.ndarray,
+                  discrimination: np.ndarray, timestamps: np.ndarray, carry: Optional[Tuple[Any, tuple]],
+                  engine: TracingEngine, predictions: Optional[np.ndarray] = None) -> Tuple[MasteryState, np.ndarray]:
+    """Replay one chunk of rows sorted by (user, skill, time).
+
+    All sequences advance together: step t updates the t-th response of every
+    sequence that has one, so Python only loops over the longest sequence.
+    If predictions is given, each row's P(correct) before its update is
+    written there.
+    """
+    n = len(keys)
+    boundaries = np.flatnonzero(keys[1:] != keys[:-1]) + 1
+    starts = np.concatenate([[0], boundaries])
+    lengths = np.diff(np.concatenate([starts, [n]]))
+    group = np.repeat(np.arange(len(starts)), lengths)
+    position = np.arange(n) - starts[group]
+
+    state = MasteryState(len(starts), engine.initial_theta)
+    state.last[:] = timestamps[starts]
+    if carry is not None and carry[0] == keys[0]:
+        # The first sequence continues one that began in the previous chunk
+        state.theta[0], state.sem[0], state.last[0], state.count[0], state.rate[0] = carry[1]
+
+    order = np.argsort(position, kind="stable")
+    step_bounds = np.concatenate([[0], np.cumsum(np.bincount(position))])
+    for step in range(len(step_bounds) - 1):
+        rows = order[step_bounds[step]:step_bounds[step + 1]]
+        g = group[rows]
+
+        if predictions is not None:
+            predictions[rows] = engine.predict(state.theta[g], difficulty[rows], discrimination[rows])
+        days = np.floor((timestamps[rows] - state.last[g]) / _SECONDS_PER_DAY)
+        state.theta[g], state.sem[g] = engine.update(
+            state.theta[g], state.sem[g], state.count[g], correct[rows], difficulty[rows], days,
+            discrimination[rows]
+        )
+        state.rate[g] = ema_success_rate(state.rate[g], state.count[g], correct[rows])
+        state.count[g] += 1
+        state.last[g] = timestamps[rows]
+
+    return state, keys[starts]
+
+
+def _split_keys(keys) -> Tuple[List[str], List[str]]:
+    pairs = [key.split("\x1f", 1) for key in keys]
+    return [user for user, _ in pairs], [skill for _, skill in pairs]
+
+
+def _write_masteries(conn: sqlite3.Connection, users: List[str], skills: List[str], state: MasteryState,
+                     select: slice):
+    last_practiced = np.datetime_as_string(
+        np.round(state.last[select] * 1e6).astype(np.int64).astype("datetime64[us]"), unit="us"
+    )
+    conn.executemany("""
+        INSERT OR REPLACE INTO user_skill_mastery
+        (user_id, skill, theta, sem, last_practiced, practice_count, success_rate)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, zip(
+        users, skills,
+        state.theta[select].tolist(), state.sem[select].tolist(),
+        last_practiced.tolist(), state.count[select].tolist(), state.rate[select].tolist()
+    ))
+
+
+def iter_response_chunks(conn: sqlite3.Connection,
+                         chunk_size: int = 500_000) -> Iterator[Tuple[np.ndarray, ...]]:
+    """Stream item_responses ordered by (user, skill, time) as column arrays.
+
+    Yields (keys, correct, difficulty, discrimination, timestamps) per chunk,
+    where keys joins user and skill and timestamps are epoch seconds.
+    """
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_user_skill_time
+        ON item_responses(user_id, skill, timestamp, id)
+    """)
+    reader = conn.cursor()
+    reader.execute("""
+        SELECT user_id || char(31) || skill, correct, difficulty, discrimination, timestamp
+        FROM item_responses
+        ORDER BY user_id, skill, timestamp, id
+    """)
+    while True:
+        rows = reader.fetchmany(chunk_size)
+        if not rows:
+            return
+        keys, correct, difficulty, discrimination, stamps = zip(*rows)
+        yield (
+            np.array(keys, dtype=object),
+            np.array(correct, dtype=bool),
+            np.array(difficulty, dtype=float),
+            np.array(discrimination, dtype=float),
+            np.array(stamps, dtype="datetime64[us]").astype(np.int64) / 1e6,
+        )
+
+
+def _carry_out(state: MasteryState, sequence_keys: np.ndarray) -> Tuple[Any, tuple]:
+    """State of the chunk's last sequence, which may continue in the next chunk."""
+    last = len(sequence_keys) - 1
+    return sequence_keys[last], (
+        state.theta[last], state.sem[last], state.last[last], state.count[last], state.rate[last]
+    )
+
+
+class ReplayedChunk(NamedTuple):
+    """One chunk of responses after replay.
+
+    sequence_keys holds the "user\x1fskill" key of each sequence in the
+    chunk and state their masteries after its last response. continued is
+    whether the first sequence began in an earlier chunk. predictions holds
+    each row's P(correct) before its update when requested, and seconds the
+    time spent in the engine.
+    """
+    keys: np.ndarray
+    correct: np.ndarray
+    sequence_keys: np.ndarray
+    state: MasteryState
+    continued: bool
+    predictions: Optional[np.ndarray]
+    seconds: float
+
+
+def replay_responses(conn: sqlite3.Connection, engine: Optional[TracingEngine] = None,
+                     chunk_size: int = 500_000, predict: bool = False) -> Iterator[ReplayedChunk]:
+    """Replay a database's item_responses through an engine, one chunk at a time.
+
+    A sequence split across chunks carries its state forward, so the last
+    sequence of a chunk is only final once the next chunk starts another.
+    """
+    engine = get_engine(engine)
+    carry = None
+    for keys, correct, difficulty, discrimination, timestamps in iter_response_chunks(conn, chunk_size):
+        predictions = np.empty(len(keys)) if predict else None
+        started = time.perf_counter()
+        state, sequence_keys = _replay_chunk(
+            keys, correct, difficulty, discrimination, timestamps, carry, engine, predictions
+        )
+        seconds = time.perf_counter() - started
+        continued = carry is not None and carry[0] == sequence_keys[0]
+        carry = _carry_out(state, sequence_keys)
+        yield ReplayedChunk(keys, correct, sequence_keys, state, continued, predictions, seconds)
+
+
+def replay_masteries(db_path: str, chunk_size: int = 500_000,
+                     engine: Optional[TracingEngine] = None) -> Dict[str, Any]:
+    """Recompute user_skill_mastery for every (user, skill) from item_responses.
+
+    Responses stream in chunks of chunk_size rows, so memory is bounded by
+    the chunk rather than the table; a sequence split across chunks carries
+    its state forward. Results are written back in bulk, one transaction.
+    """
+    engine = get_engine(engine)
+    started = time.perf_counter()
+    n_responses = 0
+    n_sequences = 0
+
+    with sqlite3.connect(db_path) as conn:
+        carry = None
+        for chunk in replay_responses(conn, engine, chunk_size):
+            n_responses += len(chunk.keys)
+
+            # Every sequence but the last is complete; the last may continue in the next chunk
+            if carry is not None and not chunk.continued:
+                _write_carry(conn, carry)
+                n_sequences += 1
+            done = slice(0, len(chunk.sequence_keys) - 1)
+            users, skills = _split_keys(chunk.sequence_keys[done])
+            _write_masteries(conn, users, skills, chunk.state, done)
+            n_sequences += len(chunk.sequence_keys) - 1
+            carry = _carry_out(chunk.state, chunk.sequence_keys)
+
+        if carry is not None:
+            _write_carry(conn, carry)
+            n_sequences += 1
+
+    elapsed = time.perf_counter() - started
+    return {
+        "db_path": db_path,
+        "engine": engine.name,
+        "responses": n_responses,
+        "sequences": n_sequences,
+        "seconds": round(elapsed, 3),
+        "responses_per_second": round(n_responses / elapsed, 1) if elapsed > 0 else None,
+    }
+
+
+def _write_carry(conn: sqlite3.Connection, carry: Tuple[Any, tuple]):
+    key, values = carry
+    users, skills = _split_keys([key])
+    state = MasteryState(1)
+    state.theta[0], state.sem[0], state.last[0], state.count[0], state.rate[0] = values
+    _write_masteries(conn, users, skills, state, slice(0, 1))
+
+
+def replay_store(store: TracingStore, chunk_size: int = 500_000,
+                 engine: Optional[TracingEngine] = None) -> List[Dict[str, Any]]:
+    """Replay every shard of a tracing store and drop its now-stale cache."""
+    store.flush()
+    results = [replay_masteries(path, chunk_size, engine) for path in store.shard_paths]
+    store.clear_cache()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute all masteries from item_responses.")
+    parser.add_argument("--db", default="knowledge_tracing.sqlite")
+    parser.add_argument("--shards", type=int, default=1)
+    parser.add_argument("--chunk-size", type=int, default=500_000)
+    parser.add_argument("--engine", choices=sorted(TRACING_ENGINES), default="irt")
+    args = parser.parse_args()
+
+    store = TracingStore(args.db, num_shards=args.shards)
+    print(json.dumps(replay_store(store, args.chunk_size, get_engine(args.engine)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+"""Research metrics pushed down to SQL, served from incrementally maintained rollups."""
+import argparse
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Sequence, Callable
+
+LEARNING_GAIN_WINDOW = 10  # responses in the early and late windows
+RETENTION_MIN_DAYS = 3
+
+_WATERMARK = "item_responses"
+_ALL_SKILLS = ""  # metrics_progress rows spanning every skill of a user
+_GROUPS = {"skill": "skill", "user": "user_id", "day": "day"}
+
+# Popcount of the late-window bitmask; SQLite has no builtin for it
+_RECENT_CORRECT = " + ".join(f"((recent_bits >> {i}) & 1)" for i in range(LEARNING_GAIN_WINDOW))
+
+
+def _init_metrics_tables(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS metrics_daily (
+            user_id TEXT NOT NULL,
+            skill TEXT NOT NULL,
+            day TEXT NOT NULL,
+            responses INTEGER NOT NULL,
+            correct INTEGER NOT NULL,
+            response_time REAL NOT NULL,
+            hints INTEGER NOT NULL,
+            PRIMARY KEY (user_id, skill, day)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS metrics_progress (
+            user_id TEXT NOT NULL,
+            skill TEXT NOT NULL,
+            responses INTEGER NOT NULL,
+            early_correct INTEGER NOT NULL,
+            early_n INTEGER NOT NULL,
+            recent_bits INTEGER NOT NULL,
+            PRIMARY KEY (user_id, skill)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS metrics_watermark (
+            source TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_metrics_daily_skill ON metrics_daily(skill, day)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_metrics_daily_day ON metrics_daily(day)")
+
+
+def _roll_up_daily(conn: sqlite3.Connection, low: int, high: int):
+    conn.execute("""
+        INSERT INTO metrics_daily (user_id, skill, day, responses, correct, response_time, hints)
+        SELECT user_id, skill, substr(timestamp, 1, 10), COUNT(*), SUM(correct),
+               SUM(response_time), SUM(hints_used)
+        FROM item_responses
+        WHERE id > ? AND id <= ?
+        GROUP BY user_id, skill, substr(timestamp, 1, 10)
+        ON CONFLICT (user_id, skill, day) DO UPDATE SET
+            responses = responses + excluded.responses,
+            correct = correct + excluded.correct,
+            response_time = response_time + excluded.response_time,
+            hints = hints + excluded.hints
+    """, (low, high))
+
+
+def _roll_up_progress(conn: sqlite3.Connection, low: int, high: int, per_skill: bool):
+    """Extend each sequence's early window count and late window bitmask.
+
+    A new response's position in its sequence is the stored response count
+    plus its rank within the batch. The late window is a bitmask of the
+    last LEARNING_GAIN_WINDOW outcomes, newest in bit 0.
+    """
+    skill = "skill" if per_skill else f"'{_ALL_SKILLS}'"
+    partition = "user_id, skill" if per_skill else "user_id"
+    window = LEARNING_GAIN_WINDOW
+    conn.execute(f"""
+        WITH batch AS (
+            SELECT user_id, {skill} AS skill, correct,
+                   ROW_NUMBER() OVER (PARTITION BY {partition} ORDER BY timestamp, id) AS position,
+                   COUNT(*) OVER (PARTITION BY {partition}) AS size
+            FROM item_responses
+            WHERE id > ? AND id <= ?
+        ), summary AS (
+            SELECT b.user_id, b.skill, MAX(b.size) AS size,
+                   SUM(CASE WHEN COALESCE(p.responses, 0) + b.position <= {window}
+                       THEN b.correct ELSE 0 END) AS early_correct,
+                   SUM(CASE WHEN COALESCE(p.responses, 0) + b.position <= {window}
+                       THEN 1 ELSE 0 END) AS early_n,
+                   SUM(CASE WHEN b.size - b.position < {window}
+                       THEN b.correct << (b.size - b.position) ELSE 0 END) AS recent_bits
+            FROM batch b
+            LEFT JOIN metrics_progress p ON p.user_id = b.user_id AND p.skill = b.skill
+            GROUP BY b.user_id, b.skill
+        )
+        INSERT INTO metrics_progress (user_id, skill, responses, early_correct, early_n, recent_bits)
+        SELECT user_id, skill, size, early_correct, early_n, recent_bits FROM summary WHERE true
+        ON CONFLICT (user_id, skill) DO UPDATE SET
+            responses = responses + excluded.responses,
+            early_correct = early_correct + excluded.early_correct,
+            early_n = early_n + excluded.early_n,
+            recent_bits = ((recent_bits << min(excluded.responses, {window})) | excluded.recent_bits)
+                          & {(1 << window) - 1}
+    """, (low, high))
+
+
+def _finish(sums: Dict[str, float]) -> Dict[str, Any]:
+    """Turn summed counters into the metric dict KnowledgeTracer reports."""
+    responses = sums["responses"]
+    return {
+        "total_responses": int(responses),
+        "accuracy": sums["correct"] / responses,
+        "avg_response_time": sums["response_time"] / responses,
+        "hints_per_response": sums["hints"] / responses,
+        "learning_gain": sums["gain"] / sums["sequences"] if sums["sequences"] else 0.0,
+        "retention_rate": sums["retained_correct"] / sums["retained"] if sums["retained"] else None,
+    }
+
+
+class ResearchMetrics:
+    """Accuracy, learning gain, retention and hint use by skill, user and day.
+
+    Raw item_responses are folded into two rollup tables per database:
+    metrics_daily holds per (user, skill, day) sums and metrics_progress
+    holds each sequence's early and late learning-gain windows. A watermark
+    on item_responses.id makes refresh() process only rows added since the
+    last run, so dashboards read precomputed rows. Rows are assumed to be
+    inserted in time order, which the tracer's writes guarantee.
+
+    With auto_refresh, reads refresh first unless the last refresh was less
+    than max_staleness seconds ago; call refresh() to catch up on demand.
+    """
+
+    def __init__(self, db_paths: Sequence[str], flush: Optional[Callable[[], None]] = None,
+                 refresh_batch: int = 500_000, auto_refresh: bool = True, max_staleness: float = 0.0):
+        self.db_paths = list(db_paths)
+        self.flush = flush
+        self.refresh_batch = refresh_batch
+        self.auto_refresh = auto_refresh
+        self.max_staleness = max_staleness
+        self.refreshed_at: Optional[float] = None  # time.monotonic() of the last refresh
+        self._refresh_lock = threading.RLock()
+        for db_path in self.db_paths:
+            with sqlite3.connect(db_path) as conn:
+                _init_metrics_tables(conn)
+
+    @classmethod
+    def for_store(cls, store, **options) -> "ResearchMetrics":
+        """Metrics over every shard of a TracingStore, flushing its queued writes first."""
+        return cls(store.shard_paths, flush=store.flush, **options)
+
+    def refresh(self) -> int:
+        """Fold responses added since the last refresh into the rollups; returns rows processed."""
+        with self._refresh_lock:
+            started = time.monotonic()
+            processed = self._refresh()
+            self.refreshed_at = started
+            return processed
+
+    def _refresh_if_stale(self):
+        with self._refresh_lock:
+            if self.refreshed_at is None or time.monotonic() - self.refreshed_at >= self.max_staleness:
+                self.refresh()
+
+    def _refresh(self) -> int:
+        if self.flush is not None:
+            self.flush()
+
+        processed = 0
+        for db_path in self.db_paths:
+            conn = sqlite3.connect(db_path)
+            try:
+                while True:
+                    # The write lock makes read-watermark, roll up, advance-watermark atomic
+                    conn.execute("BEGIN IMMEDIATE")
+                    row = conn.execute(
+                        "SELECT last_id FROM metrics_watermark WHERE source = ?", (_WATERMARK,)
+                    ).fetchone()
+                    low = row[0] if row else 0
+                    latest = conn.execute("SELECT MAX(id) FROM item_responses").fetchone()[0] or 0
+                    if latest <= low:
+                        conn.rollback()
+                        break
+                    high = min(latest, low + self.refresh_batch)
+
+                    _roll_up_daily(conn, low, high)
+                    _roll_up_progress(conn, low, high, per_skill=True)
+                    _roll_up_progress(conn, low, high, per_skill=False)
+                    conn.execute(
+                        "INSERT OR REPLACE INTO metrics_watermark (source, last_id) VALUES (?, ?)",
+                        (_WATERMARK, high)
+                    )
+                    processed += conn.execute(
+                        "SELECT COUNT(*) FROM item_responses WHERE id > ? AND id <= ?", (low, high)
+                    ).fetchone()[0]
+                    conn.commit()
+            finally:
+                conn.close()
+        return processed
+
+    def summary(self, user_id: Optional[str] = None, skill: Optional[str] = None,
+                since: Optional[str] = None, until: Optional[str] = None,
+                now: Optional[datetime] = None) -> Dict[str, Any]:
+        """Metrics over all matching responses; empty when there are none.
+
+        since and until bound the ISO day; learning gain always covers whole
+        sequences.
+        """
+        return self._grouped(None, user_id, skill, since, until, now).get(None, {})
+
+    def by_skill(self, user_id: Optional[str] = None, **filters) -> Dict[str, Dict[str, Any]]:
+        return self._grouped("skill", user_id, None, **filters)
+
+    def by_user(self, skill: Optional[str] = None, **filters) -> Dict[str, Dict[str, Any]]:
+        return self._grouped("user", None, skill, **filters)
+
+    def by_day(self, user_id: Optional[str] = None, skill: Optional[str] = None,
+               **filters) -> Dict[str, Dict[str, Any]]:
+        """Per-day metrics; learning gain is per sequence, so it is not reported here."""
+        days = self._grouped("day", user_id, skill, **filters)
+        for metrics in days.values():
+            metrics.pop("learning_gain")
+        return days
+
+    def _grouped(self, group: Optional[str], user_id: Optional[str], skill: Optional[str],
+                 since: Optional[str] = None, until: Optional[str] = None,
+                 now: Optional[datetime] = None) -> Dict[Any, Dict[str, Any]]:
+        if self.auto_refresh:
+            self._refresh_if_stale()
+
+        # Retention counts days at least RETENTION_MIN_DAYS before today
+        cutoff = ((now or datetime.now()).date() - timedelta(days=RETENTION_MIN_DAYS)).isoformat()
+        key = _GROUPS[group] if group else "NULL"
+
+        daily_filters, daily_params = [], []
+        for column, value in (("user_id", user_id), ("skill", skill)):
+            if value is not None:
+                daily_filters.append(f"{column} = ?")
+                daily_params.append(value)
+        if since is not None:
+            daily_filters.append("day >= ?")
+            daily_params.append(since)
+        if until is not None:
+            daily_filters.append("day <= ?")
+            daily_params.append(until)
+        daily_where = f"WHERE {' AND '.join(daily_filters)}" if daily_filters else ""
+
+        # Per-skill sequences when grouping or filtering by skill, else whole-user sequences
+        progress_filters = ["skill != ?" if group == "skill" or skill is not None else "skill = ?"]
+        progress_params: List[Any] = [_ALL_SKILLS]
+        for column, value in (("user_id", user_id), ("skill", skill)):
+            if value is not None:
+                progress_filters.append(f"{column} = ?")
+                progress_params.append(value)
+
+        totals: Dict[Any, Dict[str, float]] = {}
+        for db_path in self.db_paths:
+            with sqlite3.connect(db_path) as conn:
+                for row in conn.execute(f"""
+                    SELECT {key}, SUM(responses), SUM(correct), SUM(response_time), SUM(hints),
+                           SUM(CASE WHEN day < ? THEN responses ELSE 0 END),
+                           SUM(CASE WHEN day < ? THEN correct ELSE 0 END)
+                    FROM metrics_daily {daily_where}
+                    GROUP BY {key}
+                """, [cutoff, cutoff] + daily_params):
+                    sums = totals.setdefault(row[0], dict.fromkeys(
+                        ("responses", "correct", "response_time", "hints", "retained",
+                         "retained_correct", "gain", "sequences"), 0.0
+                    ))
+                    for name, value in zip(
+                        ("responses", "correct", "response_time", "hints", "retained", "retained_correct"),
+                        row[1:]
+                    ):
+                        sums[name] += value or 0.0
+
+                if group == "day":
+                    continue
+                for group_key, gain, sequences in conn.execute(f"""
+                    SELECT {key},
+                           SUM(({_RECENT_CORRECT} - early_correct) * 1.0 / {LEARNING_GAIN_WINDOW}),
+                           COUNT(*)
+                    FROM metrics_progress
+                    WHERE {' AND '.join(progress_filters)} AND responses >= {2 * LEARNING_GAIN_WINDOW}
+                    GROUP BY {key}
+                """, progress_params):
+                    if group_key in totals:
+                        totals[group_key]["gain"] += gain
+                        totals[group_key]["sequences"] += sequences
+
+        return {
+            group_key: _finish(sums) for group_key, sums in totals.items() if sums["responses"]
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Refresh metric rollups and print a report.")
+    parser.add_argument("--db", default="knowledge_tracing.sqlite")
+    parser.add_argument("--shards", type=int, default=1)
+    parser.add_argument("--by", choices=sorted(_GROUPS), default=None)
+    parser.add_argument("--user", default=None)
+    parser.add_argument("--skill", default=None)
+    args = parser.parse_args()
+
+    from .knowledge_tracing import TracingStore
+    metrics = ResearchMetrics.for_store(TracingStore(args.db, num_shards=args.shards))
+    if args.by is None:
+        report = metrics.summary(user_id=args.user, skill=args.skill)
+    elif args.by == "skill":
+        report = metrics.by_skill(user_id=args.user)
+    elif args.by == "user":
+        report = metrics.by_user(skill=args.skill)
+    else:
+        report = metrics.by_day(user_id=args.user, skill=args.skill)
+    print(json.dumps(report, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
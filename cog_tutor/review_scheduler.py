@@ -0,0 +1,209 @@
+"""Spaced-repetition due queue: per-user heaps over a persisted review_queue table."""
+import heapq
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .knowledge_tracing import TracingStore, SkillMastery, Statement
+
+REVIEW_BASE_DAYS = 7.0  # matches the recommender's full spacing bonus at one week
+REVIEW_MIN_DAYS = 1.0
+REVIEW_MAX_DAYS = 60.0
+
+
+def review_interval_days(theta: float) -> float:
+    """Days until a skill is due again; doubles with each unit of ability."""
+    return float(np.clip(REVIEW_BASE_DAYS * 2.0 ** theta, REVIEW_MIN_DAYS, REVIEW_MAX_DAYS))
+
+
+def _timestamp(moment: datetime) -> str:
+    # Fixed-width ISO strings compare in time order, so due_at ranges can use the index
+    return moment.isoformat(timespec="microseconds")
+
+
+class _UserQueue:
+    """One user's due heap with lazy deletion.
+
+    Rescheduling pushes a new (due, skill) entry; the superseded entry stays
+    in the heap and is skipped when it surfaces, because it no longer
+    matches due_by_skill.
+    """
+
+    __slots__ = ("heap", "due_by_skill")
+
+    def __init__(self, rows: List[Tuple[str, str]]):
+        # Rows arrive ordered by due_at, which is already a valid heap
+        self.heap = [(due, skill) for skill, due in rows]
+        self.due_by_skill: Dict[str, str] = {skill: due for skill, due in rows}
+
+    def push(self, skill: str, due: str):
+        self.due_by_skill[skill] = due
+        heapq.heappush(self.heap, (due, skill))
+        if len(self.heap) > 2 * len(self.due_by_skill) + 16:
+            self.heap = [(d, s) for s, d in self.due_by_skill.items()]
+            heapq.heapify(self.heap)
+
+    def peek(self) -> Optional[Tuple[str, str]]:
+        while self.heap:
+            due, skill = self.heap[0]
+            if self.due_by_skill.get(skill) == due:
+                return due, skill
+            heapq.heappop(self.heap)
+        return None
+
+    def pop(self) -> Tuple[str, str]:
+        due, skill = heapq.heappop(self.heap)
+        del self.due_by_skill[skill]
+        return due, skill
+
+
+class ReviewScheduler:
+    """Next-review times for every (user, skill), served as O(log n) heap pops.
+
+    Each user's queue is loaded from review_queue on first use and kept in a
+    bounded LRU; every change is persisted through the tracing store, so it
+    shares the store's shards and write-behind batching. Pass the scheduler
+    to KnowledgeTracer to reschedule a skill on every mastery update.
+    """
+
+    def __init__(self, store: Optional[TracingStore] = None, cache_size: int = 1024):
+        self.store = store or TracingStore()
+        self.cache_size = cache_size
+        self._queues: "OrderedDict[str, _UserQueue]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    def _queue(self, user_id: str) -> _UserQueue:
+        with self._lock:
+            queue = self._queues.get(user_id)
+            if queue is not None:
+                self._queues.move_to_end(user_id)
+                return queue
+
+            self.store.flush()
+            with sqlite3.connect(self.store.shard_path(user_id)) as conn:
+                rows = conn.execute(
+                    "SELECT skill, due_at FROM review_queue WHERE user_id = ? ORDER BY due_at, skill",
+                    (user_id,)
+                ).fetchall()
+            queue = self._queues[user_id] = _UserQueue(rows)
+            while len(self._queues) > self.cache_size:
+                self._queues.popitem(last=False)
+            return queue
+
+    def reschedule(self, user_id: str, mastery: SkillMastery) -> Statement:
+        """Queue a skill for review after practice; returns the statement persisting it.
+
+        The caller writes the statement, normally in the same transaction as
+        the mastery update.
+        """
+        interval = review_interval_days(mastery.theta)
+        due = _timestamp(mastery.last_practiced + timedelta(days=interval))
+        with self._lock:
+            queue = self._queues.get(user_id)
+            if queue is not None:
+                queue.push(mastery.skill, due)
+        return ("""
+            INSERT OR REPLACE INTO review_queue (user_id, skill, due_at, interval_days)
+            VALUES (?, ?, ?, ?)
+        """, (user_id, mastery.skill, due, interval))
+
+    def schedule(self, user_id: str, skill: str, due_at: datetime, durable: bool = False):
+        """Set a skill's next review time explicitly."""
+        due = _timestamp(due_at)
+        with self._lock:
+            self._queue(user_id).push(skill, due)
+        self.store.write(self.store.shard_path(user_id), [("""
+            INSERT OR REPLACE INTO review_queue (user_id, skill, due_at, interval_days)
+            VALUES (?, ?, ?, NULL)
+        """, (user_id, skill, due))], durable=durable)
+
+    def next_due(self, user_id: str) -> Optional[Tuple[str, datetime]]:
+        """The user's earliest scheduled review, due or not, without removing it."""
+        with self._lock:
+            head = self._queue(user_id).peek()
+        if head is None:
+            return None
+        due, skill = head
+        return skill, datetime.fromisoformat(due)
+
+    def pop_due(self, user_id: str, now: Optional[datetime] = None,
+                limit: int = 1) -> List[Tuple[str, datetime]]:
+        """Remove and return up to limit reviews due by now, most overdue first.
+
+        A popped skill is rescheduled when it is next practiced.
+        """
+        cutoff = _timestamp(now or datetime.now())
+        popped = []
+        with self._lock:
+            queue = self._queue(user_id)
+            while len(popped) < limit:
+                head = queue.peek()
+                if head is None or head[0] > cutoff:
+                    break
+                popped.append(queue.pop())
+
+        if popped:
+            self.store.write(self.store.shard_path(user_id), [
+                ("DELETE FROM review_queue WHERE user_id = ? AND skill = ? AND due_at = ?",
+                 (user_id, skill, due))
+                for due, skill in popped
+            ])
+        return [(skill, datetime.fromisoformat(due)) for due, skill in popped]
+
+    def overdue_users(self, now: Optional[datetime] = None,
+                      limit: Optional[int] = None) -> List[Tuple[str, int, datetime]]:
+        """(user_id, overdue count, oldest due time) for every user with a review due.
+
+        Reads only the due_at index range up to now, across all shards;
+        most overdue users come first.
+        """
+        cutoff = _timestamp(now or datetime.now())
+        self.store.flush()
+        users = []
+        for db_path in self.store.shard_paths:
+            with sqlite3.connect(db_path) as conn:
+                users.extend(conn.execute("""
+                    SELECT user_id, COUNT(*), MIN(due_at)
+                    FROM review_queue INDEXED BY idx_review_due
+                    WHERE due_at <= ?
+                    GROUP BY user_id
+                """, (cutoff,)).fetchall())
+        users.sort(key=lambda row: row[2])
+        if limit is not None:
+            users = users[:limit]
+        return [(user_id, count, datetime.fromisoformat(oldest)) for user_id, count, oldest in users]
+
+    def rebuild(self, batch_size: int = 10_000) -> int:
+        """Recompute every review from user_skill_mastery, e.g. after replay; returns rows written."""
+        self.store.flush()
+        written = 0
+        for db_path in self.store.shard_paths:
+            with sqlite3.connect(db_path) as conn:
+                conn.execute("DELETE FROM review_queue")
+                cursor = conn.execute("SELECT user_id, skill, theta, last_practiced FROM user_skill_mastery")
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    reviews = []
+                    for user_id, skill, theta, last_practiced in rows:
+                        interval = review_interval_days(theta)
+                        due = datetime.fromisoformat(last_practiced) + timedelta(days=interval)
+                        reviews.append((user_id, skill, _timestamp(due), interval))
+                    conn.executemany("""
+                        INSERT OR REPLACE INTO review_queue (user_id, skill, due_at, interval_days)
+                        VALUES (?, ?, ?, ?)
+                    """, reviews)
+                    written += len(reviews)
+        with self._lock:
+            self._queues.clear()
+        return written
+
+    def evict(self, user_id: str):
+        """Drop a user's in-memory queue; it stays on disk."""
+        with self._lock:
+            self._queues.pop(user_id, None)
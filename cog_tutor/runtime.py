@@ -0,0 +1,187 @@
+"""Process-wide services shared by every tutoring session."""
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from typing import Optional, Callable, Any
+
+from .knowledge_tracing import KnowledgeTracer, TracingStore, get_engine
+from .rag.knowledge_base import KnowledgeBase
+from .rag.retriever import KnowledgeRetriever
+from .rag.rag_prompts import RAGEnhancedPrompts
+from .question_bank import QuestionBank, author_adaptive_question
+
+
+class GenerationOverloaded(RuntimeError):
+    """Raised instead of queueing a model call while timed-out calls still hold the executor."""
+
+
+class GenerationTicket:
+    """Handle on a model call running in the background: poll it, wait on it or await it.
+    
+    If the call raises, the ticket resolves to fallback() instead, when one
+    is given.
+    """
+    
+    def __init__(self, future: Future, fallback: Optional[Callable[[], Any]] = None):
+        self._future = future
+        self._fallback = fallback
+    
+    def done(self) -> bool:
+        return self._future.done()
+    
+    def result(self, timeout: Optional[float] = None) -> Any:
+        """The generation's result; raises concurrent.futures.TimeoutError if not ready in time."""
+        try:
+            return self._future.result(timeout=timeout)
+        except Exception:
+            if self._fallback is None or not self._future.done():
+                raise
+            return self._fallback()
+    
+    def poll(self) -> Optional[Any]:
+        """The result if ready, else None without blocking."""
+        return self.result() if self._future.done() else None
+    
+    def cancel(self) -> bool:
+        return self._future.cancel()
+    
+    def add_done_callback(self, fn: Callable[["GenerationTicket"], None]):
+        self._future.add_done_callback(lambda _: fn(self))
+    
+    async def wait(self) -> Any:
+        """Await the result from an asyncio event loop without blocking it."""
+        try:
+            return await asyncio.wrap_future(self._future)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            if self._fallback is None:
+                raise
+            return self._fallback()
+    
+    def __await__(self):
+        return self.wait().__await__()
+
+
+class TutorRuntime:
+    """Owns the knowledge base, retriever and tracing store for a process.
+
+    These are built once: the knowledge base is seeded, the retriever index
+    fitted and the store's tables checked a single time, however many
+    sessions are opened. All three are safe to share across threads, so an
+    AdaptiveTutor built on a runtime only holds per-user state. Model calls
+    from every session share one bounded generation executor. With a
+    question_db, recommended questions come from a background-refilled
+    question bank that persists cursors through the tracing store's
+    write-behind queue when it has one.
+    """
+
+    def __init__(self, knowledge_db: str = "knowledge_base.sqlite",
+                 tracing_db: str = "knowledge_tracing.sqlite", num_shards: int = 1,
+                 write_behind: bool = False, cache_size: int = 1024, engine=None,
+                 history_capacity: int = 10000, generation_workers: int = 8,
+                 question_db: Optional[str] = None,
+                 max_abandoned: Optional[int] = None):
+        self.knowledge_base = KnowledgeBase(knowledge_db)
+        self.retriever = KnowledgeRetriever(self.knowledge_base)
+        self.rag_prompts = RAGEnhancedPrompts()
+        self.tracing_store = TracingStore(
+            tracing_db, num_shards=num_shards, cache_size=cache_size, write_behind=write_behind
+        )
+        self.engine = get_engine(engine)
+        self.history_capacity = history_capacity
+        self.generation_executor = ThreadPoolExecutor(
+            max_workers=generation_workers, thread_name_prefix="generation"
+        )
+        # Calls abandoned after a timeout keep running and hold a worker each;
+        # past this many, new calls are refused rather than queued behind them
+        self.max_abandoned = max(1, generation_workers // 2) if max_abandoned is None else max_abandoned
+        self._abandoned: set = set()
+        self._abandoned_lock = threading.Lock()
+        self.question_bank = None
+        if question_db is not None:
+            self.question_bank = QuestionBank(
+                question_db, generator=partial(author_adaptive_question, self.knowledge_base),
+                writer=self.tracing_store.writer
+            )
+
+    def submit(self, fn: Callable[..., Any], *args, **kwargs) -> Future:
+        """Run a model call on the generation executor.
+        
+        While max_abandoned timed-out calls are still running, the returned
+        future fails at once with GenerationOverloaded so callers use their
+        fallback instead of waiting for a free worker.
+        """
+        if self.abandoned_generations >= self.max_abandoned:
+            refused: Future = Future()
+            refused.set_exception(GenerationOverloaded(
+                f"{self.abandoned_generations} abandoned generations still running"
+            ))
+            return refused
+        return self.generation_executor.submit(fn, *args, **kwargs)
+    
+    def abandon(self, future: Future):
+        """Give up on a call: cancel it if still queued, otherwise track it until it finishes."""
+        if future.cancel() or future.done():
+            return
+        with self._abandoned_lock:
+            self._abandoned.add(future)
+        future.add_done_callback(self._abandoned_finished)
+    
+    def _abandoned_finished(self, future: Future):
+        with self._abandoned_lock:
+            self._abandoned.discard(future)
+    
+    @property
+    def abandoned_generations(self) -> int:
+        """Timed-out calls still occupying a generation worker."""
+        return len(self._abandoned)
+    
+    def submit_generation(self, fn: Callable[..., Any], *args,
+                          fallback: Optional[Callable[[], Any]] = None, **kwargs) -> GenerationTicket:
+        """Run a model call on the generation executor and return a ticket for its result."""
+        return GenerationTicket(self.submit(fn, *args, **kwargs), fallback)
+    
+    def tracer(self, user_id: str) -> KnowledgeTracer:
+        """A tracer for one user over the shared store; its masteries come from the store's cache."""
+        return KnowledgeTracer(
+            user_id=user_id,
+            store=self.tracing_store,
+            history_capacity=self.history_capacity,
+            engine=self.engine
+        )
+
+    def close(self):
+        """Stop background retrieval and generation work and flush queued tracing writes."""
+        self.generation_executor.shutdown(wait=True)
+        if self.question_bank is not None:
+            self.question_bank.close()
+        self.retriever.close()
+        self.tracing_store.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+_default_runtime: Optional[TutorRuntime] = None
+_default_lock = threading.Lock()
+
+
+def get_default_runtime() -> TutorRuntime:
+    """The process-wide runtime, created with default paths on first use."""
+    global _default_runtime
+    with _default_lock:
+        if _default_runtime is None:
+            _default_runtime = TutorRuntime()
+        return _default_runtime
+
+
+def set_default_runtime(runtime: Optional[TutorRuntime]):
+    """Replace the process-wide runtime, e.g. to point sessions at other databases."""
+    global _default_runtime
+    with _default_lock:
+        _default_runtime = runtime
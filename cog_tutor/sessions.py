@@ -0,0 +1,257 @@
+"""Bounded registry of live tutor sessions, with idle ones parked as compressed snapshots."""
+import gzip
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Any, Optional, List
+
+from .adaptive_tutor import AdaptiveTutor
+from .knowledge_tracing import ItemResponse
+from .runtime import TutorRuntime, get_default_runtime
+
+SNAPSHOT_VERSION = 1
+
+
+def snapshot_session(tutor: AdaptiveTutor) -> bytes:
+    """Gzipped JSON of a session's in-memory state, with responses stored column-wise.
+
+    Skill masteries are not included: they are already persisted by the
+    tracing store and reloaded from it on restore. Likewise only the last
+    response-history capacity of responses is kept, since every response
+    is already in the store and the history would drop older ones anyway.
+    """
+    capacity = tutor.knowledge_tracer.response_history.capacity
+    responses = tutor.session_responses[max(len(tutor.session_responses) - capacity, 0):]
+    state = {
+        "version": SNAPSHOT_VERSION,
+        "user_id": tutor.user_id,
+        "session_start": tutor.session_start.timestamp(),
+        "responses": {
+            "item_id": [r.item_id for r in responses],
+            "skill": [r.skill for r in responses],
+            "correct": [int(r.correct) for r in responses],
+            "response_time": [float(r.response_time) for r in responses],
+            "hints_used": [int(r.hints_used) for r in responses],
+            "difficulty": [float(r.difficulty) for r in responses],
+            "timestamp": [r.timestamp.timestamp() for r in responses],
+        },
+    }
+    return gzip.compress(json.dumps(state, separators=(",", ":")).encode("utf-8"))
+
+
+def restore_session(payload: bytes, runtime: TutorRuntime) -> AdaptiveTutor:
+    """Rebuild a tutor from snapshot_session output; its tracer's response history is replayed."""
+    state = json.loads(gzip.decompress(payload))
+    if state.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported session snapshot version: {state.get('version')}")
+
+    tutor = AdaptiveTutor(state["user_id"], runtime=runtime)
+    tutor.session_start = datetime.fromtimestamp(state["session_start"])
+    columns = state["responses"]
+    for i in range(len(columns["item_id"])):
+        response = ItemResponse(
+            item_id=columns["item_id"][i],
+            skill=columns["skill"][i],
+            correct=bool(columns["correct"][i]),
+            response_time=columns["response_time"][i],
+            hints_used=columns["hints_used"][i],
+            difficulty=columns["difficulty"][i],
+            timestamp=datetime.fromtimestamp(columns["timestamp"][i])
+        )
+        tutor.session_responses.append(response)
+        tutor.knowledge_tracer.response_history.append(response)
+    return tutor
+
+
+class SessionManager:
+    """Hands out one AdaptiveTutor per user while keeping at most max_active in memory.
+
+    Sessions are held in least-recently-used order. Opening a session
+    beyond max_active, or leaving one untouched for idle_timeout seconds,
+    snapshots it into SQLite and drops it from memory; the next get() for
+    that user restores it from the snapshot. Because snapshots are on disk,
+    a restarted worker resumes sessions where the last one left them.
+
+    Idle sessions are parked by a background timer every eviction_interval
+    seconds (a quarter of idle_timeout by default). Snapshot reads and
+    writes happen outside the manager lock: a session being parked stays
+    reachable until its snapshot is written, and snapshots are written one
+    batch at a time so the newest state always lands last.
+    """
+
+    def __init__(self, db_path: str = "sessions.sqlite", runtime: Optional[TutorRuntime] = None,
+                 max_active: int = 1000, idle_timeout: Optional[float] = 1800.0,
+                 eviction_interval: Optional[float] = None):
+        self.db_path = db_path
+        self.runtime = runtime or get_default_runtime()
+        self.max_active = max_active
+        self.idle_timeout = idle_timeout
+        self._sessions: "OrderedDict[str, AdaptiveTutor]" = OrderedDict()
+        self._last_used: Dict[str, float] = {}
+        # Sessions dropped from memory whose snapshot is not written yet
+        self._parking: Dict[str, AdaptiveTutor] = {}
+        self._lock = threading.RLock()
+        self._save_lock = threading.Lock()
+        self.evictions = 0
+        self.restores = 0
+        self._init_database()
+
+        self._stopped = threading.Event()
+        self._reaper = None
+        if idle_timeout is not None:
+            self.eviction_interval = eviction_interval if eviction_interval is not None else idle_timeout / 4
+            self._reaper = threading.Thread(target=self._reap, name="session-reaper", daemon=True)
+            self._reaper.start()
+
+    def _init_database(self):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS session_snapshots (
+                    user_id TEXT PRIMARY KEY,
+                    saved_at TIMESTAMP NOT NULL,
+                    payload BLOB NOT NULL
+                )
+            """)
+
+    def get(self, user_id: str) -> AdaptiveTutor:
+        """The user's session: live if active, else restored from its snapshot, else new."""
+        loaded, evictions = None, None
+        while True:
+            with self._lock:
+                tutor = self._sessions.get(user_id) or self._parking.pop(user_id, None)
+                if tutor is None and loaded is not None and self.evictions == evictions:
+                    tutor = loaded
+                if tutor is not None:
+                    now = time.monotonic()
+                    self._sessions[user_id] = tutor
+                    self._sessions.move_to_end(user_id)
+                    self._last_used[user_id] = now
+                    parked = self._evict(now)
+                    break
+                evictions = self.evictions
+            # Read the snapshot outside the lock; if any session is parked
+            # meanwhile (perhaps this user's, opened by another thread) the
+            # read may be stale, so it is repeated
+            loaded = self._load(user_id)
+        if parked:
+            self._save(parked)
+        return tutor
+
+    def _load(self, user_id: str) -> AdaptiveTutor:
+        with sqlite3.connect(self.db_path) as conn:
+            row = conn.execute(
+                "SELECT payload FROM session_snapshots WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        if row is None:
+            return AdaptiveTutor(user_id, runtime=self.runtime)
+        tutor = restore_session(row[0], self.runtime)
+        with self._lock:
+            self.restores += 1
+        return tutor
+
+    def _evict(self, now: float) -> List[AdaptiveTutor]:
+        """Move sessions over capacity, then idle ones, to parking; both sit at the LRU end.
+
+        Call with the lock held, and _save the returned sessions after releasing it.
+        """
+        parked = []
+        while self._sessions:
+            user_id = next(iter(self._sessions))
+            over_capacity = len(self._sessions) > self.max_active
+            idle = (self.idle_timeout is not None
+                    and now - self._last_used[user_id] > self.idle_timeout)
+            if not (over_capacity or idle):
+                break
+            tutor = self._sessions.popitem(last=False)[1]
+            del self._last_used[user_id]
+            self._parking[user_id] = tutor
+            parked.append(tutor)
+        self.evictions += len(parked)
+        return parked
+
+    def _save(self, tutors: List[AdaptiveTutor]):
+        """Snapshot parked sessions that are still parked, then release them."""
+        with self._save_lock:
+            with self._lock:
+                # Sessions reopened or ended since they were parked are skipped
+                tutors = [tutor for tutor in tutors if self._parking.get(tutor.user_id) is tutor]
+            if not tutors:
+                return
+            saved_at = datetime.now().isoformat()
+            rows = [(tutor.user_id, saved_at, snapshot_session(tutor)) for tutor in tutors]
+            with sqlite3.connect(self.db_path) as conn:
+                conn.executemany("""
+                    INSERT OR REPLACE INTO session_snapshots (user_id, saved_at, payload)
+                    VALUES (?, ?, ?)
+                """, rows)
+            with self._lock:
+                for tutor in tutors:
+                    if self._parking.get(tutor.user_id) is tutor:
+                        del self._parking[tutor.user_id]
+
+    def evict_idle(self) -> int:
+        """Park every session idle past idle_timeout now; returns how many."""
+        with self._lock:
+            parked = self._evict(time.monotonic())
+        if parked:
+            self._save(parked)
+        return len(parked)
+
+    def _reap(self):
+        while not self._stopped.wait(self.eviction_interval):
+            self.evict_idle()
+
+    def end(self, user_id: str):
+        """Finish a session for good: drop it from memory and delete its snapshot."""
+        with self._lock:
+            self._sessions.pop(user_id, None)
+            self._last_used.pop(user_id, None)
+            self._parking.pop(user_id, None)
+        # Serialized with saves, so a parked snapshot cannot land after the delete
+        with self._save_lock:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute("DELETE FROM session_snapshots WHERE user_id = ?", (user_id,))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            active = len(self._sessions)
+        with sqlite3.connect(self.db_path) as conn:
+            snapshots, snapshot_bytes = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(payload)), 0) FROM session_snapshots"
+            ).fetchone()
+        return {
+            "active": active,
+            "snapshots": snapshots,
+            "snapshot_bytes": snapshot_bytes,
+            "evictions": self.evictions,
+            "restores": self.restores,
+        }
+
+    def close(self):
+        """Stop the idle timer and snapshot every session so a restarted worker can resume them."""
+        self._stopped.set()
+        if self._reaper is not None:
+            self._reaper.join()
+        with self._lock:
+            for user_id, tutor in self._sessions.items():
+                self._parking[user_id] = tutor
+            self._sessions.clear()
+            self._last_used.clear()
+            tutors = list(self._parking.values())
+        if tutors:
+            self._save(tutors)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, user_id: str) -> bool:
+        return user_id in self._sessions
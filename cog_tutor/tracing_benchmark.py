@@ -0,0 +1,101 @@
+"""Compare tracing engines by replaying item_responses: speed and predictive AUC."""
+import argparse
+import json
+import sqlite3
+import sys
+from typing import List, Dict, Any, Sequence, Optional
+
+import numpy as np
+
+from .knowledge_tracing import TracingStore, TRACING_ENGINES, get_engine
+from .replay import replay_responses
+
+
+def roc_auc(labels: np.ndarray, scores: np.ndarray) -> Optional[float]:
+    """Area under the ROC curve via the rank-sum statistic, with tied scores averaged."""
+    labels = labels.astype(bool)
+    n_pos = int(labels.sum())
+    n_neg = len(labels) - n_pos
+    if n_pos == 0 or n_neg == 0:
+        return None
+
+    order = np.argsort(scores, kind="mergesort")
+    sorted_scores = scores[order]
+    ranks = np.empty(len(scores))
+    # Average ranks over runs of equal scores
+    boundaries = np.flatnonzero(np.diff(sorted_scores)) + 1
+    starts = np.concatenate([[0], boundaries])
+    stops = np.concatenate([boundaries, [len(scores)]])
+    ranks[order] = np.repeat((starts + stops + 1) / 2.0, stops - starts)
+    return float((ranks[labels].sum() - n_pos * (n_pos + 1) / 2.0) / (n_pos * n_neg))
+
+
+def benchmark_engine(db_paths: Sequence[str], engine, chunk_size: int = 500_000) -> Dict[str, Any]:
+    """Replay every response through one engine, scoring each prediction before its update.
+
+    Only engine work is timed; reading rows from SQLite is excluded so the
+    engines are compared on equal footing.
+    """
+    engine = get_engine(engine)
+    seconds = 0.0
+    n_responses = 0
+    n_sequences = 0
+    learners = set()
+    labels: List[np.ndarray] = []
+    predictions: List[np.ndarray] = []
+
+    for db_path in db_paths:
+        with sqlite3.connect(db_path) as conn:
+            for chunk in replay_responses(conn, engine, chunk_size, predict=True):
+                seconds += chunk.seconds
+                n_sequences += len(chunk.sequence_keys) - chunk.continued
+                learners.update(key.split("\x1f", 1)[0] for key in chunk.sequence_keys)
+                n_responses += len(chunk.keys)
+                labels.append(chunk.correct)
+                predictions.append(chunk.predictions)
+
+    if n_responses == 0:
+        return {"engine": engine.name, "responses": 0}
+
+    return {
+        "engine": engine.name,
+        "responses": n_responses,
+        "learners": len(learners),
+        "sequences": n_sequences,
+        "updates_per_second": round(n_responses / seconds, 1) if seconds > 0 else None,
+        "auc": roc_auc(np.concatenate(labels), np.concatenate(predictions)),
+    }
+
+
+def run_benchmark(store: TracingStore, engines: Sequence[str] = tuple(TRACING_ENGINES),
+                  chunk_size: int = 500_000) -> Dict[str, Any]:
+    """Benchmark each engine over every shard of a store; returns a JSON-serializable report."""
+    store.flush()
+    results = []
+    for name in engines:
+        row = benchmark_engine(store.shard_paths, name, chunk_size)
+        results.append(row)
+        print(json.dumps(row), file=sys.stderr)
+    return {"db_paths": store.shard_paths, "results": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark knowledge-tracing engines on item_responses.")
+    parser.add_argument("--db", default="knowledge_tracing.sqlite")
+    parser.add_argument("--shards", type=int, default=1)
+    parser.add_argument("--engines", nargs="+", choices=sorted(TRACING_ENGINES), default=list(TRACING_ENGINES))
+    parser.add_argument("--chunk-size", type=int, default=500_000)
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+
+    report = run_benchmark(TracingStore(args.db, num_shards=args.shards), args.engines, args.chunk_size)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.out}")
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
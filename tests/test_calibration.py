@@ -0,0 +1,59 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+from scipy import sparse
+
+from cog_tutor.calibration import ResponseMatrix, calibrate_store, fit_items
+from cog_tutor.knowledge_tracing import ItemResponse, KnowledgeTracer, TracingStore
+
+
+def _simulate(n_learners, difficulty, discrimination, seed=0):
+    rng = np.random.default_rng(seed)
+    theta = rng.normal(size=n_learners)
+    p = 1.0 / (1.0 + np.exp(-discrimination * (theta[:, None] - difficulty)))
+    return rng.random(p.shape) < p
+
+
+def test_2pl_fit_recovers_simulated_item_parameters():
+    difficulty = np.linspace(-2.0, 2.0, 12)
+    discrimination = np.tile([0.7, 1.0, 1.6], 4)
+    correct = _simulate(3000, difficulty, discrimination).astype(np.float64)
+    matrix = ResponseMatrix(
+        sparse.csr_matrix(correct), sparse.csr_matrix(np.ones_like(correct)),
+        [f"i{i}" for i in range(12)], ["ratios"] * 12
+    )
+
+    fitted = fit_items(matrix, "2pl")
+    assert fitted.converged
+    assert np.abs(fitted.difficulty - difficulty).max() < 0.35
+    assert np.corrcoef(fitted.discrimination, discrimination)[0, 1] > 0.9
+
+    rasch = fit_items(matrix, "1pl")
+    assert (rasch.discrimination == 1.0).all()
+    assert np.corrcoef(rasch.difficulty, difficulty)[0, 1] > 0.95
+    with pytest.raises(ValueError):
+        fit_items(matrix, "3pl")
+
+
+def test_calibrate_store_publishes_parameters_to_every_shard(tmp_path):
+    store = TracingStore(str(tmp_path / "tracing.sqlite"), num_shards=2)
+    try:
+        difficulty = np.array([-1.5, 0.0, 1.5])
+        answers = _simulate(300, difficulty, np.ones(3), seed=1)
+        for learner, row in enumerate(answers):
+            tracer = KnowledgeTracer(user_id=f"u{learner}", store=store)
+            for item, correct in enumerate(row):
+                tracer.update_mastery(ItemResponse(f"i{item}", "ratios", bool(correct), 1.0, 0, 0.0, datetime.now()))
+        tracer.update_mastery(ItemResponse("rare", "ratios", True, 1.0, 0, 0.0, datetime.now()))
+
+        report = calibrate_store(store, model="1pl", min_item_responses=20)
+        assert report["items"] == 3 and report["learners"] == 300
+
+        for user in ("u0", "u1"):
+            tracer = KnowledgeTracer(user_id=user, store=store)
+            fitted = [tracer.item_parameters(f"i{item}")[0] for item in range(3)]
+            assert fitted == sorted(fitted) and fitted[0] < -0.5 < 0.5 < fitted[2]
+            assert tracer.item_parameters("rare") is None
+    finally:
+        store.close()
@@ -0,0 +1,54 @@
+import io
+
+from cog_tutor.rag.chunking import (
+    MAX_OVERLAP_FRACTION, chunk_document, chunk_sentences, ingest_document, iter_sentences
+)
+from cog_tutor.rag.knowledge_base import KnowledgeBase
+
+
+def _sentence(n_words, tag):
+    return " ".join(f"{tag}{i}" for i in range(n_words)) + "."
+
+
+def _overlap(previous, current):
+    shared = 0
+    for size in range(1, min(len(previous), len(current)) + 1):
+        if previous[-size:] == current[:size]:
+            shared = size
+    return sum(len(sentence.split()) for sentence in current[:shared])
+
+
+def test_overlap_is_capped_by_a_fraction_of_the_passage():
+    # A short sentence followed by a long one used to carry the long one over whole
+    sentences = [_sentence(5, "a"), _sentence(40, "b"), _sentence(5, "c"), _sentence(40, "d"), _sentence(5, "e")]
+    passages = list(chunk_sentences(sentences, chunk_words=40, overlap_words=60))
+    for previous, current in zip(passages, passages[1:]):
+        previous_words = sum(len(s.split()) for s in previous)
+        assert _overlap(previous, current) <= previous_words * MAX_OVERLAP_FRACTION
+    assert passages[-1][-1] == sentences[-1]
+
+
+def test_overlap_repeats_trailing_sentences_within_budget():
+    sentences = [_sentence(10, tag) for tag in "abcdefgh"]
+    passages = list(chunk_sentences(sentences, chunk_words=40, overlap_words=20))
+    assert passages[0] == sentences[:4]
+    assert passages[1][:2] == sentences[2:4]
+    assert [s for passage in passages for s in passage][-1] == sentences[-1]
+
+
+def test_iter_sentences_splits_across_lines_and_paragraphs():
+    lines = ["The ratio is 2:3. Fractions", "have a numerator.", "", "A heading without a full stop"]
+    assert list(iter_sentences(lines)) == [
+        "The ratio is 2:3.", "Fractions have a numerator.", "A heading without a full stop"
+    ]
+
+
+def test_ingest_document_writes_tagged_passages(tmp_path):
+    kb = KnowledgeBase(str(tmp_path / "kb.sqlite"))
+    text = "An equation is solved by doing the same thing to both sides. " * 30
+    written = ingest_document(kb, io.StringIO(text), doc_id="unit", chunk_words=50, overlap_words=10)
+    items = [item for item in kb.get_all_items() if item["id"].startswith("unit_")]
+    assert written == len(items) > 1
+    assert {item["skill"] for item in items} == {"linear_equations"}
+    assert all(item["facts"] for item in items)
+    assert next(chunk_document(["x"], "doc", skill="ratios"))["skill"] == "ratios"
@@ -0,0 +1,42 @@
+from cog_tutor.dedupe import MinHashLSH, find_duplicates
+
+
+def test_light_edits_are_duplicates_and_new_numbers_are_not():
+    texts = [
+        "Solve for x: 3x + 7 = 22 when x is an integer",
+        "SOLVE for x: 3x + 7 = 22, when x is an integer?",
+        "Solve for x: 5x - 2 = 13 when x is an integer",
+    ]
+    assert find_duplicates(texts) == [(1, 0)]
+
+
+def test_word_problems_differing_only_in_a_number_are_kept():
+    train = ("A train travels at 60 miles per hour for 3 hours without stopping. "
+             "How many miles does the train travel in total before it reaches the station?")
+    baking = ("A baker mixes 3 cups of flour with 9 cups of sugar for a large batch of cookies. "
+              "How many cups of ingredients does the baker use altogether in the whole batch?")
+    texts = [
+        train,
+        train.replace("3 hours", "5 hours"),
+        baking,
+        baking.replace("9 cups", "12 cups"),
+        "Please note: " + train.upper(),
+        baking.replace("large", "big"),
+    ]
+    assert find_duplicates(texts) == [(4, 0), (5, 2)]
+
+
+def test_short_and_empty_stems_are_compared_as_text():
+    texts = ["", "Factor", "Simplify", "factor!", "", "x"]
+    assert find_duplicates(texts) == [(3, 1), (4, 0)]
+
+
+def test_index_keeps_only_the_newest_keys_when_bounded():
+    index = MinHashLSH(max_keys=3)
+    texts = [f"Question number {i} about a topic called t{i} with extra words w{i}" for i in range(5)]
+    for i, signature in enumerate(index.signatures(texts)):
+        index.insert(i, signature)
+    assert len(index) == 3
+    assert 0 not in index and 1 not in index and 4 in index
+    assert index.query(index.signature(texts[0])) is None
+    assert index.query(index.signature(texts[4]))[0] == 4
@@ -0,0 +1,100 @@
+import threading
+
+import numpy as np
+import pytest
+
+from cog_tutor.rag.dense import DenseRetriever, HashingEncoder, IVFIndex, QuantizedVectors
+from cog_tutor.rag.knowledge_base import KnowledgeBase
+
+
+def _unit_vectors(n, dim=32, seed=0):
+    vectors = np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_hashing_encoder_returns_unit_vectors():
+    embeddings = HashingEncoder(dim=64).encode(["ratios compare quantities", "like terms"])
+    assert embeddings.shape == (2, 64) and embeddings.dtype == np.float32
+    assert np.allclose(np.linalg.norm(embeddings, axis=1), 1.0, atol=1e-5)
+
+
+@pytest.mark.parametrize("storage, tolerance", [("int8", 0.02), ("float16", 1e-3)])
+def test_quantized_scores_stay_close_to_float(storage, tolerance):
+    vectors, queries = _unit_vectors(50), _unit_vectors(3, seed=1)
+    store = QuantizedVectors(32, storage)
+    store.replace(*store.encode_block(vectors))
+    assert np.abs(store.scores(0, 50, queries) - queries @ vectors.T).max() < tolerance
+    assert store.nbytes < vectors.nbytes
+
+
+def test_ivf_search_probing_every_list_is_exact_and_pads_missing_ids():
+    vectors = _unit_vectors(400)
+    index = IVFIndex(32, nlist=8, nprobe=8, storage="float16")
+    index.train(vectors)
+    index.add(vectors[:300])
+    index.search(vectors[:1], 1)  # lays out the first batch before more rows arrive
+    index.add(vectors[300:])
+
+    queries = _unit_vectors(10, seed=2)
+    approx_scores, approx_ids = index.search(queries, 5)
+    exact_scores, exact_ids = index.exact_search(queries, 5)
+    assert (approx_ids == exact_ids).all()
+    assert np.allclose(approx_scores, exact_scores)
+    assert (exact_ids[:, 0] == np.argmax(queries @ vectors.T, axis=1)).all()
+
+    small = IVFIndex(32)
+    small.train(vectors[:2])
+    small.add(vectors[:2])
+    _, ids = small.search(queries[:1], 4)
+    assert sorted(ids[0, :2].tolist()) == [0, 1] and ids[0, 2:].tolist() == [-1, -1]
+
+
+def test_ivf_score_ids_matches_stored_scores():
+    vectors = _unit_vectors(100)
+    index = IVFIndex(32, nlist=4, storage="float16")
+    index.train(vectors)
+    index.add(vectors)
+    ids = np.array([5, 17, 99])
+    assert np.allclose(index.score_ids(vectors[17], ids), vectors[ids] @ vectors[17], atol=1e-3)
+
+
+def test_dense_retriever_finds_an_item_from_its_own_text(tmp_path):
+    kb = KnowledgeBase(str(tmp_path / "kb.sqlite"))
+    dense = DenseRetriever(kb)
+    target = kb.get_all_items()[2]
+    results = dense.retrieve_relevant_knowledge(target["content"], top_k=3)
+    assert results[0]["id"] == target["id"]
+    assert results[0]["relevance_score"] > 0.5
+    rows = np.array([2])
+    assert dense.score_rows(target["content"], rows)[0] == pytest.approx(results[0]["relevance_score"], abs=1e-6)
+
+
+def test_concurrent_first_searches_fold_pending_batches_once():
+    vectors = _unit_vectors(2000)
+    index = IVFIndex(32, nlist=16, storage="float16")
+    index.train(vectors)
+    for start in range(0, 2000, 100):
+        index.add(vectors[start:start + 100])
+
+    barrier = threading.Barrier(8)
+    results = []
+
+    def first_search():
+        barrier.wait()
+        results.append(index.search(vectors[:5], 3)[1])
+
+    threads = [threading.Thread(target=first_search) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(index.ids) == 2000 and sorted(index.ids.tolist()) == list(range(2000))
+    assert (index.positions[index.ids] == np.arange(2000)).all()
+    assert all((ids[:, 0] == np.arange(5)).all() for ids in results)
+
+
+def test_dense_retriever_lays_out_its_index_before_serving(tmp_path):
+    dense = DenseRetriever(KnowledgeBase(str(tmp_path / "kb.sqlite")), batch_size=2)
+    assert dense.index._pending == []
+    assert len(dense.index.ids) == len(dense.all_items)
@@ -0,0 +1,52 @@
+import time
+
+import pytest
+
+from cog_tutor.adaptive_tutor import AdaptiveTutor
+from cog_tutor.grading import answers_equivalent, canonical_answer
+
+
+@pytest.mark.parametrize("user, expected", [
+    ("0.5", "1/2"),
+    ("1/2", "0.5"),
+    ("x = 1/2", "1/2"),
+    ("1/2 = x", "0.5"),
+    ("x=0.5", "x = 1/2"),
+    ("50%", "1/2"),
+    ("0.33", "1/3"),
+    ("2(x + 1)", "2*(x+1)"),
+])
+def test_equal_values_match(user, expected):
+    assert answers_equivalent(user, expected)
+
+
+@pytest.mark.parametrize("user, expected", [
+    ("2x + 3 = 7", "x = 2"),
+    ("2x = 1", "x = 1/2"),
+    ("2x = 1", "1/2"),
+    ("0.4", "1/2"),
+])
+def test_restated_or_wrong_answers_do_not_match(user, expected):
+    assert not answers_equivalent(user, expected)
+
+
+@pytest.mark.parametrize("user, expected", [
+    ("2x + 2", "2(x + 1)"),
+    ("x^2 - 1", "(x + 1)(x - 1)"),
+])
+def test_expression_equivalence_is_opt_in(user, expected):
+    assert not answers_equivalent(user, expected)
+    assert answers_equivalent(user, expected, expression_equivalence=True)
+
+
+def test_form_sensitive_skills_need_the_expected_form():
+    evaluate = AdaptiveTutor._evaluate_answer.__get__(object.__new__(AdaptiveTutor))
+    assert not evaluate("x^2 - 1", "(x + 1)(x - 1)", "algebra_simplification")
+    assert evaluate("2x + 2", "2(x + 1)", "linear_equations")
+
+
+def test_huge_constants_are_rejected_quickly():
+    started = time.monotonic()
+    canonical = canonical_answer("(((((9**12)**12)**12)**12)**12)**12")
+    assert canonical.kind == "text"
+    assert time.monotonic() - started < 0.5
@@ -0,0 +1,281 @@
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from cog_tutor.knowledge_tracing import (
+    ItemResponse, KnowledgeTracer, ResponseHistory, TracingStore, decay_theta, difficulty_to_logit, get_engine,
+    irt_update, logit_to_difficulty, top_k_indices
+)
+
+
+@pytest.fixture
+def store(tmp_path):
+    s = TracingStore(str(tmp_path / "tracing.sqlite"))
+    yield s
+    s.close()
+
+
+def _calibrate(store, item_id, difficulty, discrimination=1.0):
+    with sqlite3.connect(store.shard_path("u1")) as conn:
+        conn.execute("""
+            INSERT INTO item_parameters (item_id, skill, difficulty, discrimination, n_responses, model, calibrated_at)
+            VALUES (?, 'ratios', ?, ?, 100, '2pl', ?)
+        """, (item_id, difficulty, discrimination, datetime.now().isoformat()))
+    store.reload_item_parameters()
+
+
+def test_difficulty_scale_conversions_round_trip():
+    assert difficulty_to_logit(0.5) == pytest.approx(0.0)
+    assert difficulty_to_logit(0.1) < 0 < difficulty_to_logit(0.9)
+    for b in (-4.0, -1.0, 0.0, 2.5):
+        assert difficulty_to_logit(logit_to_difficulty(b)) == pytest.approx(b)
+    assert np.isfinite(difficulty_to_logit(np.array([0.0, 1.0]))).all()
+
+
+@pytest.mark.parametrize("theta", [-2.0, 0.0, 2.5])
+@pytest.mark.parametrize("difficulty", [-6.0, -1.0, 0.0, 1.0, 6.0])
+def test_correct_answers_never_lower_theta(theta, difficulty):
+    up, _ = irt_update(theta, 1.0, True, difficulty, 0)
+    down, _ = irt_update(theta, 1.0, False, difficulty, 0)
+    assert up >= theta >= down
+
+
+def test_correct_answer_on_easy_calibrated_item_earns_credit(store):
+    _calibrate(store, "easy", -2.0)
+    tracer = KnowledgeTracer(user_id="u1", store=store)
+    theta = tracer.update_mastery(ItemResponse(
+        "easy", "ratios", True, 3.0, 0, difficulty=0.0, timestamp=datetime.now()
+    ))
+    assert theta > 0.0
+
+
+def test_recommendations_report_difficulty_on_question_scale(store):
+    _calibrate(store, "hard", 2.0)
+    tracer = KnowledgeTracer(user_id="u1", store=store)
+    candidates = [
+        {"item_id": "hard", "skill": "ratios", "difficulty": 0.5, "type": "practice"},
+        {"item_id": "plain", "skill": "ratios", "difficulty": 0.3, "type": "practice"},
+    ]
+    recommendations = {rec["item_id"]: rec for rec in tracer.get_next_item_recommendations(candidates)}
+    assert recommendations["hard"]["difficulty"] == pytest.approx(logit_to_difficulty(2.0))
+    assert recommendations["plain"]["difficulty"] == pytest.approx(0.3)
+    assert all(0.0 <= rec["difficulty"] <= 1.0 for rec in recommendations.values())
+
+
+def test_vectorized_candidate_scores_match_per_item_scoring(store):
+    tracer = KnowledgeTracer(user_id="u1", store=store)
+    ten_days_ago = datetime.now() - timedelta(days=10)
+    for i in range(6):
+        tracer.update_mastery(ItemResponse(f"r{i}", "ratios", True, 1.0, 0, difficulty=0.0, timestamp=ten_days_ago))
+    tracer.update_mastery(ItemResponse("f0", "fractions", False, 1.0, 0, difficulty=1.0, timestamp=datetime.now()))
+
+    skills = ["ratios", "fractions", "geometry"]
+    rng = np.random.default_rng(0)
+    codes = rng.integers(0, 3, size=200)
+    difficulties = rng.normal(size=200)
+    scores = tracer.score_candidates(skills, codes, difficulties)
+
+    for i in range(0, 200, 17):
+        skill = skills[codes[i]]
+        assert scores["information_gain"][i] == pytest.approx(tracer.calculate_information_gain(skill, difficulties[i]))
+        assert scores["current_mastery"][i] == pytest.approx(tracer.get_mastery_probability(skill))
+    spacing = {skill: scores["spacing_bonus"][codes == j][0] for j, skill in enumerate(skills)}
+    assert spacing == {"ratios": 1.0, "fractions": 0.0, "geometry": 1.0}
+
+
+def test_top_k_indices_picks_the_best_scores_in_order():
+    scores = np.array([0.2, 0.9, 0.1, 0.9, 0.5])
+    assert top_k_indices(scores, 3).tolist() == [1, 3, 4]
+    assert top_k_indices(scores, 10).tolist() == [1, 3, 4, 0, 2]
+    assert top_k_indices(scores, 0).tolist() == []
+
+
+def _response(i, skill="ratios"):
+    return ItemResponse(f"i{i}", skill, i % 2 == 0, 1.0, 0, difficulty=0.0, timestamp=datetime.now())
+
+
+def test_response_history_grows_on_demand_and_wraps_at_capacity():
+    history = ResponseHistory(capacity=200)
+    assert len(history.correct) == ResponseHistory.INITIAL_SLOTS
+    for i in range(150):
+        history.append(_response(i))
+    assert len(history) == 150
+    assert [r.item_id for r in history] == [f"i{i}" for i in range(150)]
+
+    for i in range(150, 450):
+        history.append(_response(i))
+    assert len(history.correct) == len(history) == 200
+    assert [r.item_id for r in history] == [f"i{i}" for i in range(250, 450)]
+    assert history.aggregate().count == 450
+
+
+def test_response_history_aggregates_outlive_the_buffer_per_skill():
+    history = ResponseHistory(capacity=4)
+    assert len(history.correct) == 4
+    for i in range(30):
+        history.append(ItemResponse(
+            f"i{i}", "ratios" if i % 3 else "fractions", i >= 15, 2.0, i % 2, difficulty=0.0,
+            timestamp=datetime(2026, 1, 1)
+        ))
+    assert len(history) == 4
+    totals = history.aggregate()
+    assert (totals.count, totals.correct, totals.hints) == (30, 15, 15)
+    assert totals.response_time == pytest.approx(60.0)
+    assert totals.first == [False] * 10 and list(totals.recent) == [True] * 10
+    assert history.aggregate("fractions").count == 10
+    assert history.aggregate("unknown") is None
+
+
+def test_response_history_retention_counts_only_older_responses():
+    history = ResponseHistory()
+    now = datetime(2026, 3, 1)
+    practice = [(10, "ratios", True), (10, "ratios", False), (8, "fractions", True), (1, "ratios", False)]
+    for days_ago, skill, correct in practice:
+        history.append(ItemResponse("i", skill, correct, 1.0, 0, 0.0, now - timedelta(days=days_ago)))
+    assert history.retention_rate(now=now) == pytest.approx(2 / 3)
+    assert history.retention_rate("ratios", now=now) == pytest.approx(0.5)
+    assert history.retention_rate("geometry", now=now) is None
+    assert ResponseHistory().retention_rate() is None
+
+
+def test_handles_on_one_user_update_shared_masteries_safely(store):
+    tracers = [KnowledgeTracer(user_id="u1", store=store) for _ in range(4)]
+    assert all(t.skill_masteries is tracers[0].skill_masteries for t in tracers)
+
+    def practise(tracer, n):
+        for i in range(200):
+            tracer.update_mastery(_response(i, skill=f"skill{(i + n) % 50}"))
+            dict(tracer.mastery_snapshot())
+
+    threads = [threading.Thread(target=practise, args=(t, n)) for n, t in enumerate(tracers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    snapshot = tracers[0].mastery_snapshot()
+    assert len(snapshot) == 50
+
+
+@pytest.mark.parametrize("num_shards", [1, 4])
+def test_legacy_masteries_migrate_into_the_default_users_shard_only(tmp_path, num_shards):
+    db_path = str(tmp_path / "legacy.sqlite")
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("""
+            CREATE TABLE skill_mastery (
+                skill TEXT PRIMARY KEY, theta REAL, sem REAL, last_practiced TIMESTAMP,
+                practice_count INTEGER, success_rate REAL
+            )
+        """)
+        conn.execute("INSERT INTO skill_mastery VALUES ('ratios', 1.5, 0.4, '2025-01-01T00:00:00', 12, 0.8)")
+
+    store = TracingStore(db_path, num_shards=num_shards)
+    try:
+        holders = []
+        for shard_path in store.shard_paths:
+            with sqlite3.connect(shard_path) as conn:
+                if conn.execute("SELECT COUNT(*) FROM user_skill_mastery").fetchone()[0]:
+                    holders.append(shard_path)
+        assert holders == [store.shard_path("default")]
+        assert store.masteries("default")["ratios"].theta == 1.5
+    finally:
+        store.close()
+
+
+def test_forgetting_is_applied_on_read_not_written_back(tmp_path):
+    sharded = TracingStore(str(tmp_path / "decay.sqlite"), num_shards=2)
+    try:
+        practised = datetime(2026, 1, 1)
+        later = practised + timedelta(days=10, hours=5)
+        thetas = {}
+        for user in ("u1", "u2", "u3"):
+            tracer = KnowledgeTracer(user_id=user, store=sharded)
+            for i in range(4):
+                thetas[user] = tracer.update_mastery(
+                    ItemResponse(f"i{i}", "ratios", True, 1.0, 0, 0.0, practised)
+                )
+
+        tracer = KnowledgeTracer(user_id="u1", store=sharded)
+        assert tracer.get_decayed_theta("ratios", now=later) == pytest.approx(decay_theta(thetas["u1"], 10))
+        fresh, faded = (tracer.get_mastery_probability("ratios", now=moment) for moment in (practised, later))
+        assert 0.5 < faded < fresh
+        with sqlite3.connect(sharded.shard_path("u1")) as conn:
+            stored = conn.execute("SELECT theta FROM user_skill_mastery WHERE user_id = 'u1'").fetchone()[0]
+        assert stored == pytest.approx(thetas["u1"])
+
+        columns = sharded.decayed_masteries(["u3", "u1"], now=later)
+        assert sorted(columns["user_id"]) == ["u1", "u3"]
+        for user, theta, decayed in zip(columns["user_id"], columns["theta"], columns["decayed_theta"]):
+            assert theta == pytest.approx(thetas[user])
+            assert decayed == pytest.approx(decay_theta(thetas[user], 10))
+        assert len(sharded.decayed_masteries(now=later)["user_id"]) == 3
+        assert len(sharded.decayed_masteries(["nobody"])["user_id"]) == 0
+    finally:
+        sharded.close()
+
+
+def test_evicted_users_still_held_by_a_tracer_keep_one_shared_dict(tmp_path):
+    store = TracingStore(str(tmp_path / "evict.sqlite"), cache_size=1)
+    try:
+        first = KnowledgeTracer(user_id="u1", store=store)
+        first.update_mastery(ItemResponse("i0", "ratios", True, 1.0, 0, 0.0, datetime.now()))
+        KnowledgeTracer(user_id="u2", store=store)
+        assert store.cached_users == 1
+
+        second = KnowledgeTracer(user_id="u1", store=store)
+        assert second.skill_masteries is first.skill_masteries
+        for tracer in (first, second, first):
+            tracer.update_mastery(ItemResponse("i1", "ratios", False, 1.0, 0, 0.0, datetime.now()))
+
+        with sqlite3.connect(store.shard_path("u1")) as conn:
+            count = conn.execute(
+                "SELECT practice_count FROM user_skill_mastery WHERE user_id = 'u1'"
+            ).fetchone()[0]
+        assert count == 4
+
+        # Rewritten on disk: live handles are reloaded in place rather than left stale
+        with sqlite3.connect(store.shard_path("u1")) as conn:
+            conn.execute("UPDATE user_skill_mastery SET practice_count = 9 WHERE user_id = 'u1'")
+        store.clear_cache()
+        assert first.skill_masteries is second.skill_masteries
+        assert second.skill_masteries["ratios"].practice_count == 9
+    finally:
+        store.close()
+
+
+def test_engines_without_forgetting_do_not_decay():
+    assert get_engine("bkt").decay(1.5, 30) == 1.5
+    assert get_engine("irt").decay(1.5, 30) == pytest.approx(decay_theta(1.5, 30))
+
+
+def test_users_are_isolated_routed_to_one_shard_and_reloaded_after_eviction(tmp_path):
+    sharded = TracingStore(str(tmp_path / "users.sqlite"), num_shards=3, cache_size=2)
+    try:
+        thetas = {}
+        for n, user in enumerate(("u1", "u2", "u3", "u4")):
+            tracer = KnowledgeTracer(user_id=user, store=sharded)
+            for i in range(n + 1):
+                response = ItemResponse(f"i{i}", "ratios", True, 1.0, 0, 0.0, datetime.now())
+                thetas[user] = tracer.update_mastery(response)
+        assert sharded.cached_users <= 2
+
+        for user, theta in thetas.items():
+            owners = []
+            for path in sharded.shard_paths:
+                with sqlite3.connect(path) as conn:
+                    row = conn.execute(
+                        "SELECT theta, practice_count FROM user_skill_mastery WHERE user_id = ?", (user,)
+                    ).fetchone()
+                if row is not None:
+                    owners.append(path)
+                    assert row[0] == pytest.approx(theta)
+            assert owners == [sharded.shard_path(user)]
+
+        reloaded = KnowledgeTracer(user_id="u1", store=sharded)
+        assert reloaded.skill_masteries["ratios"].practice_count == 1
+        assert reloaded.skill_masteries["ratios"].theta == pytest.approx(thetas["u1"])
+        assert sharded.masteries("u4")["ratios"].practice_count == 4
+    finally:
+        sharded.close()
@@ -0,0 +1,145 @@
+import random
+import threading
+import time
+
+import pytest
+
+from cog_tutor.knowledge_tracing import WriteBehindQueue
+from cog_tutor.question_bank import QuestionBank
+
+
+def _numbered_generator():
+    rng = random.Random(0)
+    words = [f"w{i}" for i in range(5000)]
+    lock = threading.Lock()
+
+    def generate(skill, difficulty):
+        with lock:
+            stem = " ".join(rng.sample(words, 12))
+        return {"question": stem, "answer": "1"}
+    return generate
+
+
+@pytest.fixture
+def bank(tmp_path):
+    b = QuestionBank(str(tmp_path / "bank.sqlite"), generator=_numbered_generator(), low_watermark=0)
+    yield b
+    b.close()
+
+
+def test_users_never_see_a_question_twice_across_restarts(tmp_path):
+    path = str(tmp_path / "bank.sqlite")
+    bank = QuestionBank(path, generator=_numbered_generator(), low_watermark=0)
+    bank.refill("ratios", 2, count=4)
+    first = [bank.serve("u1", "ratios", 0.5)["question_id"] for _ in range(2)]
+    bank.close()
+
+    bank = QuestionBank(path, generator=None)
+    rest = [bank.serve("u1", "ratios", 0.5)["question_id"] for _ in range(2)]
+    assert bank.serve("u1", "ratios", 0.5) is None
+    assert len(set(first + rest)) == 4
+    bank.close()
+
+
+def test_concurrent_serves_hand_out_distinct_questions(bank):
+    bank.refill("ratios", 2, count=40)
+    served, lock = [], threading.Lock()
+
+    def worker():
+        while True:
+            question = bank.serve("u1", "ratios", 0.5)
+            if question is None:
+                return
+            with lock:
+                served.append(question["question_id"])
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(served) == len(set(served)) == 40
+
+
+def test_questions_added_while_a_pool_loads_are_served(bank):
+    bank.refill("ratios", 2, count=2)
+    original = bank._load_pool
+
+    def slow_load(skill, band, after=0):
+        pool = original(skill, band, after)
+        if after == 0:
+            bank.add_questions(skill, band, [{"question": "A late question about scaling recipes", "answer": "2"}])
+        return pool
+
+    bank._load_pool = slow_load
+    ids = {bank.serve("u1", "ratios", 0.5)["question_id"] for _ in range(3)}
+    assert len(ids) == 3
+
+
+def test_refills_that_store_nothing_back_off(tmp_path):
+    calls = []
+
+    def failing(skill, difficulty):
+        calls.append(skill)
+        raise ValueError("unknown prompt")
+
+    bank = QuestionBank(str(tmp_path / "bank.sqlite"), generator=failing, refill_batch=1, refill_backoff=60)
+    assert bank.serve("u1", "ratios", 0.5) is None
+    deadline = time.monotonic() + 5
+    while bank._refilling and time.monotonic() < deadline:
+        time.sleep(0.01)
+    for _ in range(20):
+        assert bank.serve("u1", "ratios", 0.5) is None
+    bank.close()  # waits for any refill those serves queued
+    assert len(calls) == 1
+
+
+def test_bank_shares_a_given_writer(tmp_path):
+    writer = WriteBehindQueue()
+    bank = QuestionBank(str(tmp_path / "bank.sqlite"), generator=_numbered_generator(), writer=writer)
+    bank.refill("ratios", 2, count=1)
+    bank.serve("u1", "ratios", 0.5)
+    bank.close()
+    assert writer.pending == 0
+    writer.put(str(tmp_path / "bank.sqlite"), [])  # still open: the bank did not close it
+    writer.close()
+
+
+def test_blank_and_duplicate_questions_are_not_banked(bank):
+    stem = "Simplify the ratio 12:18 to its lowest terms"
+    ids = bank.add_questions("ratios", 2, [
+        {"question": stem}, {"question": ""}, {"question": "   "}, {"question": stem.upper() + "?"}
+    ])
+    assert len(ids) == 1
+    assert bank.duplicates_rejected == 1
+
+
+def test_dedupe_index_picks_up_rows_inserted_while_it_builds(bank):
+    original = bank._index_rows
+    stem = "A question inserted while the index was being built from disk"
+
+    def racing(index, skill, after=0, limit=None):
+        last = original(index, skill, after, limit)
+        if limit is not None:
+            # Another bank on the same file inserts between the scan and publishing
+            other = QuestionBank(bank.db_path, dedupe_threshold=None)
+            other.add_questions(skill, 2, [{"question": stem}])
+            other.close()
+        return last
+
+    bank._index_rows = racing
+    assert bank.add_questions("ratios", 2, [{"question": stem}]) == []
+
+
+def test_dedupe_delete_refreshes_the_running_bank(tmp_path):
+    bank = QuestionBank(str(tmp_path / "bank.sqlite"), dedupe_threshold=None)
+    stem = "Write the ratio of 6 apples to 9 pears in simplest form"
+    bank.add_questions("ratios", 2, [{"question": stem}, {"question": stem + "!"}])
+    first = bank.serve("u1", "ratios", 0.5)
+    assert bank.serve("u2", "ratios", 0.5)["question_id"] == first["question_id"]
+
+    bank.dedupe_threshold = 0.7
+    report = bank.dedupe(delete=True)
+    assert report["deleted"] == 1
+    assert bank.serve("u1", "ratios", 0.5) is None  # the duplicate is gone from the live pool
+    bank.close()
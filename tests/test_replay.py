@@ -0,0 +1,123 @@
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from cog_tutor.knowledge_tracing import (
+    TRACING_ENGINES, ItemResponse, KnowledgeTracer, TracingEngine, TracingStore, difficulty_to_logit, get_engine
+)
+from cog_tutor.replay import replay_responses, replay_store
+from cog_tutor.tracing_benchmark import run_benchmark
+
+
+def _record(s, engine=None):
+    start = datetime(2026, 1, 1)
+    for user in ("u1", "u2", "u3"):
+        tracer = KnowledgeTracer(user_id=user, store=s, engine=engine)
+        for i in range(30):
+            tracer.update_mastery(ItemResponse(
+                f"i{i}", f"skill{i % 3}", (i * 7 + len(user)) % 3 != 0, 2.0, 0,
+                difficulty=(i % 5 - 2) / 2, timestamp=start + timedelta(days=i // 4, minutes=i)
+            ))
+
+
+@pytest.fixture
+def store(tmp_path):
+    s = TracingStore(str(tmp_path / "tracing.sqlite"))
+    _record(s)
+    yield s
+    s.close()
+
+
+def _masteries(store):
+    rows = []
+    for path in store.shard_paths:
+        with sqlite3.connect(path) as conn:
+            rows += conn.execute(
+                "SELECT user_id, skill, theta, sem, practice_count FROM user_skill_mastery"
+            ).fetchall()
+    return sorted((user, skill, round(theta, 9), round(sem, 9), count) for user, skill, theta, sem, count in rows)
+
+
+def test_tracing_engine_requires_update():
+    with pytest.raises(TypeError):
+        TracingEngine()
+
+
+@pytest.mark.parametrize("chunk_size", [7, 1000])
+def test_replay_reproduces_live_masteries(store, chunk_size):
+    live = _masteries(store)
+    replay_store(store, chunk_size=chunk_size)
+    assert _masteries(store) == live
+
+
+@pytest.mark.parametrize("engine", sorted(TRACING_ENGINES))
+def test_replay_reproduces_each_engine_across_shards(tmp_path, engine):
+    sharded = TracingStore(str(tmp_path / "sharded.sqlite"), num_shards=2)
+    try:
+        _record(sharded, get_engine(engine))
+        live = _masteries(sharded)
+        results = replay_store(sharded, chunk_size=5, engine=get_engine(engine))
+        assert len(results) == 2 and sum(result["responses"] for result in results) == 90
+        assert sum(result["sequences"] for result in results) == 9
+        assert _masteries(sharded) == live
+    finally:
+        sharded.close()
+
+
+def test_replay_responses_marks_continued_sequences(store):
+    with sqlite3.connect(store.shard_path("u1")) as conn:
+        chunks = list(replay_responses(conn, chunk_size=7, predict=True))
+    assert sum(len(chunk.keys) for chunk in chunks) == 90
+    assert sum(len(chunk.sequence_keys) - chunk.continued for chunk in chunks) == 9
+    assert all(chunk.predictions is not None and len(chunk.predictions) == len(chunk.keys) for chunk in chunks)
+    assert all(((chunk.predictions > 0) & (chunk.predictions < 1)).all() for chunk in chunks)
+
+
+def test_benchmark_reports_each_engine(store):
+    report = run_benchmark(store, chunk_size=11)
+    assert {row["engine"] for row in report["results"]} == {"irt", "bkt", "logistic"}
+    for row in report["results"]:
+        assert row["responses"] == 90 and row["sequences"] == 9 and row["learners"] == 3
+        assert "bytes_per_learner" not in row
+        assert 0.0 <= row["auc"] <= 1.0
+
+
+def test_replaying_a_legacy_database_matches_live_tracing(tmp_path):
+    start = datetime(2026, 1, 1)
+    responses = [
+        (f"i{i}", "ratios", i % 3 != 0, 0.2 + 0.15 * (i % 5), start + timedelta(days=i)) for i in range(12)
+    ]
+
+    # Before user scoping and calibration, difficulty was stored on the 0-1 question scale
+    legacy_path = str(tmp_path / "legacy.sqlite")
+    with sqlite3.connect(legacy_path) as conn:
+        conn.execute("""
+            CREATE TABLE item_responses (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, item_id TEXT, skill TEXT, correct BOOLEAN,
+                response_time REAL, hints_used INTEGER, difficulty REAL,
+                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.executemany("""
+            INSERT INTO item_responses (item_id, skill, correct, response_time, hints_used, difficulty, timestamp)
+            VALUES (?, ?, ?, 2.0, 0, ?, ?)
+        """, [(item, skill, correct, difficulty, moment.isoformat())
+              for item, skill, correct, difficulty, moment in responses])
+
+    live = TracingStore(str(tmp_path / "live.sqlite"))
+    tracer = KnowledgeTracer(user_id="default", store=live)
+    for item, skill, correct, difficulty, moment in responses:
+        tracer.update_mastery(ItemResponse(item, skill, correct, 2.0, 0, difficulty_to_logit(difficulty), moment))
+
+    legacy = TracingStore(legacy_path)
+    TracingStore(legacy_path).close()  # opening again must not convert twice
+    try:
+        with sqlite3.connect(legacy_path) as conn:
+            stored = [row[0] for row in conn.execute("SELECT difficulty FROM item_responses ORDER BY id")]
+        assert stored == pytest.approx([difficulty_to_logit(r[3]) for r in responses])
+        replay_store(legacy)
+        assert _masteries(legacy) == _masteries(live)
+    finally:
+        legacy.close()
+        live.close()
@@ -0,0 +1,61 @@
+from datetime import datetime
+
+import pytest
+
+from cog_tutor.knowledge_tracing import ItemResponse, KnowledgeTracer, TracingStore
+from cog_tutor.research_metrics import ResearchMetrics
+
+
+def _answer(tracer, i, correct=True):
+    tracer.update_mastery(ItemResponse(
+        f"i{i}", "ratios", correct, 2.0, 0, difficulty=0.0, timestamp=datetime.now()
+    ))
+
+
+@pytest.fixture
+def store(tmp_path):
+    s = TracingStore(str(tmp_path / "tracing.sqlite"), num_shards=2, metrics_staleness=3600)
+    yield s
+    s.close()
+
+
+def test_database_metrics_share_one_rollup_per_store(store, monkeypatch):
+    tracer = KnowledgeTracer(user_id="u1", store=store)
+    for i in range(5):
+        _answer(tracer, i)
+
+    refreshes = []
+    original = ResearchMetrics._refresh
+    monkeypatch.setattr(ResearchMetrics, "_refresh", lambda self: refreshes.append(1) or original(self))
+
+    first = tracer.get_research_metrics(source="database")
+    assert first["total_responses"] == 5
+    other = KnowledgeTracer(user_id="u1", store=store)
+    for _ in range(10):
+        other.get_research_metrics(source="database")
+    assert store.research_metrics is store.research_metrics
+    assert len(refreshes) == 1
+
+
+def test_stale_reads_catch_up_on_demand(store):
+    tracer = KnowledgeTracer(user_id="u1", store=store)
+    _answer(tracer, 0)
+    assert tracer.get_research_metrics(source="database")["total_responses"] == 1
+
+    _answer(tracer, 1, correct=False)
+    assert tracer.get_research_metrics(source="database")["total_responses"] == 1  # within the staleness window
+    store.research_metrics.refresh()
+    metrics = tracer.get_research_metrics(source="database")
+    assert metrics["total_responses"] == 2
+    assert metrics["accuracy"] == pytest.approx(0.5)
+
+
+def test_zero_staleness_refreshes_every_read(tmp_path):
+    store = TracingStore(str(tmp_path / "fresh.sqlite"), metrics_staleness=0)
+    try:
+        tracer = KnowledgeTracer(user_id="u1", store=store)
+        for i in range(3):
+            _answer(tracer, i)
+            assert tracer.get_research_metrics(source="database")["total_responses"] == i + 1
+    finally:
+        store.close()
@@ -0,0 +1,31 @@
+import copy
+
+from cog_tutor.rag.benchmark import compare_reports, generate_synthetic_curriculum, run_benchmark
+
+
+def test_synthetic_curriculum_is_seeded_and_labels_queries_with_their_source():
+    items, queries = generate_synthetic_curriculum(50, n_queries=10, seed=4)
+    again, _ = generate_synthetic_curriculum(50, n_queries=10, seed=4)
+    assert items == again
+    assert len(items) == 50 and len(queries) == 10
+    by_id = {item["id"]: item for item in items}
+    for query, skill, item_id in queries:
+        assert by_id[item_id]["skill"] == skill
+        assert set(query.split()) <= set(by_id[item_id]["content"].split())
+
+
+def test_run_benchmark_reports_every_mode_and_flags_regressions(tmp_path):
+    report = run_benchmark([200], modes=["sql", "tfidf"], n_queries=20, top_k=5, workdir=str(tmp_path))
+    rows = {row["mode"]: row for row in report["results"]}
+    assert set(rows) == {"sql", "tfidf"}
+    assert rows["tfidf"]["recall@5"] > 0.5
+    assert rows["tfidf"]["build_peak_bytes"] > 0
+    assert compare_reports(report, report) == []
+
+    worse = copy.deepcopy(report)
+    for row in worse["results"]:
+        row["p99_ms"] = row["p99_ms"] * 2 + 1
+        row["recall@5"] -= 0.1
+    regressions = compare_reports(report, worse)
+    assert any("tfidf@200: p99" in line for line in regressions)
+    assert any("tfidf@200: recall@5" in line for line in regressions)
@@ -0,0 +1,198 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from cog_tutor.rag.dense import DenseRetriever
+from cog_tutor.rag.knowledge_base import KnowledgeBase
+from cog_tutor.rag.retriever import (
+    RETRIEVAL_MODES, KnowledgeRetriever, QueryCache, difficulty_band, reciprocal_rank_fusion
+)
+
+
+@pytest.fixture
+def kb(tmp_path):
+    return KnowledgeBase(str(tmp_path / "kb.sqlite"))
+
+
+@pytest.fixture
+def retriever(kb):
+    r = KnowledgeRetriever(kb, dense_retriever=DenseRetriever(kb), cache_size=0)
+    yield r
+    r.close()
+
+
+def test_hybrid_keeps_cosine_relevance_and_reports_fused_score_separately(retriever):
+    query = "solve linear equations by isolating the variable"
+    lexical = {item["id"]: item["relevance_score"]
+               for item in retriever.retrieve_relevant_knowledge(query, top_k=20)}
+    hybrid = retriever.retrieve_relevant_knowledge(query, top_k=5, mode="hybrid")
+
+    assert hybrid
+    fused = [item["fused_score"] for item in hybrid]
+    assert fused == sorted(fused, reverse=True)
+    assert all(score <= 2 / 61 for score in fused)
+    for item in hybrid:
+        assert 0.0 < item["relevance_score"] <= 1.0 + 1e-6
+        if item["id"] in lexical:
+            assert item["relevance_score"] >= lexical[item["id"]] - 1e-9
+
+    plain = retriever.retrieve_relevant_knowledge(query, top_k=5)
+    assert all("fused_score" not in item for item in plain)
+
+
+def test_watch_survives_a_failed_rebuild_and_retries(kb, caplog):
+    retriever = KnowledgeRetriever(kb, cache_size=0)
+    real_rebuild = retriever.rebuild
+    calls = []
+
+    def flaky_rebuild():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("transient failure")
+        return real_rebuild()
+
+    retriever.rebuild = flaky_rebuild
+    try:
+        retriever.watch(interval=0.02)
+        kb.add_knowledge_item({
+            "id": "watched_item", "skill": "geometry", "content": "Angles in a triangle sum to 180 degrees.",
+            "facts": ["Triangle angles sum to 180"], "difficulty": 0.3
+        })
+        deadline = time.monotonic() + 5
+        while retriever.index.version == 0 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert retriever.index.version == 1
+        assert "watched_item" in retriever.index.row_by_id
+        assert "rebuild failed" in caplog.text
+    finally:
+        retriever.close()
+
+
+def test_retrieve_many_matches_single_queries(kb):
+    retriever = KnowledgeRetriever(kb, cache_size=0)
+    try:
+        queries = ["combine like terms", "cross-multiply a proportion", "reciprocal of a fraction", "zzz"]
+        batched = retriever.retrieve_many(queries, top_k=3)
+        assert len(batched) == len(queries)
+        for query, results in zip(queries, batched):
+            assert results == retriever.retrieve_relevant_knowledge(query, top_k=3)
+        assert all(batched[:-1]) and batched[-1] == []
+        assert retriever.retrieve_many([]) == []
+    finally:
+        retriever.close()
+
+
+def test_top_k_indices_returns_best_first_per_row():
+    scores = np.array([[0.1, 0.9, 0.5, 0.7], [0.3, 0.2, 0.8, 0.1]])
+    assert KnowledgeRetriever._top_k_indices(scores, 2).tolist() == [[1, 3], [2, 0]]
+    assert KnowledgeRetriever._top_k_indices(scores, 10).tolist() == [[1, 3, 2, 0], [2, 0, 1, 3]]
+    assert KnowledgeRetriever._top_k_indices(scores, 0).shape == (2, 0)
+
+
+def test_query_cache_is_a_bounded_lru():
+    cache = QueryCache(max_size=2)
+    cache.put(("a",), [(0, 1.0)])
+    cache.put(("b",), [(1, 1.0)])
+    assert cache.get(("a",)) == [(0, 1.0)]
+    cache.put(("c",), [(2, 1.0)])  # evicts "b", the least recently used
+    assert cache.get(("b",)) is None
+    assert len(cache) == 2 and (cache.hits, cache.misses) == (1, 1)
+
+
+def test_cached_rankings_are_shared_by_normalized_query_and_dropped_on_rebuild(kb):
+    retriever = KnowledgeRetriever(kb)
+    try:
+        first = retriever.retrieve_relevant_knowledge("Combine  LIKE terms", top_k=2)
+        assert retriever.retrieve_relevant_knowledge("combine like terms", top_k=1) == first[:1]
+        assert retriever.query_cache.hits == 1
+
+        retriever.rebuild()
+        retriever.retrieve_relevant_knowledge("combine like terms", top_k=2)
+        assert retriever.query_cache.hits == 1  # the new index version misses
+    finally:
+        retriever.close()
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = dict(reciprocal_rank_fusion([[1, 2, 3], [3, 1]], k=60))
+    assert fused[1] == pytest.approx(1 / 61 + 1 / 62)
+    assert fused[1] > fused[3] > fused[2]
+
+
+def _leading(items, matches):
+    """How many items at the head of the list satisfy matches."""
+    count = 0
+    while count < len(items) and matches(items[count]):
+        count += 1
+    return count
+
+
+def test_skill_and_band_filters_rank_matching_rows_first_then_top_up(retriever):
+    query = "simplify the expression and solve the equation"
+    unfiltered = {item["id"]: item["relevance_score"]
+                  for item in retriever.retrieve_relevant_knowledge(query, top_k=20)}
+
+    for mode in RETRIEVAL_MODES:
+        algebra = retriever.retrieve_relevant_knowledge(query, skill="algebra", top_k=5, mode=mode)
+        assert algebra and "algebra" in algebra[0]["skill"]
+        assert len({item["id"] for item in algebra}) == len(algebra)
+        # Matching rows lead; anything after them came from the global top-up
+        head = _leading(algebra, lambda item: "algebra" in item["skill"])
+        assert all("algebra" not in item["skill"] for item in algebra[head:])
+
+    # Both paths apply the same relevance threshold
+    tfidf = retriever.retrieve_relevant_knowledge(query, skill="algebra", top_k=5)
+    assert all(item["relevance_score"] > retriever.min_score for item in tfidf)
+    for item in tfidf:
+        assert item["relevance_score"] == pytest.approx(unfiltered[item["id"]])
+
+    band = difficulty_band(0.5)
+    in_band = retriever.retrieve_relevant_knowledge(query, band=band, top_k=5, mode="dense")
+    assert len(in_band) == 5
+    head = _leading(in_band, lambda item: difficulty_band(item["difficulty"]) == band)
+    assert head > 0 and all(difficulty_band(item["difficulty"]) != band for item in in_band[head:])
+    both = retriever.retrieve_relevant_knowledge(query, skill="algebra", band=band, top_k=5, mode="dense")
+    assert both[0]["id"] == "algebra_simplify_002"
+    assert len(both) == 5
+
+
+def test_filters_matching_nothing_fall_back_to_the_whole_index(retriever):
+    query = "cross-multiply a proportion"
+    assert (retriever.retrieve_relevant_knowledge(query, skill="no_such_skill", top_k=3)
+            == retriever.retrieve_relevant_knowledge(query, top_k=3))
+
+
+def test_readers_never_see_a_half_built_index_during_rebuilds(kb):
+    retriever = KnowledgeRetriever(kb, cache_size=0)
+    errors = []
+    stop = threading.Event()
+
+    def read():
+        while not stop.is_set():
+            try:
+                index = retriever.index
+                for item in retriever.retrieve_relevant_knowledge("simplify like terms", top_k=3):
+                    assert item["id"] in index.row_by_id or item["id"].startswith("hot_")
+            except Exception as error:  # surfaced in the main thread
+                errors.append(error)
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for reader in readers:
+        reader.start()
+    try:
+        for i in range(10):
+            kb.add_knowledge_item({
+                "id": f"hot_{i}", "skill": "algebra_simplification",
+                "content": f"Like terms share variables, example {i}.", "facts": ["Combine like terms"],
+                "difficulty": 0.4
+            })
+            assert retriever.rebuild_async().result().version == i + 1
+    finally:
+        stop.set()
+        for reader in readers:
+            reader.join()
+        retriever.close()
+    assert errors == []
+    assert "hot_9" in retriever.index.row_by_id
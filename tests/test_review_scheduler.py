@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from cog_tutor.knowledge_tracing import ItemResponse, KnowledgeTracer, TracingStore
+from cog_tutor.review_scheduler import (
+    REVIEW_MAX_DAYS, REVIEW_MIN_DAYS, ReviewScheduler, review_interval_days
+)
+
+NOW = datetime(2026, 5, 1, 12, 0)
+
+
+@pytest.fixture
+def store(tmp_path):
+    s = TracingStore(str(tmp_path / "tracing.sqlite"), num_shards=2, write_behind=True)
+    yield s
+    s.close()
+
+
+def test_review_interval_grows_with_ability_within_bounds():
+    assert review_interval_days(0.0) == 7.0
+    assert review_interval_days(1.0) == 14.0
+    assert review_interval_days(-10.0) == REVIEW_MIN_DAYS
+    assert review_interval_days(10.0) == REVIEW_MAX_DAYS
+
+
+def test_pop_due_returns_most_overdue_first_and_skips_superseded_entries(store):
+    scheduler = ReviewScheduler(store)
+    scheduler.schedule("u1", "ratios", NOW - timedelta(days=1))
+    scheduler.schedule("u1", "fractions", NOW - timedelta(days=3))
+    scheduler.schedule("u1", "geometry", NOW + timedelta(days=2))
+    scheduler.schedule("u1", "fractions", NOW + timedelta(days=5))  # supersedes the overdue entry
+
+    assert scheduler.next_due("u1") == ("ratios", NOW - timedelta(days=1))
+    assert scheduler.pop_due("u1", now=NOW, limit=5) == [("ratios", NOW - timedelta(days=1))]
+    assert scheduler.pop_due("u1", now=NOW) == []
+    assert scheduler.next_due("u1") == ("geometry", NOW + timedelta(days=2))
+
+
+def test_queues_persist_and_reload_from_the_store(store):
+    scheduler = ReviewScheduler(store, cache_size=1)
+    scheduler.schedule("u1", "ratios", NOW - timedelta(hours=1))
+    scheduler.schedule("u2", "ratios", NOW - timedelta(days=2))
+    scheduler.schedule("u2", "fractions", NOW - timedelta(days=1))
+
+    fresh = ReviewScheduler(store)
+    assert fresh.next_due("u1") == ("ratios", NOW - timedelta(hours=1))
+    assert fresh.overdue_users(now=NOW) == [
+        ("u2", 2, NOW - timedelta(days=2)), ("u1", 1, NOW - timedelta(hours=1))
+    ]
+
+    fresh.pop_due("u2", now=NOW)
+    assert ReviewScheduler(store).overdue_users(now=NOW, limit=1) == [("u2", 1, NOW - timedelta(days=1))]
+
+
+def test_practice_reschedules_and_rebuild_recomputes_from_masteries(store):
+    scheduler = ReviewScheduler(store)
+    tracer = KnowledgeTracer(user_id="u1", store=store, scheduler=scheduler)
+    theta = tracer.update_mastery(ItemResponse("i1", "ratios", True, 2.0, 0, 0.0, NOW))
+
+    due = NOW + timedelta(days=review_interval_days(theta))
+    assert scheduler.next_due("u1") == ("ratios", due)
+
+    scheduler.schedule("u1", "ratios", NOW + timedelta(days=90))
+    assert scheduler.rebuild() == 1
+    assert scheduler.next_due("u1") == ("ratios", due)
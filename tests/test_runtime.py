@@ -0,0 +1,135 @@
+import asyncio
+import inspect
+import sys
+import threading
+import time
+import types
+
+import pytest
+
+import cog_tutor.adaptive_tutor as adaptive_tutor
+import cog_tutor.question_bank as question_bank
+import cog_tutor.runtime as runtime_module
+from cog_tutor.adaptive_tutor import AdaptiveTutor
+from cog_tutor.adapters.qwen_adapter import QwenAdapter
+from cog_tutor.runtime import TutorRuntime
+
+
+@pytest.fixture
+def runtime(tmp_path):
+    rt = TutorRuntime(
+        knowledge_db=str(tmp_path / "kb.sqlite"),
+        tracing_db=str(tmp_path / "tracing.sqlite"),
+        generation_workers=2,
+        max_abandoned=1,
+        question_db=None,
+    )
+    yield rt
+    rt.close()
+
+
+def _slow_prompt(seconds):
+    def run_prompt(name, payload, model_id=None):
+        time.sleep(seconds)
+        if name == "item_explanation_with_rag":
+            return {"hint": "h", "guided": "g", "full": "model explanation"}
+        return {"question": "model question", "answer": "1", "difficulty": payload["difficulty"]}
+    return run_prompt
+
+
+def test_process_student_response_is_sequential_by_default():
+    signature = inspect.signature(AdaptiveTutor.process_student_response)
+    assert signature.parameters["concurrent"].default is False
+
+
+def test_tutors_on_one_runtime_share_its_services(runtime, monkeypatch):
+    built = []
+    monkeypatch.setattr(runtime_module.KnowledgeRetriever, "__init__", lambda self, *a, **k: built.append(1))
+    tutors = [AdaptiveTutor(f"u{i}", runtime=runtime) for i in range(3)]
+    assert built == []
+    assert all(t.retriever is runtime.retriever and t.knowledge_base is runtime.knowledge_base for t in tutors)
+    assert all(t.knowledge_tracer.store is runtime.tracing_store for t in tutors)
+
+    # Two handles on one user share the store's cached masteries
+    again = AdaptiveTutor("u0", runtime=runtime)
+    assert again.knowledge_tracer.skill_masteries is tutors[0].knowledge_tracer.skill_masteries
+    assert again.knowledge_tracer.skill_masteries is not tutors[1].knowledge_tracer.skill_masteries
+
+
+def test_timed_out_generations_are_tracked_and_shed(runtime, monkeypatch):
+    monkeypatch.setattr(adaptive_tutor, "run_prompt", _slow_prompt(0.5))
+    monkeypatch.setattr(question_bank, "run_prompt", _slow_prompt(0.5))
+    tutor = AdaptiveTutor("u1", runtime=runtime)
+
+    result = tutor.process_student_response(
+        "i1", "ratios", "Simplify 2:4", "1:2", "1:2", 3.0,
+        concurrent=True, generation_timeout=0.05
+    )
+    assert result["correct"] is True
+    assert result["explanation"]["full"].startswith("The correct answer is")
+    assert runtime.abandoned_generations >= 1
+
+    # With the abandoned budget used up, generations fall back without queueing
+    started = time.monotonic()
+    result = tutor.process_student_response(
+        "i2", "ratios", "Simplify 3:6", "1:2", "1:2", 3.0,
+        concurrent=True, generation_timeout=5.0
+    )
+    assert time.monotonic() - started < 0.4
+    assert result["explanation"]["full"].startswith("The correct answer is")
+
+    runtime.generation_executor.shutdown(wait=True)
+    assert runtime.abandoned_generations == 0
+
+
+def test_adapter_loads_model_once_under_concurrency(monkeypatch):
+    loads = []
+
+    class FakeLLM:
+        def __init__(self, model_name):
+            time.sleep(0.05)
+            loads.append(model_name)
+
+    monkeypatch.setitem(sys.modules, "cognitive_llm", types.SimpleNamespace(CognitiveLLM=FakeLLM))
+    adapter = QwenAdapter("test-model")
+    threads = [threading.Thread(target=adapter._initialize_client) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert loads == ["test-model"]
+
+
+def _await_both(result):
+    async def both():
+        return await result["explanation_ticket"], await result["recommendations_ticket"]
+    return asyncio.run(both())
+
+
+def test_deferred_tickets_resolve_to_generated_results(runtime, monkeypatch):
+    monkeypatch.setattr(adaptive_tutor, "run_prompt", _slow_prompt(0.05))
+    monkeypatch.setattr(question_bank, "run_prompt", _slow_prompt(0.05))
+    tutor = AdaptiveTutor("u1", runtime=runtime)
+
+    result = tutor.process_student_response(
+        "i1", "ratios", "Simplify 2:4", "1:2", "1:2", 3.0, deferred=True
+    )
+    assert result["correct"] is True
+    explanation, recommendations = _await_both(result)
+    assert explanation["full"] == "model explanation"
+    assert recommendations and all(rec["question"] == "model question" for rec in recommendations)
+
+
+def test_deferred_tickets_fall_back_when_generation_is_refused(runtime, monkeypatch):
+    monkeypatch.setattr(adaptive_tutor, "run_prompt", _slow_prompt(0.05))
+    tutor = AdaptiveTutor("u1", runtime=runtime)
+    blocker = runtime.submit(time.sleep, 0.5)
+    runtime.abandon(blocker)  # uses up the abandoned budget, so new calls are refused
+
+    result = tutor.process_student_response(
+        "i1", "ratios", "Simplify 2:4", "1:3", "1:2", 3.0, deferred=True
+    )
+    explanation, recommendations = _await_both(result)
+    assert explanation["full"].startswith("The correct answer is 1:2")
+    assert recommendations and all("question" not in rec for rec in recommendations)
+    assert all(0.0 <= rec["difficulty"] <= 1.0 for rec in recommendations)
@@ -0,0 +1,105 @@
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+from cog_tutor.adaptive_tutor import AdaptiveTutor
+from cog_tutor.knowledge_tracing import ItemResponse
+from cog_tutor.runtime import TutorRuntime
+from cog_tutor.sessions import SessionManager, restore_session, snapshot_session
+
+
+@pytest.fixture
+def runtime(tmp_path):
+    rt = TutorRuntime(
+        knowledge_db=str(tmp_path / "kb.sqlite"), tracing_db=str(tmp_path / "tracing.sqlite")
+    )
+    yield rt
+    rt.close()
+
+
+def _practise(tutor, n):
+    for i in range(n):
+        response = ItemResponse(
+            f"i{i}", "ratios", i % 3 != 0, 1.5 + i, i % 2, difficulty=0.25 * i,
+            timestamp=datetime(2026, 3, 1, 12, i)
+        )
+        tutor.knowledge_tracer.update_mastery(response)
+        tutor.session_responses.append(response)
+
+
+def test_snapshot_restore_round_trip(runtime):
+    tutor = AdaptiveTutor("u1", runtime=runtime)
+    _practise(tutor, 7)
+
+    restored = restore_session(snapshot_session(tutor), runtime)
+    assert restored.user_id == "u1"
+    assert restored.session_start.timestamp() == pytest.approx(tutor.session_start.timestamp())
+    assert restored.session_responses == tutor.session_responses
+    assert list(restored.knowledge_tracer.response_history) == list(tutor.knowledge_tracer.response_history)
+    assert (restored.knowledge_tracer.get_research_metrics()
+            == tutor.knowledge_tracer.get_research_metrics())
+
+
+def test_snapshots_keep_only_the_response_history_capacity(tmp_path):
+    runtime = TutorRuntime(
+        knowledge_db=str(tmp_path / "kb.sqlite"), tracing_db=str(tmp_path / "tracing.sqlite"),
+        history_capacity=5
+    )
+    try:
+        tutor = AdaptiveTutor("u1", runtime=runtime)
+        _practise(tutor, 12)
+
+        restored = restore_session(snapshot_session(tutor), runtime)
+        assert restored.session_responses == tutor.session_responses[-5:]
+        assert list(restored.knowledge_tracer.response_history) == list(tutor.knowledge_tracer.response_history)
+    finally:
+        runtime.close()
+
+
+def test_sessions_over_capacity_are_parked_and_restored(runtime, tmp_path):
+    manager = SessionManager(db_path=str(tmp_path / "sessions.sqlite"), runtime=runtime,
+                             max_active=2, idle_timeout=None)
+    _practise(manager.get("u1"), 3)
+    manager.get("u2")
+    manager.get("u3")
+    assert "u1" not in manager and len(manager) == 2
+    assert manager.stats()["snapshots"] == 1
+
+    restored = manager.get("u1")
+    assert [r.item_id for r in restored.session_responses] == ["i0", "i1", "i2"]
+    assert manager.restores == 1
+    manager.close()
+
+
+def test_idle_sessions_are_parked_on_a_timer(runtime, tmp_path):
+    manager = SessionManager(db_path=str(tmp_path / "sessions.sqlite"), runtime=runtime,
+                             idle_timeout=0.05, eviction_interval=0.02)
+    _practise(manager.get("u1"), 2)
+    deadline = time.monotonic() + 5
+    while "u1" in manager and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert "u1" not in manager
+    assert manager.stats()["snapshots"] == 1
+    assert len(manager.get("u1").session_responses) == 2
+    manager.close()
+
+
+def test_concurrent_gets_share_one_session(runtime, tmp_path):
+    manager = SessionManager(db_path=str(tmp_path / "sessions.sqlite"), runtime=runtime,
+                             max_active=1, idle_timeout=None)
+
+    def worker(user_id):
+        for _ in range(50):
+            assert manager.get(user_id).user_id == user_id
+
+    threads = [threading.Thread(target=worker, args=(f"u{i % 2}",)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(manager) == 1 and manager.evictions > 0
+    manager.close()
+    assert len(manager) == 0 and not manager._parking
+    assert manager.stats()["snapshots"] == 2
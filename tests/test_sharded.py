@@ -0,0 +1,70 @@
+import threading
+
+import pytest
+
+from cog_tutor.rag.benchmark import generate_synthetic_curriculum
+from cog_tutor.rag.knowledge_base import KnowledgeBase
+from cog_tutor.rag.retriever import KnowledgeRetriever
+from cog_tutor.rag.sharded import ShardError, ShardedRetriever
+
+
+@pytest.fixture
+def kb(tmp_path):
+    base = KnowledgeBase(str(tmp_path / "kb.sqlite"))
+    items, _ = generate_synthetic_curriculum(60, n_queries=0, words_per_item=6, seed=3)
+    base.add_knowledge_items(items)
+    return base
+
+
+def _scores(results):
+    # Equal scores from different shards may come back in either order
+    return [sorted((-round(item["relevance_score"], 6), item["id"]) for item in ranked) for ranked in results]
+
+
+def test_shards_hold_their_own_partitions_and_match_a_single_index(kb):
+    queries = [item["content"] for item in kb.get_all_items()[::7]]
+    single = KnowledgeRetriever(kb, cache_size=0)
+    with ShardedRetriever(kb, num_shards=3, max_features=1000) as sharded:
+        assert sum(sharded.shard_sizes) == len(single.all_items)
+        assert all(size > 0 for size in sharded.shard_sizes)
+        assert not hasattr(sharded, "tfidf_matrix")
+        assert _scores(sharded.retrieve_many(queries, top_k=5)) == _scores(single.retrieve_many(queries, top_k=5))
+    single.close()
+
+
+def test_added_items_are_indexed_by_a_shard_and_rebalanced(kb):
+    with ShardedRetriever(kb, num_shards=2) as sharded:
+        before = sum(sharded.shard_sizes)
+        existing = kb.get_all_items()[0]
+        sharded.add_items([dict(existing, id="new_item", prerequisite_skills=[])])
+        assert sum(sharded.shard_sizes) == before + 1
+        top = sharded.retrieve_relevant_knowledge(existing["content"], top_k=2)
+        assert {item["id"] for item in top} == {existing["id"], "new_item"}
+
+
+def test_concurrent_batches_each_get_their_own_replies(kb):
+    items = kb.get_all_items()
+    batches = [[item["content"] for item in items[start::5]] for start in range(5)]
+    with ShardedRetriever(kb, num_shards=3) as sharded:
+        expected = [_scores(sharded.retrieve_many(batch, top_k=3)) for batch in batches]
+        results = [None] * len(batches)
+
+        def run(slot):
+            for _ in range(10):
+                results[slot] = _scores(sharded.retrieve_many(batches[slot], top_k=3))
+
+        threads = [threading.Thread(target=run, args=(slot,)) for slot in range(len(batches))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert results == expected
+
+
+def test_worker_errors_are_raised_and_the_shard_keeps_serving(kb):
+    query = kb.get_all_items()[0]["content"]
+    with ShardedRetriever(kb, num_shards=2) as sharded:
+        expected = _scores(sharded.retrieve_many([query], top_k=3))
+        with pytest.raises(ShardError):
+            sharded._shards[0].call("bogus")
+        assert _scores(sharded.retrieve_many([query], top_k=3)) == expected
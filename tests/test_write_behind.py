@@ -0,0 +1,93 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from cog_tutor.knowledge_tracing import WriteBehindQueue
+
+
+def _make_table(path):
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE kv (k TEXT PRIMARY KEY, v INTEGER)")
+
+
+def _value(path, key="k"):
+    with sqlite3.connect(path) as conn:
+        row = conn.execute("SELECT v FROM kv WHERE k = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+@pytest.fixture
+def queue():
+    q = WriteBehindQueue(batch_size=8, flush_interval=0.01)
+    yield q
+    q.close()
+
+
+def test_concurrent_put_and_flush_keep_queue_order(tmp_path, queue):
+    db_path = str(tmp_path / "kv.sqlite")
+    _make_table(db_path)
+    order_lock = threading.Lock()
+    counter = iter(range(1, 10_000))
+    last = []
+
+    def writer():
+        for _ in range(200):
+            with order_lock:
+                value = next(counter)
+                queue.put(db_path, [("INSERT OR REPLACE INTO kv (k, v) VALUES ('k', ?)", (value,))])
+                last.append(value)
+            queue.flush()
+            # Whatever this thread queued is on disk once its flush returns
+            assert _value(db_path) >= value
+
+    threads = [threading.Thread(target=writer) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    queue.flush()
+    assert _value(db_path) == last[-1] == 400
+
+
+def test_failed_batch_is_requeued_then_dropped_and_writer_survives(tmp_path):
+    good = str(tmp_path / "good.sqlite")
+    bad = str(tmp_path / "bad.sqlite")
+    _make_table(good)
+    q = WriteBehindQueue(batch_size=1000, flush_interval=60, max_retries=2)
+    try:
+        q.put(good, [("INSERT INTO kv (k, v) VALUES ('a', 1)", ())])
+        q.put(bad, [("INSERT INTO missing_table VALUES (1)", ())])
+
+        with pytest.raises(sqlite3.OperationalError):
+            q.flush()
+        assert _value(good, "a") == 1
+        assert q.pending == 1  # only the statement that failed is kept
+
+        for _ in range(2):
+            with pytest.raises(sqlite3.OperationalError):
+                q.flush()
+        assert q.pending == 0
+        assert q.statements_dropped == 1
+    finally:
+        q.close()
+
+
+def test_background_writer_keeps_running_after_a_failure(tmp_path):
+    good = str(tmp_path / "good.sqlite")
+    _make_table(good)
+    q = WriteBehindQueue(batch_size=1, flush_interval=0.01, max_retries=0)
+    try:
+        q.put(str(tmp_path / "bad.sqlite"), [("INSERT INTO missing_table VALUES (1)", ())])
+        deadline = time.monotonic() + 5
+        while q.statements_dropped == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert q._thread.is_alive()
+
+        q.put(good, [("INSERT INTO kv (k, v) VALUES ('b', 2)", ())])
+        while _value(good, "b") is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert _value(good, "b") == 2
+    finally:
+        q.close()